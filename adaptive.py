@@ -0,0 +1,128 @@
+import asyncio
+from collections import deque
+from loguru import logger
+
+# 自适应并发（AIMD）：按窗口统计请求的错误 / 超时比例与延迟中位数，
+# 窗口内没有异常且并发已用满时线性增加上限，错误率过高或延迟明显上升时按比例降低上限
+
+WINDOW = 10                 # 每统计这么多次完成的请求调整一次上限
+ADDITIVE_STEP = 2           # 加性增加的步长
+DECREASE_FACTOR = 0.7       # 乘性减少的比例
+ERROR_THRESHOLD = 0.1       # 窗口内错误 / 超时比例超过该值时降低并发
+LATENCY_TOLERANCE = 2.0     # 窗口延迟中位数超过基线的倍数时视为延迟上升
+LATENCY_FLOOR = 0.05        # 低于该值（秒）的延迟变化不视为延迟上升，避免本地 / 极快响应的抖动触发降低
+BASELINE_DRIFT = 1.1        # 基线（最低窗口延迟中位数）每个窗口允许的上浮比例，适应负载自然变化
+
+
+class AdaptiveLimiter:
+    """
+    与 asyncio.Semaphore 用法相近的并发限制，上限在 [minimum, maximum] 内按 AIMD 调整：
+      await acquire()；完成后 release(latency, error) 报告本次耗时与是否出错（超时 / 限流 / 连接失败）
+    """
+
+    def __init__(self, name, initial, minimum=1, maximum=None):
+        self.name = name
+        self.limit = float(initial)
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum or initial * 4
+        self.inflight = 0
+        self.waiters = deque()
+        # 当前窗口
+        self.samples = 0
+        self.errors = 0
+        self.latencies = []
+        self.saturated = False      # 窗口内是否出现过并发用满
+        self.baseline = None
+        # 统计
+        self.completed = 0
+        self.increases = 0
+        self.decreases = 0
+        self.peak = self.limit
+        self.low = self.limit
+
+    def _capacity(self):
+        return max(self.minimum, int(self.limit))
+
+    async def acquire(self):
+        if self.inflight < self._capacity() and not self.waiters:
+            self.inflight += 1
+            return
+        self.saturated = True
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            await future   # 被唤醒时名额已计入 inflight
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            elif future in self.waiters:  # _wake 会跳过并移出已取消的等待者
+                self.waiters.remove(future)
+            raise
+
+    def release(self, latency=None, error=False):
+        self.inflight -= 1
+        if latency is not None or error:
+            self._record(latency, error)
+        self._wake()
+
+    def _wake(self):
+        while self.waiters and self.inflight < self._capacity():
+            future = self.waiters.popleft()
+            if not future.done():
+                self.inflight += 1
+                future.set_result(None)
+
+    def _record(self, latency, error):
+        self.completed += 1
+        self.samples += 1
+        if error:
+            self.errors += 1
+        elif latency is not None:
+            self.latencies.append(latency)
+        if self.inflight + 1 >= self._capacity():
+            self.saturated = True
+        if self.samples >= WINDOW:
+            self._adjust()
+
+    def _adjust(self):
+        # 用中位数而不是平均值：少数慢响应 / 超时的目标不应拖低整体并发
+        self.latencies.sort()
+        median = self.latencies[len(self.latencies) // 2] if self.latencies else None
+        error_rate = self.errors / self.samples
+        slower = False
+        if median is not None:
+            if self.baseline is None:
+                self.baseline = median
+            else:
+                slower = median > max(self.baseline * LATENCY_TOLERANCE, LATENCY_FLOOR)
+                self.baseline = min(median, self.baseline * BASELINE_DRIFT)
+
+        if error_rate > ERROR_THRESHOLD or slower:
+            self.limit = max(self.minimum, self.limit * DECREASE_FACTOR)
+            self.decreases += 1
+        elif self.saturated and self.limit < self.maximum:
+            self.limit = min(self.maximum, self.limit + ADDITIVE_STEP)
+            self.increases += 1
+        self.peak = max(self.peak, self.limit)
+        self.low = min(self.low, self.limit)
+        self.samples = self.errors = 0
+        self.latencies = []
+        self.saturated = False
+        self._wake()
+
+    def summary(self):
+        return (f"{self.name}: 初始 {self.initial} → 收敛 {self._capacity()} "
+                f"(区间 {int(self.low)}~{int(self.peak)}, 增加 {self.increases} 次 / 降低 {self.decreases} 次, "
+                f"完成 {self.completed} 次)")
+
+
+def report_limiters(title, limiters, top=10):
+    """输出各限制器收敛到的并发；只列出实际调整过或使用最多的若干个"""
+    used = [limiter for limiter in limiters if limiter.completed]
+    if not used:
+        return
+    logger.info(f"🎚️ {title}:")
+    used.sort(key=lambda limiter: (limiter.increases + limiter.decreases, limiter.completed), reverse=True)
+    for limiter in used[:top]:
+        logger.info(f"   {limiter.summary()}")
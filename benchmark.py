@@ -0,0 +1,547 @@
+"""
+性能基准脚本（离线运行，不访问网络）
+
+    python benchmark.py classifier [--size-mb 4] [--repeat 5] [--history cache/benchmark_history.jsonl]
+    python benchmark.py prober [--nodes 10000] [--ips 50] [--closed 0.1] [--concurrency 200]
+    python benchmark.py pipeline [--urls 1000 10000 100000] [--slow 0.05] [--timeouts 0.01]
+    python benchmark.py channel [--pages 保存的 t.me/s 页面.html ...] [--count 200] [--repeat 5]
+"""
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import random
+import shutil
+import asyncio
+import resource
+import argparse
+import tempfile
+import functools
+import subprocess
+import multiprocessing
+
+from classifier import SubscriptionClassifier
+from node_parser import Node
+from prober import NodeProber
+from tg_channel import parse_messages, filter_channel_urls
+
+CHUNK_SIZE = 64 * 1024
+
+
+# -------------------------------
+# 基准语料生成（按真实订阅的结构构造，固定随机种子保证可复现）
+# -------------------------------
+def _rand_host(rng):
+    return f"{rng.choice(['hk', 'jp', 'sg', 'us', 'tw'])}{rng.randint(1, 99)}.{rng.choice(['node', 'cdn', 'relay'])}-{rng.randint(100, 999)}.com"
+
+def _rand_uuid(rng):
+    h = '%032x' % rng.getrandbits(128)
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+def make_clash(rng, nodes):
+    """clash 配置：proxies + proxy-groups + rules"""
+    lines = ["port: 7890", "socks-port: 7891", "allow-lan: false", "mode: rule", "log-level: info", "proxies:"]
+    names = []
+    for i in range(nodes):
+        name = f"🇭🇰 香港 {i:04d} | {rng.choice(['IPLC', 'BGP', '专线'])}"
+        names.append(name)
+        kind = rng.choice(['ss', 'vmess', 'trojan'])
+        lines.append(f"  - name: \"{name}\"")
+        lines.append(f"    type: {kind}")
+        lines.append(f"    server: {_rand_host(rng)}")
+        lines.append(f"    port: {rng.randint(1000, 65000)}")
+        if kind == 'ss':
+            lines.append("    cipher: aes-256-gcm")
+            lines.append(f"    password: {_rand_uuid(rng)}")
+        elif kind == 'vmess':
+            lines.append(f"    uuid: {_rand_uuid(rng)}")
+            lines.append("    alterId: 0")
+            lines.append("    cipher: auto")
+            lines.append("    network: ws")
+            lines.append("    ws-opts: {path: /ray, headers: {Host: cdn.example.com}}")
+        else:
+            lines.append(f"    password: {_rand_uuid(rng)}")
+            lines.append("    sni: cdn.example.com")
+        lines.append("    udp: true")
+    lines.append("proxy-groups:")
+    lines.append("  - name: 节点选择")
+    lines.append("    type: select")
+    lines.append("    proxies:")
+    lines.extend(f"      - \"{name}\"" for name in names)
+    lines.append("rules:")
+    lines.extend(f"  - DOMAIN-SUFFIX,site{i}.example,节点选择" for i in range(nodes * 2))
+    lines.append("  - MATCH,DIRECT")
+    return ("\n".join(lines) + "\n").encode()
+
+def make_links(rng, nodes):
+    """原始格式节点链接（每行一个）"""
+    links = []
+    for i in range(nodes):
+        kind = rng.choice(['ss', 'ssr', 'vmess', 'trojan', 'vless'])
+        host, port = _rand_host(rng), rng.randint(1000, 65000)
+        if kind == 'vmess':
+            body = json.dumps({"v": "2", "ps": f"node-{i}", "add": host, "port": port, "id": _rand_uuid(rng),
+                               "aid": 0, "net": "ws", "path": "/ray", "tls": "tls"})
+            links.append("vmess://" + base64.b64encode(body.encode()).decode())
+        elif kind == 'ss':
+            cred = base64.urlsafe_b64encode(f"aes-256-gcm:{_rand_uuid(rng)}".encode()).decode().rstrip('=')
+            links.append(f"ss://{cred}@{host}:{port}#node-{i}")
+        elif kind == 'ssr':
+            body = f"{host}:{port}:origin:aes-256-cfb:plain:{base64.urlsafe_b64encode(b'pass').decode()}"
+            links.append("ssr://" + base64.urlsafe_b64encode(body.encode()).decode().rstrip('='))
+        else:
+            links.append(f"{kind}://{_rand_uuid(rng)}@{host}:{port}?security=tls&type=ws&sni={host}#node-{i}")
+    return ("\n".join(links) + "\n").encode()
+
+def make_base64(rng, nodes):
+    """base64 订阅：整体编码并按 76 字符折行"""
+    encoded = base64.b64encode(make_links(rng, nodes)).decode()
+    return "\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76)).encode()
+
+def make_html(rng, size):
+    """无法识别的网页（落地页、跳转页等）"""
+    parts = ["<!DOCTYPE html><html><head><title>Welcome</title></head><body>"]
+    total = 0
+    while total < size:
+        p = f"<div class=\"item\"><a href=\"https://{_rand_host(rng)}/page/{rng.randint(1, 9999)}\">link</a> lorem ipsum dolor sit amet</div>\n"
+        parts.append(p)
+        total += len(p)
+    parts.append("</body></html>")
+    return "".join(parts).encode()
+
+def make_channel_page(rng, channel, first_id, messages=20):
+    """
+    t.me/s 频道页面：页头样式表 / 脚本、频道简介，每条消息带头像、emoji、话题标签、链接预览与图片，
+    部分消息正文含订阅链接（<a> 链接或纯文本，查询参数中的 & 转义为 &amp;）。返回 (页面, 正文中的订阅链接)
+    """
+    subs = []
+    parts = [
+        '<!DOCTYPE html><html><head><meta charset="utf-8">',
+        f'<meta property="og:image" content="https://cdn4.cdn-telegram.org/file/{rng.getrandbits(64):x}.jpg">',
+        '<link href="//telegram.org/css/font-roboto.css?1" rel="stylesheet" type="text/css">',
+        '<link href="https://telegram.org/css/widget-frame.css?66" rel="stylesheet" media="screen">',
+        '<script src="https://telegram.org/js/widget-frame.js?65"></script>',
+        f'<link rel="canonical" href="https://t.me/s/{channel}"></head><body>',
+        f'<div class="tgme_channel_info_description">每日更新 https://{channel}.blog.example/about</div>',
+    ]
+    for message_id in range(first_id, first_id + messages):
+        text = [f'<i class="emoji" style="background-image:url(\'//telegram.org/img/emoji/40/F09F9A80.png\')"><b>🚀</b></i>'
+                f' 今日节点 <a href="?q=%23free">#free</a><br/>']
+        for _ in range(rng.choice((0, 0, 1, 2, 3))):
+            url = f"https://{_rand_host(rng)}/api/v1/client/subscribe?token={rng.getrandbits(64):x}"
+            if rng.random() < 0.3:
+                url += "&flag=clash"
+            subs.append(url)
+            escaped = url.replace("&", "&amp;")
+            if rng.random() < 0.5:
+                text.append(f'<a href="{escaped}" target="_blank" rel="noopener">{escaped}</a><br/>')
+            else:
+                text.append(f'订阅：{escaped}<br/>')
+        preview = f"https://{channel}.news.example/{message_id}"
+        parts.append(
+            f'<div class="tgme_widget_message_wrap js-widget_message_wrap">'
+            f'<div class="tgme_widget_message text_not_supported_wrap js-widget_message" data-post="{channel}/{message_id}">'
+            f'<div class="tgme_widget_message_user"><a href="https://t.me/{channel}"><i class="tgme_widget_message_user_photo">'
+            f'<img src="https://cdn4.cdn-telegram.org/file/{rng.getrandbits(64):x}.jpg"></i></a></div>'
+            f'<div class="tgme_widget_message_bubble">'
+            f'<a class="tgme_widget_message_photo_wrap" href="https://t.me/{channel}/{message_id}" '
+            f'style="width:800px;background-image:url(\'https://cdn4.cdn-telegram.org/file/{rng.getrandbits(64):x}.jpg\')"></a>'
+            f'<div class="tgme_widget_message_text js-message_text" dir="auto">{"".join(text)}</div>'
+            f'<a class="tgme_widget_message_link_preview" href="{preview}">'
+            f'<i class="link_preview_image" style="background-image:url(\'https://telesco.pe/file/{rng.getrandbits(64):x}.jpg\')"></i>'
+            f'<div class="link_preview_site_name" dir="auto">News</div>'
+            f'<div class="link_preview_description" dir="auto">详情见 {preview}/more</div></a>'
+            f'<div class="tgme_widget_message_footer compact js-message_footer">'
+            f'<span class="tgme_widget_message_views">{rng.randint(100, 99999)}</span>'
+            f'<a class="tgme_widget_message_date" href="https://t.me/{channel}/{message_id}">'
+            f'<time datetime="2026-10-{1 + message_id % 28:02d}T{message_id % 24:02d}:00:00+00:00" class="time">00:00</time>'
+            f'</a></div></div></div></div>')
+    parts.append('</body></html>')
+    return "".join(parts), subs
+
+def build_corpus(size_mb, seed=2024):
+    """生成各类型语料，每类约 size_mb MB"""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    corpus = {}
+    for name, maker, per_node in (("clash", make_clash, 400), ("base64", make_base64, 260), ("raw", make_links, 190)):
+        corpus[name] = maker(rng, max(1, target // per_node))
+    corpus["html"] = make_html(rng, target)
+    return corpus
+
+
+# -------------------------------
+# 基准测试
+# -------------------------------
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except Exception:
+        return ''
+
+def _timeit(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def _classify_stream(data, early_exit):
+    classifier = SubscriptionClassifier()
+    for i in range(0, len(data), CHUNK_SIZE):
+        if classifier.feed(data[i:i + CHUNK_SIZE]) and early_exit:
+            return classifier.finish(complete=False)
+    return classifier.finish()
+
+def bench_classifier(args):
+    corpus = build_corpus(args.size_mb)
+    results = []
+    print(f"{'语料':<8}{'大小(MB)':>10}{'结果':>12}{'节点数':>10}{'全量(MB/s)':>14}{'提前结束(MB/s)':>18}")
+    for name, data in corpus.items():
+        mb = len(data) / 1024 / 1024
+        result = _classify_stream(data, early_exit=False)
+        full = _timeit(lambda: _classify_stream(data, early_exit=False), args.repeat)
+        early = _timeit(lambda: _classify_stream(data, early_exit=True), args.repeat)
+        row = {"corpus": name, "bytes": len(data), "format": result["format"], "nodes": result["nodes"],
+               "full_mb_s": round(mb / full, 2), "early_exit_mb_s": round(mb / early, 2)}
+        results.append(row)
+        print(f"{name:<8}{mb:>10.2f}{row['format']:>12}{row['nodes']:>10}{row['full_mb_s']:>14}{row['early_exit_mb_s']:>18}")
+    return results
+
+async def _close_connection(reader, writer):
+    writer.close()
+
+def _unused_port(ip):
+    with socket.socket() as sock:
+        sock.bind((ip, 0))
+        return sock.getsockname()[1]
+
+async def _bench_prober(args):
+    # 每个回环地址 (127.0.0.2 起) 上启动一个监听端口，模拟分布在多台服务器上的节点；
+    # 一部分节点指向未监听的端口，模拟不可达节点
+    rng = random.Random(2024)
+    ips = [f"127.0.0.{i + 2}" for i in range(args.ips)]
+    servers, ports = [], {}
+    for ip in ips:
+        server = await asyncio.start_server(_close_connection, ip, 0, backlog=1024)
+        servers.append(server)
+        ports[ip] = server.sockets[0].getsockname()[1]
+    closed_port = _unused_port(ips[0])
+    nodes = {}
+    for i in range(args.nodes):
+        ip = ips[i % len(ips)]
+        port = closed_port if rng.random() < args.closed else ports[ip]
+        nodes[i] = Node('trojan', ip, port, 'password', f'node-{i}', '')
+    prober = NodeProber(concurrency=args.concurrency, per_ip=args.per_ip, timeout=args.timeout)
+    latencies = await prober.probe_all(nodes)
+    for server in servers:
+        server.close()
+        await server.wait_closed()
+    reachable = [latency for latency in latencies.values() if latency is not None]
+    reachable.sort()
+    return {"nodes": args.nodes, "ips": args.ips, "concurrency": args.concurrency, "per_ip": args.per_ip,
+            "reachable": len(reachable), "seconds": round(prober.elapsed, 3),
+            "probes_per_s": round(args.nodes / prober.elapsed, 1),
+            "p50_ms": round(reachable[len(reachable) // 2] * 1000, 2) if reachable else None,
+            "p99_ms": round(reachable[int(len(reachable) * 0.99)] * 1000, 2) if reachable else None}
+
+def bench_prober(args):
+    result = asyncio.run(_bench_prober(args))
+    print(f"{'节点数':<8}{'地址数':>8}{'可达':>8}{'耗时(s)':>10}{'探测/秒':>10}{'p50(ms)':>10}{'p99(ms)':>10}")
+    print(f"{result['nodes']:<8}{result['ips']:>8}{result['reachable']:>8}{result['seconds']:>10}"
+          f"{result['probes_per_s']:>10}{result['p50_ms']:>10}{result['p99_ms']:>10}")
+    return [result]
+
+# -------------------------------
+# 端到端基准：本地模拟的频道页面、订阅与订阅转换服务，运行真实的 main() 流程
+# -------------------------------
+SUB_CLIENT_TIMEOUT = 12  # main.sub_check 的请求超时（秒），超时订阅的响应延迟超过该值
+PIPELINE_MIX = {         # 各类订阅端点的比例（慢响应与超时按参数另行抽取）
+    'airport': 0.2,      # base64 节点 + subscription-userinfo 流量信息
+    'clash': 0.15,
+    'base64': 0.15,
+    'raw': 0.1,
+    'html': 0.15,        # 无法识别的网页
+    'forbidden': 0.08,   # 403
+    'missing': 0.05,     # 404
+    'broken': 0.07,      # 格式正确但节点无效（端口为 0）
+}
+FIXTURE_VARIANTS = 8     # 每类内容预先生成的变体数
+
+def pipeline_url(i, port, per_host):
+    """第 i 个订阅的地址：每 per_host 个订阅共用一个回环地址（127.x.y.z），模拟同一机场的多个链接"""
+    h = i // per_host
+    return f"http://127.{(h // 254 // 256) % 256}.{(h // 254) % 256}.{h % 254 + 1}:{port}/sub/{i}"
+
+def pipeline_kinds(count, slow, timeouts, seed=2024):
+    rng = random.Random(seed)
+    names, weights = list(PIPELINE_MIX), list(PIPELINE_MIX.values())
+    kinds = []
+    for _ in range(count):
+        r = rng.random()
+        if r < timeouts:
+            kinds.append('timeout')
+        elif r < timeouts + slow:
+            kinds.append('slow')
+        else:
+            kinds.append(rng.choices(names, weights)[0])
+    return kinds
+
+def _mock_fixtures(seed=2024):
+    rng = random.Random(seed)
+    fixtures = {'html': [make_html(rng, 4096) for _ in range(FIXTURE_VARIANTS)]}
+    for name, maker in (('clash', make_clash), ('base64', make_base64), ('raw', make_links)):
+        fixtures[name] = [maker(rng, rng.randint(20, 60)) for _ in range(FIXTURE_VARIANTS)]
+    fixtures['airport'] = fixtures['slow'] = fixtures['base64']
+    fixtures['broken'] = [("\n".join(f"trojan://{_rand_uuid(rng)}@{_rand_host(rng)}:0#bad-{j}"
+                                     for j in range(rng.randint(5, 20))) + "\n").encode()
+                          for _ in range(FIXTURE_VARIANTS)]
+    return fixtures
+
+def _channel_page(channel, urls):
+    messages = []
+    for message_id, url in enumerate(urls, 1):
+        messages.append(
+            f'<div class="tgme_widget_message_wrap js-widget_message_wrap">'
+            f'<div class="tgme_widget_message js-widget_message" data-post="bench{channel}/{message_id}">'
+            f'<div class="tgme_widget_message_text js-message_text" dir="auto">新订阅 '
+            f'<a href="{url}" target="_blank">{url}</a></div>'
+            f'<a class="tgme_widget_message_date" href="https://t.me/bench{channel}/{message_id}">'
+            f'<time datetime="2026-01-01T00:00:00+00:00" class="time">00:00</time></a></div></div>')
+    return ('<html><head><link href="https://telegram.org/css/widget-frame.css"></head><body>'
+            + "".join(messages) + '</body></html>')
+
+async def _mock_server(args, count, ready):
+    from aiohttp import web
+
+    kinds = pipeline_kinds(count, args.slow, args.timeouts)
+    fixtures = _mock_fixtures()
+    valid = {'airport', 'clash', 'base64', 'raw', 'slow'}
+    existing = int(count * args.existing)
+    port = None
+
+    async def subscription(request):
+        i = int(request.match_info['i'])
+        kind = kinds[i]
+        if kind == 'forbidden':
+            return web.Response(status=403)
+        if kind == 'missing':
+            return web.Response(status=404)
+        if kind == 'timeout':
+            await asyncio.sleep(SUB_CLIENT_TIMEOUT + 3)
+        elif kind == 'slow':
+            await asyncio.sleep(0.5 + (i % 5) * 0.5)
+        headers = {}
+        if kind == 'airport':
+            headers['subscription-userinfo'] = (f"upload={i * 1024}; download={i * 4096}; "
+                                                f"total={(i % 200 + 1) * 1073741824}; expire=1893456000")
+        return web.Response(body=fixtures.get(kind, fixtures['html'])[i % FIXTURE_VARIANTS], headers=headers)
+
+    async def channel(request):
+        c = int(request.match_info['c'])
+        start = existing + c * args.per_channel
+        urls = [pipeline_url(i, port, args.per_host) for i in range(start, min(count, start + args.per_channel))]
+        return web.Response(text=_channel_page(c, urls), content_type='text/html')
+
+    async def converter(request):
+        # 订阅转换替身：来源全部有效时返回每个来源 2 个节点，否则整体报错
+        target = request.query['target']
+        ids = [int(url.rsplit('/', 1)[1]) for url in request.query['url'].split('|')]
+        if any(kinds[i] not in valid for i in ids):
+            return web.Response(status=400 if len(ids) > 1 else 500)
+        nodes = len(ids) * 2
+        if target == 'loon':
+            return web.Response(text="[Proxy]\n" + "".join(f"n{j} = trojan, 1.1.1.1, 443\n" for j in range(nodes)))
+        if target == 'clash':
+            return web.Response(text="proxies:\n" + "".join(
+                f"  - {{name: n{j}, type: trojan, server: s{j}.example.com, port: 443, password: p}}\n"
+                for j in range(nodes)))
+        return web.Response(body=base64.b64encode(make_links(random.Random(len(ids)), nodes)))
+
+    app = web.Application()
+    app.router.add_get('/sub/{i}', subscription)
+    app.router.add_get('/s/bench{c}', channel)
+    app.router.add_get('/sub', converter)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '0.0.0.0', 0, backlog=4096)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    ready.put(port)
+    await asyncio.Event().wait()
+
+def _serve_mock(args, count, ready):
+    asyncio.run(_mock_server(args, count, ready))
+
+def _run_pipeline(args, count, port, results):
+    """在临时目录中运行 main()：现有订阅写入 config.yaml，其余订阅由模拟频道页面提供"""
+    workdir = tempfile.mkdtemp(prefix='collectsub-bench-')
+    os.chdir(workdir)
+    existing = int(count * args.existing)
+    categories = ["机场订阅", "clash订阅", "v2订阅"]
+    config = {category: [] for category in categories + ["开心玩耍"]}
+    for i in range(existing):
+        config[categories[i % 3]].append(pipeline_url(i, port, args.per_host))
+    channels = -(-(count - existing) // args.per_channel)
+    config["tgchannel"] = [f"https://t.me/bench{c}" for c in range(channels)]
+    import yaml
+    with open('config.yaml', 'w', encoding='utf-8') as f:
+        yaml.dump(config, f, allow_unicode=True)
+
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level=os.environ.get('BENCH_LOGLEVEL', 'WARNING'))
+    import main
+    from converter import ConverterRouter
+    main.TG_PREVIEW_URL = f"http://127.0.0.1:{port}/s/{{}}"
+    main.CHECK_URL_LIST = [f"127.0.0.1:{port}"]
+    main.CHECK_NODE_URL_STR = "http://{}/sub?target={}&url={}"
+    main.CONVERTER_ROUTER = ConverterRouter(main.CHECK_URL_LIST)
+    main.NODE_PROBE_ENABLED = False   # 模拟节点的服务器地址不可解析，连通性探测见 prober 基准
+    main.tqdm = functools.partial(main.tqdm, disable=True)
+
+    # 逐个订阅记录 sub_check 耗时（含等待主机并发与速率限制的时间）
+    latencies = []
+    sub_check = main.sub_check
+
+    async def timed_sub_check(url, session):
+        start = time.perf_counter()
+        try:
+            return await sub_check(url, session)
+        finally:
+            latencies.append(time.perf_counter() - start)
+    main.sub_check = timed_sub_check
+
+    start = time.perf_counter()
+    asyncio.run(main.main(args.deadline))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    stages = main.RUN_METRICS.values.get('stage_seconds', {})
+    results.put({
+        "urls": count, "checked": len(latencies), "seconds": round(seconds, 2),
+        "urls_per_s": round(count / seconds, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 1) if latencies else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stages": {stage: round(value, 2) for stage, value in stages.items()},
+        "deferred": dict(main.RUN_METRICS.values.get('deferred_total', {})),
+    })
+    shutil.rmtree(workdir, ignore_errors=True)
+
+def _extract_regex(pages):
+    return [set(filter_channel_urls(page)) for page in pages]
+
+def _extract_messages(pages):
+    return [{url for _, _, links in parse_messages(page) for url in links} for page in pages]
+
+def bench_channel(args):
+    """整页正则提取与按消息正文提取的对比：吞吐量与提取到的链接数（合成页面另统计多余与遗漏的链接）"""
+    if args.pages:
+        pages, truth = [], None
+        for path in args.pages:
+            with open(path, 'r', encoding='utf-8') as f:
+                pages.append(f.read())
+    else:
+        rng = random.Random(2024)
+        pages, truth = [], []
+        for i in range(args.count):
+            page, subs = make_channel_page(rng, f"chan{i % 20}", 1000 + i * 20)
+            pages.append(page)
+            truth.append(set(subs))
+    mb = sum(len(page.encode('utf-8')) for page in pages) / 1024 / 1024
+    results = []
+    print(f"{'方式':<10}{'页面数':>8}{'大小(MB)':>10}{'MB/s':>10}{'页面/秒':>10}{'链接数':>10}{'多余':>8}{'遗漏':>8}")
+    for name, extract in (("regex", _extract_regex), ("messages", _extract_messages)):
+        found = extract(pages)
+        seconds = _timeit(lambda: extract(pages), args.repeat)
+        row = {"method": name, "pages": len(pages), "mb": round(mb, 2), "mb_s": round(mb / seconds, 2),
+               "pages_per_s": round(len(pages) / seconds, 1), "links": sum(len(urls) for urls in found)}
+        if truth is not None:
+            row["extra"] = sum(len(urls - expected) for urls, expected in zip(found, truth))
+            row["missed"] = sum(len(expected - urls) for urls, expected in zip(found, truth))
+        results.append(row)
+        print(f"{name:<10}{row['pages']:>8}{row['mb']:>10}{row['mb_s']:>10}{row['pages_per_s']:>10}{row['links']:>10}"
+              f"{row.get('extra', '-'):>8}{row.get('missed', '-'):>8}")
+    return results
+
+def bench_pipeline(args):
+    # 模拟服务与被测流程各自运行在独立进程中：互不抢占事件循环，峰值内存只统计被测流程
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    print(f"{'URL 数':<10}{'检查数':>8}{'耗时(s)':>10}{'URL/秒':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'峰值内存(MB)':>14}")
+    for count in args.urls:
+        ready, queue = ctx.Queue(), ctx.Queue()
+        server = ctx.Process(target=_serve_mock, args=(args, count, ready), daemon=True)
+        server.start()
+        try:
+            port = ready.get(timeout=60)
+            worker = ctx.Process(target=_run_pipeline, args=(args, count, port, queue))
+            worker.start()
+            row = queue.get()
+            worker.join()
+        finally:
+            server.terminate()
+            server.join()
+        results.append(row)
+        print(f"{row['urls']:<10}{row['checked']:>8}{row['seconds']:>10}{row['urls_per_s']:>10}"
+              f"{row['p50_ms']:>10}{row['p99_ms']:>10}{row['peak_rss_mb']:>14}")
+        if row['deferred']:
+            print(f"          推迟: {row['deferred']}")
+    return results
+
+def save_history(path, bench, results):
+    """追加一条记录到历史文件（JSON Lines），便于跟踪吞吐量变化"""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    record = {"time": time.strftime('%Y-%m-%d %H:%M:%S'), "revision": _git_revision(),
+              "python": sys.version.split()[0], "bench": bench, "results": results}
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"结果已追加到 {path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="collectSub 性能基准")
+    parser.add_argument('--history', help="将结果追加到指定的 JSON Lines 文件")
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p = sub.add_parser('classifier', help="订阅内容识别引擎吞吐量")
+    p.add_argument('--size-mb', type=float, default=4, help="每类语料大小 (MB)")
+    p.add_argument('--repeat', type=int, default=5, help="重复次数（取最快一次）")
+    p.set_defaults(func=bench_classifier)
+
+    p = sub.add_parser('prober', help="节点连通性探测吞吐量（本地监听端口）")
+    p.add_argument('--nodes', type=int, default=10000, help="节点数")
+    p.add_argument('--ips', type=int, default=50, help="目标回环地址数 (127.0.0.2 起)")
+    p.add_argument('--closed', type=float, default=0.1, help="指向未监听端口的节点比例")
+    p.add_argument('--concurrency', type=int, default=200, help="全局并发")
+    p.add_argument('--per-ip', type=int, default=4, help="单个目标 IP 的并发")
+    p.add_argument('--timeout', type=float, default=5.0, help="单次连接超时 (秒)")
+    p.set_defaults(func=bench_prober)
+
+    p = sub.add_parser('pipeline', help="端到端流程吞吐量（本地模拟频道、订阅与订阅转换服务）")
+    p.add_argument('--urls', type=int, nargs='+', default=[1000, 10000, 100000], help="订阅数量（可指定多个规模）")
+    p.add_argument('--existing', type=float, default=0.3, help="写入 config.yaml 作为现有订阅的比例")
+    p.add_argument('--per-host', type=int, default=2, help="每个主机（回环地址）上的订阅数")
+    p.add_argument('--per-channel', type=int, default=100, help="每个模拟频道页面中的链接数")
+    p.add_argument('--slow', type=float, default=0.05, help="慢响应订阅的比例 (0.5~2.5s)")
+    p.add_argument('--timeouts', type=float, default=0.01, help="超时订阅的比例")
+    p.add_argument('--deadline', type=float, default=None, help="以截止时间模式运行（秒），结果中附带推迟的工作数")
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser('channel', help="频道页面链接提取：整页正则与按消息正文提取的对比")
+    p.add_argument('--pages', nargs='+', help="保存的 t.me/s 页面文件（默认使用合成页面）")
+    p.add_argument('--count', type=int, default=200, help="合成页面数（每页 20 条消息）")
+    p.add_argument('--repeat', type=int, default=5, help="重复次数（取最快一次）")
+    p.set_defaults(func=bench_channel)
+
+    args = parser.parse_args()
+    results = args.func(args)
+    if args.history:
+        save_history(args.history, args.bench, results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+from loguru import logger
+
+# 内容寻址的订阅正文记录：按完整响应体的哈希归组，内容完全相同的不同链接（gist / raw.githubusercontent
+# 镜像、netlify 副本等）共用一次节点检测结果，输出列表中每组只保留一个代表链接。
+# 只记录完整读取且识别有效的内容，流式识别提前结束时的部分内容哈希不参与归组
+
+
+class BodyStore:
+    """本次运行的 内容哈希 -> 链接 映射"""
+
+    def __init__(self):
+        self.groups = {}   # 内容哈希 -> [链接]（按记录先后）
+        self.hashes = {}   # 链接 -> 内容哈希
+
+    def add(self, url, content_hash):
+        if not content_hash or url in self.hashes:
+            return
+        self.hashes[url] = content_hash
+        self.groups.setdefault(content_hash, []).append(url)
+
+    def key(self, url):
+        """按内容共享检测结果时使用的键：已记录内容的链接为 "sha1:<哈希>"，否则为链接本身"""
+        content_hash = self.hashes.get(url)
+        return f"sha1:{content_hash}" if content_hash else url
+
+    def mirrors(self, preferred=(), among=None):
+        """
+        {代表链接: [其余镜像链接]}，只包含有镜像的组；代表优先取 preferred 中的链接，其次 URL 最小者。
+        提供 among 时只在其中的链接间归组（例如域名去重后仍保留的链接）
+        """
+        preferred = set(preferred)
+        result = {}
+        for urls in self.groups.values():
+            if among is not None:
+                urls = [url for url in urls if url in among]
+            if len(urls) > 1:
+                ordered = sorted(urls, key=lambda url: (url not in preferred, url))
+                result[ordered[0]] = ordered[1:]
+        return result
+
+    def redundant(self, preferred=(), among=None):
+        """各镜像组中的非代表链接"""
+        return {url for group in self.mirrors(preferred, among).values() for url in group}
+
+    def report(self, preferred=(), among=None):
+        mirrors = self.mirrors(preferred, among)
+        if not mirrors:
+            return
+        logger.info(f"🪞 镜像订阅: {len(mirrors)} 组内容相同的链接, "
+                    f"输出中省略 {sum(len(group) for group in mirrors.values())} 个镜像")
+        for representative, group in sorted(mirrors.items()):
+            logger.debug(f"   {representative} ← {', '.join(group)}")
@@ -0,0 +1,136 @@
+import time
+from urllib.parse import urlsplit
+from loguru import logger
+from run_memo import normalize_url
+
+# 订阅 URL 规范化：同一订阅的不同写法（末尾多余的标点、查询参数顺序、http / https、主机名大小写、
+# 默认端口、#片段）在一次运行中只检查一次；短链接先解析为跳转目标，跳转结果缓存在状态库中
+TRAILING_PUNCTUATION = ".,;:!?&|#'\"()[]{}<>，。；：！？、）】」』"
+SHORTENER_HOSTS = {
+    'v1.mk', 'dwz.mk', 'suo.yt', 'bit.ly', 'tinyurl.com', 'is.gd', 't.cn', 'url.cn', 'dwz.cn',
+    'reurl.cc', 'rb.gy', 'cutt.ly', 's.id', 'shorturl.at', 't.ly', 'ow.ly',
+}
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+REDIRECT_MAX_HOPS = 5             # 连续跳转（短链接指向短链接）的最多次数
+REDIRECT_TTL = 7 * 24 * 3600      # 跳转结果的缓存有效期（秒）
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS redirects (
+    url TEXT PRIMARY KEY,      -- 短链接
+    target TEXT NOT NULL,      -- 最终跳转目标（不跳转时为短链接本身）
+    resolved_at REAL NOT NULL
+);
+"""
+
+
+def clean_url(url):
+    """去除首尾空白与末尾多余的标点（频道文本中紧跟在链接后的标点、空的 ? / & / #）"""
+    return url.strip().rstrip(TRAILING_PUNCTUATION + '?')
+
+
+def canonical_key(url):
+    """同一订阅各种写法共用的键：不区分 http / https，查询参数按原文排序，其余同 normalize_url"""
+    url = normalize_url(clean_url(url))
+    scheme, _, rest = url.partition('://')
+    if not rest:
+        return url
+    path, _, query = rest.partition('?')
+    params = sorted(param for param in query.split('&') if param)
+    return path + ('?' + '&'.join(params) if params else '')
+
+
+def is_shortener(url):
+    try:
+        host = (urlsplit(url).hostname or '').lower()
+    except ValueError:
+        return False
+    return host in SHORTENER_HOSTS
+
+
+class RedirectCache:
+    """
+    短链接跳转结果：启动时整表读入内存，本次运行新解析的结果暂存到 flush() 时在一个事务中写入；
+    与订阅状态库共用同一个 SQLite 文件
+    """
+
+    def __init__(self, ttl=REDIRECT_TTL):
+        self.ttl = ttl
+        self.db = None
+        self.entries = {}      # 短链接 -> (跳转目标, 解析时间)
+        self.dirty = set()
+        self.hits = 0
+        self.resolved = 0
+        self.failed = 0
+
+    def load(self, db):
+        self.db = db
+        self.db.executescript(SCHEMA)
+        self.entries = {url: (target, resolved_at) for url, target, resolved_at
+                        in self.db.execute("SELECT url, target, resolved_at FROM redirects")}
+
+    def get(self, url):
+        """有效期内的跳转目标，没有记录或已过期时返回 None"""
+        entry = self.entries.get(url)
+        if entry is None or entry[1] + self.ttl < time.time():
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def put(self, url, target):
+        self.entries[url] = (target, time.time())
+        self.dirty.add(url)
+        self.resolved += 1
+
+    def flush(self):
+        if not self.dirty or self.db is None:
+            return
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO redirects (url, target, resolved_at) VALUES (?, ?, ?)",
+                                [(url, *self.entries[url]) for url in self.dirty])
+        self.dirty.clear()
+
+    def report(self):
+        if not self.hits and not self.resolved and not self.failed:
+            return
+        logger.info(f"🔗 短链接: 缓存命中 {self.hits} 个, 新解析 {self.resolved} 个, 解析失败 {self.failed} 个")
+
+
+class UrlCanonicalizer:
+    """
+    本次运行的链接归并：规范化键相同的链接映射到首次登记的写法（代表链接）。
+    代表链接登记后即提交检查、不再更换；同一批登记的链接中 https 写法优先成为代表链接
+    """
+
+    def __init__(self):
+        self.representatives = {}  # 规范化键 -> 代表链接
+        self.aliases = {}          # 原始写法 -> 代表链接（仅两者不同时记录）
+        self.collapsed = 0         # 归并到已有代表链接的写法数
+
+    def claim(self, url, target=None):
+        """登记链接（短链接同时提供跳转目标），返回其代表链接"""
+        target = clean_url(target or url)
+        key = canonical_key(target)
+        representative = self.representatives.get(key)
+        if representative is None:
+            representative = self.representatives[key] = target
+        elif url != representative and url not in self.aliases:
+            self.collapsed += 1
+        if representative != url:
+            self.aliases[url] = representative
+        return representative
+
+    def claim_all(self, urls, targets=None):
+        """登记一批链接（targets 为短链接 -> 跳转目标），返回去重后的代表链接（保持原顺序）"""
+        targets = targets or {}
+        target = lambda url: targets.get(clean_url(url))
+        ordered = sorted(urls, key=lambda url: not clean_url(target(url) or url).lower().startswith('https://'))
+        claimed = {url: self.claim(url, target(url)) for url in ordered}
+        return list(dict.fromkeys(claimed[url] for url in urls))
+
+    def alias(self, url):
+        return self.aliases.get(url, url)
+
+    def report(self):
+        if self.aliases:
+            logger.info(f"🔀 链接规范化: {len(self.aliases)} 个写法改用代表链接, "
+                        f"其中 {self.collapsed} 个与已有链接重复")
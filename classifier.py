@@ -0,0 +1,176 @@
+import re
+import binascii
+from collections import Counter
+
+# 订阅内容识别引擎：每个数据块只做一次预编译正则扫描（纯字面量分支可走正则引擎的前缀优化，
+# findall + Counter 均在 C 层完成），同时得到类型、节点数与协议分布，不保留全文，可按块流式喂入
+
+PROTOCOLS = ('ss', 'ssr', 'vmess', 'trojan', 'vless')
+CONFIG_KEYWORDS = (b'server', b'port', b'password', b'method', b'host', b'path')
+PREVIEW_BYTES = 100  # 保留的内容开头，用于无法识别时的日志预览
+
+_PROTOCOL_ALT = b'|'.join(re.escape(p.encode() + b'://') for p in sorted(PROTOCOLS, key=len, reverse=True))
+# 原始内容：clash 特征 / 节点链接
+RAW_PATTERN = re.compile(rb'(proxies:|- name:|name:|server:|' + _PROTOCOL_ALT + rb')')
+# base64 解码并转小写后的内容：节点链接 / 配置关键字 / 换行
+DECODED_PATTERN = re.compile(rb'(' + _PROTOCOL_ALT + b'|' + b'|'.join(CONFIG_KEYWORDS) + rb'|\n)')
+# 跨块扫描需要保留的尾部长度（最长 token + 1 个字节的上下文）
+SCAN_KEEP = 10
+
+WHITESPACE_BYTES = b' \t\r\n\x0b\x0c'
+# 标准与 URL 安全两种 base64 字母表；URL 安全字符在解码前转换为标准字符
+B64_ALPHABET = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=-_'
+B64_URLSAFE = bytes.maketrans(b'-_', b'+/')
+
+# 结果中的格式代码
+CLASH = 'clash'
+V2_BASE64 = 'v2_base64'
+V2_CONFIG = 'v2_config'
+V2_RAW = 'v2_raw'
+UNKNOWN = 'unknown'
+
+
+class _Scanner:
+    """对连续数据流执行单次正则扫描并累计 token 次数，保留块尾部以免漏掉被切断的 token"""
+
+    def __init__(self, pattern, keep):
+        self.pattern = pattern
+        self.keep = keep
+        self.counts = Counter()
+        self.carry = b''
+        self.size = 0
+
+    def feed(self, data):
+        buf = self.carry + data
+        # carry 不在数据开头时，其第 0 个字节只作上下文；完全落在 carry 中的匹配已在上一块计数
+        start = 1 if self.size > len(self.carry) else 0
+        self.counts.update(self.pattern.findall(buf, start))
+        if self.carry:
+            self.counts.subtract(self.pattern.findall(self.carry, start))
+        self.size += len(data)
+        self.carry = buf[-self.keep:]
+
+
+def _protocol_counts(counts):
+    mix = {}
+    for proto in PROTOCOLS:
+        n = counts[proto.encode() + b'://']
+        if n > 0:
+            mix[proto] = n
+    return mix
+
+
+class SubscriptionClassifier:
+    """
+    流式订阅内容分类器：按块调用 feed()，返回 True 表示类型已可确定、可以停止读取；
+    最后调用 finish() 取得结果。判断顺序：clash → base64 v2 → 原始 v2。
+    只有全文（忽略空白）都是 base64 字符时才按 base64 解码，避免把网页解码出的乱码误判为配置。
+    finish() 返回 None 表示内容为空或过短，否则返回字典：
+      {"format": ..., "nodes": 节点数, "protocols": {协议: 数量}, "lines": 配置行数, "complete": 是否读完}
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.nonblank = 0
+        self.head = b''
+        self.has_server_hint = False  # 是否出现 http / server 字样（无法识别时的日志提示）
+        self.raw = _Scanner(RAW_PATTERN, SCAN_KEEP)
+        # base64 解码状态：未凑满 4 字节的字符、内容是否仍可按 base64 解码
+        self.b64_pending = b''
+        self.b64_ok = True
+        self.decoded = _Scanner(DECODED_PATTERN, SCAN_KEEP)
+
+    def feed(self, chunk):
+        """喂入一个数据块，返回类型是否已可确定"""
+        self.size += len(chunk)
+        if len(self.head) < PREVIEW_BYTES:
+            self.head += chunk[:PREVIEW_BYTES - len(self.head)]
+        stripped = chunk.translate(None, WHITESPACE_BYTES)
+        self.nonblank += len(stripped)
+        self.raw.feed(chunk)
+        if self.b64_ok:
+            if stripped.translate(None, B64_ALPHABET):
+                self.b64_ok = False
+            else:
+                self._feed_base64(stripped.translate(B64_URLSAFE))
+        if not self.has_server_hint:
+            self.has_server_hint = b'http' in chunk or b'server' in chunk
+        return self.is_conclusive()
+
+    def _feed_base64(self, data, final=False):
+        data = self.b64_pending + data
+        cut = len(data) if final else len(data) // 4 * 4
+        self.b64_pending = data[cut:]
+        if not cut:
+            return
+        if final and cut % 4:
+            # URL 安全 base64 常省略末尾的 "="
+            data += b'=' * (4 - cut % 4)
+            cut = len(data)
+        try:
+            self.decoded.feed(binascii.a2b_base64(data[:cut]).lower())
+        except binascii.Error:
+            self.b64_ok = False
+
+    def _is_clash(self):
+        # "- name:" 本身即满足 name: / server: 的要求
+        counts = self.raw.counts
+        return counts[b'proxies:'] > 0 and counts[b'- name:'] > 0
+
+    def _decoded_nodes(self):
+        return sum(self.decoded.counts[p.encode() + b'://'] for p in PROTOCOLS)
+
+    def _raw_nodes(self):
+        return sum(self.raw.counts[p.encode() + b'://'] for p in PROTOCOLS)
+
+    def is_conclusive(self):
+        """已读部分是否足以确定类型（与 finish 的判断顺序一致）"""
+        if self.nonblank < 10:
+            return False
+        if self._is_clash():
+            return True
+        # 纯 base64 内容中不可能出现 "proxies:"，解码出协议头即可确定
+        if self.nonblank > 20 and self.b64_ok and self._decoded_nodes() > 0:
+            return True
+        # 原始格式节点链接，且尚未出现 clash 特征
+        if not self.b64_ok and self._raw_nodes() > 0 and self.raw.counts[b'proxies:'] == 0:
+            return True
+        return False
+
+    def finish(self, complete=True):
+        """结束读取并给出分类结果；complete 表示是否读到了数据末尾"""
+        if self.nonblank < 10:
+            return None
+        result = {"format": UNKNOWN, "nodes": 0, "protocols": {}, "lines": 0, "complete": complete}
+
+        if self._is_clash():
+            result.update(format=CLASH, nodes=self.raw.counts[b'- name:'])
+            return result
+
+        if self.nonblank > 20 and self.b64_ok and complete:
+            self._feed_base64(b'', final=True)
+        if self.nonblank > 20 and self.b64_ok:
+            counts = self.decoded.counts
+            nodes = self._decoded_nodes()
+            if nodes > 0:
+                result.update(format=V2_BASE64, nodes=nodes, protocols=_protocol_counts(counts))
+                return result
+            if any(counts[k] > 0 for k in CONFIG_KEYWORDS):
+                lines = counts[b'\n']
+                if self.decoded.carry.rsplit(b'\n', 1)[-1].strip():
+                    lines += 1  # 末尾未换行的一行
+                if lines > 0:
+                    result.update(format=V2_CONFIG, lines=lines)
+                    return result
+
+        nodes = self._raw_nodes()
+        if nodes > 0:
+            result.update(format=V2_RAW, nodes=nodes, protocols=_protocol_counts(self.raw.counts))
+        return result
+
+
+def classify(data):
+    """一次性识别完整的订阅内容（bytes）"""
+    classifier = SubscriptionClassifier()
+    classifier.feed(data)
+    return classifier.finish()
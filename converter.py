@@ -0,0 +1,284 @@
+import time
+import asyncio
+from collections import deque
+from loguru import logger
+
+# 订阅转换后端路由：按健康度（EWMA 延迟 + 错误率）排序尝试各后端，
+# 连续失败的后端熔断一段时间，首个请求超过延迟分位数仍未返回时向下一个后端发起对冲请求
+
+EWMA_ALPHA = 0.2            # EWMA 平滑系数
+INITIAL_LATENCY = 1.0       # 尚无样本的后端按 1 秒估计，保证会被尝试
+ERROR_PENALTY = 20.0        # 一次传输错误折算的时间代价（秒），约等于请求超时
+BREAKER_THRESHOLD = 5       # 连续传输错误次数达到该值时熔断
+BREAKER_COOLDOWN = 60.0     # 熔断持续时间（秒），之后放行一次试探请求
+HEDGE_PERCENTILE = 0.95     # 对冲触发的延迟分位数
+HEDGE_MIN_SAMPLES = 10      # 样本不足时使用默认对冲延迟
+HEDGE_DEFAULT = 8.0
+HEDGE_BOUNDS = (1.0, 20.0)  # 对冲延迟的上下限（秒）
+BATCH_SIZE = 8              # 批量检测时一次转换请求合并的订阅数
+BATCH_LINGER = 0.5          # 攒批等待时间（秒），不足一批时到时即发送
+
+
+class BackendError(Exception):
+    """后端本身不可用（如网关错误），与超时、连接异常一样计入错误率与熔断"""
+
+
+class BackendHealth:
+    """单个转换后端的健康状态"""
+
+    def __init__(self, name):
+        self.name = name
+        self.latency = None        # 成功响应的 EWMA 延迟（秒）
+        self.error_rate = 0.0      # 传输错误（超时 / 连接异常）的 EWMA 比例
+        self.consecutive_errors = 0
+        self.open_until = 0.0      # 熔断截止时间
+        self.requests = 0
+        self.successes = 0         # 返回有效结果的次数
+        self.errors = 0
+        self.trips = 0             # 熔断次数
+
+    @property
+    def score(self):
+        """预期时间代价，越小越优先"""
+        latency = INITIAL_LATENCY if self.latency is None else self.latency
+        return latency + self.error_rate * ERROR_PENALTY
+
+    def is_open(self, now):
+        return now < self.open_until
+
+    def record_response(self, latency, valid):
+        """后端正常响应（无论订阅是否有效）"""
+        self.requests += 1
+        self.successes += bool(valid)
+        self.latency = latency if self.latency is None else \
+            EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency
+        self.error_rate *= (1 - EWMA_ALPHA)
+        self.consecutive_errors = 0
+        self.open_until = 0.0
+
+    def record_error(self, now):
+        self.requests += 1
+        self.errors += 1
+        self.error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_rate
+        self.consecutive_errors += 1
+        if self.consecutive_errors >= BREAKER_THRESHOLD:
+            if not self.is_open(now):
+                self.trips += 1
+                logger.warning(f"订阅转换后端 {self.name} 连续失败 {self.consecutive_errors} 次，熔断 {BREAKER_COOLDOWN:.0f} 秒")
+            self.open_until = now + BREAKER_COOLDOWN
+
+
+class ConverterRouter:
+    """
+    对一组等价后端执行同一请求：
+      route(attempt) 中 attempt(backend) 为协程函数，返回真值表示成功，返回 None 表示
+      后端正常响应但结果无效（换下一个后端），抛出异常表示传输错误（计入错误率与熔断）
+    """
+
+    def __init__(self, backends):
+        self.backends = {name: BackendHealth(name) for name in backends}
+        self.latencies = deque(maxlen=200)  # 最近的成功响应延迟，用于计算对冲分位数
+        self.hedges = 0
+        self.wins = {name: 0 for name in backends}
+
+    def ordered(self):
+        """按健康度排序的后端列表；熔断中的后端跳过，全部熔断时仍按恢复时间依次尝试"""
+        now = time.monotonic()
+        healthy = [b for b in self.backends.values() if not b.is_open(now)]
+        if not healthy:
+            return sorted(self.backends.values(), key=lambda b: b.open_until)
+        return sorted(healthy, key=lambda b: b.score)
+
+    def hedge_delay(self):
+        """首个请求超过该时间仍未返回，则向下一个后端发起对冲请求"""
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT
+        samples = sorted(self.latencies)
+        delay = samples[int(HEDGE_PERCENTILE * (len(samples) - 1))]
+        return min(max(delay, HEDGE_BOUNDS[0]), HEDGE_BOUNDS[1])
+
+    async def _timed(self, backend, attempt):
+        """返回 (结果, 是否请求失败)"""
+        start = time.monotonic()
+        try:
+            result = await attempt(backend.name)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            backend.record_error(time.monotonic())
+            logger.debug(f"订阅转换后端 {backend.name} 请求失败: {e!r}")
+            return None, True
+        latency = time.monotonic() - start
+        backend.record_response(latency, bool(result))
+        self.latencies.append(latency)
+        return result, False
+
+    async def route(self, attempt):
+        """
+        按健康度依次（必要时对冲并发）尝试各后端，返回第一个成功结果；全部无效返回 None，
+        所有尝试都是请求失败（没有后端正常响应）时抛出 BackendError
+        """
+        order = self.ordered()
+        pending = {}
+        launched = 0
+        answered = False
+
+        def launch():
+            nonlocal launched
+            backend = order[launched]
+            launched += 1
+            pending[asyncio.ensure_future(self._timed(backend, attempt))] = backend
+
+        launch()
+        try:
+            while pending:
+                timeout = self.hedge_delay() if launched < len(order) else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 当前请求过慢：不取消，额外向下一个后端发起对冲请求
+                    self.hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    backend = pending.pop(task)
+                    result, failed = task.result()
+                    if result is not None:
+                        self.wins[backend.name] += 1
+                        return result
+                    answered = answered or not failed
+                # 有请求失败：立即尝试下一个后端
+                if launched < len(order):
+                    launch()
+            if not answered:
+                raise BackendError(f"{launched} 个订阅转换后端均请求失败")
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def report(self):
+        if not any(b.requests for b in self.backends.values()):
+            return
+        logger.info(f"🔀 订阅转换后端统计 (对冲请求 {self.hedges} 次):")
+        for backend in self.backends.values():
+            latency = f"{backend.latency:.2f}s" if backend.latency is not None else "-"
+            logger.info(f"   {backend.name}: 请求 {backend.requests}, 采用结果 {self.wins[backend.name]}, "
+                        f"有效 {backend.successes}, 传输错误 {backend.errors}, EWMA 延迟 {latency}, "
+                        f"错误率 {backend.error_rate:.2f}, 熔断 {backend.trips} 次")
+
+
+class BatchValidator:
+    """
+    组测试：同一目标的订阅攒成一批，以 url=a|b|c 合并为一次转换请求。
+    整批通过则全部有效；失败或节点数不足时二分，直到定位到无效成员（单个成员走常规检测）。
+    批大小按已观察到的无效比例 p 调整为约 1/sqrt(p)（Dorfman 组测试的最优组大小），无效订阅较多时退化为逐个检测。
+    检测请求本身出错时只让该请求涉及的成员得到异常，已由其他请求判定的成员照常返回结果。
+      check_one(url, target) -> bool        单个订阅的检测
+      check_group(urls, target) -> bool     整批检测，任一成员无效即返回 False
+    """
+
+    def __init__(self, check_one, check_group, batch_size=BATCH_SIZE, linger=BATCH_LINGER):
+        self.check_one = check_one
+        self.check_group = check_group
+        self.batch_size = batch_size
+        self.linger = linger
+        self.pending = {}      # target -> [(url, future)]
+        self.timers = {}       # target -> 攒批定时器
+        self.tasks = set()
+        self.items = 0
+        self.resolved = 0
+        self.invalid = 0
+        self.group_requests = 0
+        self.single_requests = 0
+
+    async def check(self, url, target):
+        """提交一个订阅，等待所在批次的检测结果"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.items += 1
+        batch = self.pending.setdefault(target, [])
+        batch.append((url, future))
+        if len(batch) >= self.current_batch_size():
+            self._flush(target)
+        elif target not in self.timers:
+            self.timers[target] = loop.call_later(self.linger, self._flush, target)
+        return await future
+
+    def current_batch_size(self):
+        """按无效比例估计的批大小；先验假设无效比例为 1/batch_size²，即从最大批开始"""
+        p = (self.invalid + 1) / (self.resolved + self.batch_size ** 2)
+        return max(1, min(self.batch_size, int(p ** -0.5)))
+
+    def _flush(self, target):
+        timer = self.timers.pop(target, None)
+        if timer:
+            timer.cancel()
+        batch = self.pending.pop(target, None)
+        if batch:
+            task = asyncio.ensure_future(self._resolve(batch, target))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _resolve(self, batch, target):
+        try:
+            verdicts = await self._bisect([url for url, _ in batch], target)
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        decided = [valid for valid in verdicts.values() if not isinstance(valid, Exception)]
+        self.resolved += len(decided)
+        self.invalid += sum(1 for valid in decided if not valid)
+        for url, future in batch:
+            if future.done():
+                continue
+            if isinstance(verdicts[url], Exception):
+                future.set_exception(verdicts[url])
+            else:
+                future.set_result(verdicts[url])
+
+    async def _bisect(self, urls, target):
+        """{url: 是否有效}；检测请求本身失败（后端均不可用）时该请求涉及的成员对应异常，其余成员不受影响"""
+        if len(urls) == 1:
+            self.single_requests += 1
+            try:
+                return {urls[0]: bool(await self.check_one(urls[0], target))}
+            except Exception as e:
+                return {urls[0]: e}
+        self.group_requests += 1
+        try:
+            if await self.check_group(urls, target):
+                return dict.fromkeys(urls, True)
+        except Exception as e:
+            return dict.fromkeys(urls, e)
+        mid = len(urls) // 2
+        left, right = await asyncio.gather(self._bisect(urls[:mid], target),
+                                           self._bisect(urls[mid:], target))
+        return {**left, **right}
+
+    async def close(self):
+        """取消仍在攒批或检测中的批次"""
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers.clear()
+        for batch in self.pending.values():
+            for _, future in batch:
+                future.cancel()
+        self.pending.clear()
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def report(self):
+        if not self.items:
+            return
+        requests = self.group_requests + self.single_requests
+        logger.info(f"📦 批量节点检测: {self.items} 个订阅, 转换请求 {requests} 次 "
+                    f"(整批 {self.group_requests} / 单个 {self.single_requests}), "
+                    f"无效 {self.invalid}, 最终批大小 {self.current_batch_size()}")
@@ -0,0 +1,43 @@
+import time
+from loguru import logger
+
+# 截止时间模式（main.py --deadline）：整轮运行的时间预算按比例分给各阶段，
+# 阶段截止时间为从运行开始累计的份额，前面阶段提前完成时剩余时间顺延给后面的阶段；
+# 最后 DEADLINE_RESERVE 的份额留给合并与写入输出文件，保证定时任务的下一次触发前结果已经保存
+STAGE_SHARES = (
+    ("check_subscriptions", 0.60),  # 第一~三步：验证现有订阅、抓取频道、检查订阅
+    ("probe_nodes", 0.10),          # 节点连通性探测
+    ("check_nodes", 0.15),          # 第六步：节点检测
+)
+DEADLINE_RESERVE = 0.15
+
+
+class Deadline:
+    """整轮运行的时间预算：记录各阶段的截止时间与因截止而推迟的工作量"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.start = time.monotonic()
+        self.cutoffs = {}
+        elapsed = 0.0
+        for stage, share in STAGE_SHARES:
+            elapsed += share
+            self.cutoffs[stage] = self.start + seconds * elapsed
+        self.deferred = {}   # 阶段 -> 推迟的数量
+
+    def left(self, stage):
+        """距离该阶段截止还有多少秒（不小于 0）"""
+        return max(0.0, self.cutoffs[stage] - time.monotonic())
+
+    def defer(self, stage, count):
+        if count:
+            self.deferred[stage] = self.deferred.get(stage, 0) + count
+
+    def report(self):
+        elapsed = time.monotonic() - self.start
+        logger.info(f"⏱️ 截止时间模式: 预算 {self.seconds:.0f}s, 用时 {elapsed:.1f}s")
+        if not self.deferred:
+            logger.info("   所有工作均在截止时间前完成")
+            return
+        for stage, count in self.deferred.items():
+            logger.info(f"   推迟到下次运行 [{stage}]: {count} 个")
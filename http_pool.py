@@ -0,0 +1,183 @@
+import time
+import asyncio
+from types import SimpleNamespace
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import aiohttp
+from loguru import logger
+
+from rate_limit import HostRateLimiter, THROTTLE_STATUS
+from adaptive import AdaptiveLimiter, report_limiters
+from metrics import Histogram
+
+# 全局共享的连接池：所有请求复用同一个 ClientSession / TCPConnector，
+# 保留 keep-alive 连接与 DNS 缓存；按主机自适应限制并发（AIMD）与速率（令牌桶，遇 429 / 503 自动降速），
+# 并统计每个主机的连接与流量
+
+
+class HostStats:
+    """单个主机的请求统计"""
+
+    __slots__ = ('requests', 'opened', 'reused', 'dns_hits', 'dns_misses', 'bytes', 'timeouts', 'errors')
+
+    def __init__(self):
+        self.requests = 0
+        self.opened = 0       # 新建连接数
+        self.reused = 0       # 复用 keep-alive 连接数
+        self.dns_hits = 0
+        self.dns_misses = 0
+        self.bytes = 0        # 接收的响应体字节数
+        self.timeouts = 0
+        self.errors = 0       # 连接失败等其他异常
+
+
+class _PooledRequest:
+    """先获取主机并发许可与速率令牌，再发起请求；用法与 session.get(...) 相同（async with）"""
+
+    def __init__(self, pool, method, url, kwargs):
+        self.pool = pool
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+        self.concurrency = None
+        self.ctx = None
+        self.host = ''
+        self.response = None
+        self.latency = None   # 收到响应头的耗时
+        self.failed = False   # 限流或服务端错误
+
+    async def __aenter__(self):
+        self.host = urlparse(str(self.url)).hostname or ''
+        self.concurrency = self.pool.host_limiter(self.host)
+        await self.concurrency.acquire()
+        try:
+            await self.pool.limiter.acquire(self.host)
+            start = time.monotonic()
+            self.ctx = self.pool.session.request(self.method, self.url,
+                                                 trace_request_ctx=SimpleNamespace(host=self.host), **self.kwargs)
+            self.response = await self.ctx.__aenter__()
+            self.latency = time.monotonic() - start
+            self.pool.latencies[self.host].observe(self.latency)
+            self.failed = self.response.status in THROTTLE_STATUS or self.response.status >= 500
+            self.pool.limiter.observe(self.host, self.response.status, self.response.headers)
+            return self.response
+        except asyncio.CancelledError:
+            self.concurrency.release()
+            raise
+        except BaseException as e:
+            # 超时、连接失败计入该主机的错误率
+            self.pool.record_error(self.host, type(e))
+            self.concurrency.release(error=True)
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            # 流式读取（content.iter_chunked）不会触发 trace 的 chunk 事件，按实际读入的字节数统计
+            self.pool.stats[self.host].bytes += self.response.content.total_bytes
+            return await self.ctx.__aexit__(exc_type, exc, tb)
+        finally:
+            # 读取响应体时超时同样视为错误；调用方主动取消不计入
+            error = self.failed or (exc_type is not None and not issubclass(exc_type, asyncio.CancelledError))
+            if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+                self.pool.record_error(self.host, exc_type)
+            self.concurrency.release(self.latency, error)
+
+
+class SessionPool:
+    """
+    共享会话与连接池管理：
+      - limit / limit_per_host：连接器的总连接数与默认单主机连接数
+      - host_limits：按主机覆盖的初始并发（如 t.me、订阅转换后端需要更严格的限制），其余主机从 limit_per_host 开始；
+        各主机的并发在 [1, 初始值 × 4] 内按 AIMD 自适应调整，limit 为连接器的总连接数上限
+      - host_rates：按主机覆盖的速率 {主机: (每秒请求数, 突发数)}，见 rate_limit.HostRateLimiter
+    提供与 aiohttp.ClientSession 相同的 get() / request() 接口，可直接替换 session 传入各请求函数
+    """
+
+    def __init__(self, limit=100, limit_per_host=20, host_limits=None, host_rates=None, timeout=None):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.host_limits = dict(host_limits or {})
+        self.timeout = timeout or aiohttp.ClientTimeout(total=30, connect=10)
+        self.session = None
+        self.host_limiters = {}
+        self.limiter = HostRateLimiter(host_rates)
+        self.stats = defaultdict(HostStats)
+        self.latencies = defaultdict(Histogram)  # 主机 -> 响应头耗时直方图
+
+    async def __aenter__(self):
+        # 单主机并发由自适应限制器控制，连接器只限制总连接数
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=0,
+            ttl_dns_cache=300,
+            use_dns_cache=True,
+        )
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout,
+                                             trace_configs=[self._trace_config()])
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+
+    def host_limiter(self, host):
+        """返回主机的自适应并发限制器"""
+        limiter = self.host_limiters.get(host)
+        if limiter is None:
+            initial = self.host_limits.get(host, self.limit_per_host)
+            limiter = self.host_limiters[host] = AdaptiveLimiter(host, initial)
+        return limiter
+
+    def request(self, method, url, **kwargs):
+        return _PooledRequest(self, method, url, kwargs)
+
+    def get(self, url, **kwargs):
+        return _PooledRequest(self, 'GET', url, kwargs)
+
+    # -------------------------------
+    # 统计
+    # -------------------------------
+    def record_error(self, host, exc_type):
+        stats = self.stats[host]
+        if issubclass(exc_type, asyncio.TimeoutError):
+            stats.timeouts += 1
+        else:
+            stats.errors += 1
+
+    def _trace_config(self):
+        trace = aiohttp.TraceConfig()
+
+        def counter(field):
+            async def on_event(session, ctx, params):
+                request_ctx = ctx.trace_request_ctx
+                if request_ctx is not None:
+                    stats = self.stats[request_ctx.host]
+                    setattr(stats, field, getattr(stats, field) + 1)
+            return on_event
+
+        trace.on_request_start.append(counter('requests'))
+        trace.on_connection_create_end.append(counter('opened'))
+        trace.on_connection_reuseconn.append(counter('reused'))
+        trace.on_dns_cache_hit.append(counter('dns_hits'))
+        trace.on_dns_cache_miss.append(counter('dns_misses'))
+        return trace
+
+    def report(self, top=10):
+        """输出连接池统计：总计与流量最大的若干主机"""
+        self.limiter.report()
+        report_limiters("各主机自适应并发", self.host_limiters.values())
+        if not self.stats:
+            return
+        total = HostStats()
+        for stats in self.stats.values():
+            for field in HostStats.__slots__:
+                setattr(total, field, getattr(total, field) + getattr(stats, field))
+        logger.info(f"🌐 连接池统计: {len(self.stats)} 个主机, 请求 {total.requests} 次, "
+                    f"新建连接 {total.opened} / 复用 {total.reused}, "
+                    f"DNS 缓存命中 {total.dns_hits} / 未命中 {total.dns_misses}, "
+                    f"超时 {total.timeouts}, 其他异常 {total.errors}, "
+                    f"接收 {total.bytes / 1024 / 1024:.2f} MB")
+        ranked = sorted(self.stats.items(), key=lambda item: item[1].bytes, reverse=True)[:top]
+        for host, stats in ranked:
+            logger.info(f"   {host}: 请求 {stats.requests}, 新建 {stats.opened} / 复用 {stats.reused}, "
+                        f"DNS 命中 {stats.dns_hits}, {stats.bytes / 1024:.1f} KB")
@@ -1,27 +1,106 @@
+import time
 import asyncio
-import aiohttp
+import argparse
 import re
 import yaml
 import os
-import base64
+import hashlib
+from collections import Counter
 from urllib.parse import quote
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urljoin
 from tqdm import tqdm
 from loguru import logger
+from sub_cache import SubscriptionCache
+from tg_channel import ChannelCursor, parse_messages, filter_channel_urls, channel_key
+from run_memo import RunMemo
+from http_pool import SessionPool
+from adaptive import AdaptiveLimiter, report_limiters
+from rate_limit import backoff_delay, THROTTLE_STATUS
+from converter import ConverterRouter, BatchValidator, BackendError
+from classifier import SubscriptionClassifier, classify, CLASH, V2_BASE64, V2_CONFIG, V2_RAW
+from node_parser import NodeParser
+from node_index import NodeIndex
+from prober import NodeProber, summarize
+from metrics import RunMetrics, Histogram
+from state_store import StateStore, play_url
+from negative_cache import NegativeCache, failure_reason, DEAD_STATUS
+from recheck import next_check, plan_rechecks
+from deadline import Deadline
+from body_store import BodyStore
+from canonical import RedirectCache, UrlCanonicalizer, clean_url, is_shortener, REDIRECT_STATUS, REDIRECT_MAX_HOPS
 
 # 全局配置
-RE_URL = r"https?://[-A-Za-z0-9+&@#/%?=~_|!:,.;]+[-A-Za-z0-9+&@#/%=~_|]"
 CHECK_NODE_URL_STR = "https://{}/sub?target={}&url={}&insert=false&config=config%2FACL4SSR.ini"
 CHECK_URL_LIST = ['api.dler.io', 'sub.xeton.dev', 'sub.id9.cc', 'sub.maoxiongnet.com']
+SUB_CACHE = SubscriptionCache()  # 跨运行的订阅条件请求缓存
+TG_CURSOR = ChannelCursor()      # 各频道已处理到的消息 id
+RUN_MEMO = RunMemo()             # 本次运行内各阶段共享的 URL 检查结果
+CONVERTER_ROUTER = ConverterRouter(CHECK_URL_LIST)  # 订阅转换后端健康度路由
+NODE_INDEX = NodeIndex()         # 跨订阅的节点去重索引
+RUN_METRICS = RunMetrics()       # 本次运行的结构化指标（JSON / Prometheus textfile）
+STATE_STORE = StateStore()       # 订阅状态库（SQLite），config.yaml 由其导出
+NEGATIVE_CACHE = NegativeCache() # 失效链接墓碑（与状态库共用数据库）
+REDIRECT_CACHE = RedirectCache() # 短链接跳转结果（与状态库共用数据库）
+BODY_STORE = BodyStore()         # 完整响应体哈希 -> 链接，内容相同的镜像订阅共用节点检测结果
+METRICS_TOP_HOSTS = 20           # 指标中单独列出的主机数（按请求数），其余合并为 "other"
+
+# Telegram 频道抓取
+TG_MAX_CONCURRENCY = 8  # 同时抓取的 t.me 页面数
+TG_MAX_PAGES = 1        # 每个频道最多抓取的页数（1 表示只抓最新一页，>1 时向前翻页）
+TG_CATCHUP_PAGES = 10   # 已有游标的频道向前翻页直到游标位置的最多页数，超出时游标不推进，下次运行重新抓取
+TG_PREVIEW_URL = 'https://t.me/s/{}'  # 频道网页预览地址（benchmark.py 的离线基准替换为本地模拟服务）
+
+# 连接池中按主机覆盖的并发上限（其余主机为 limit_per_host）
+CONVERTER_MAX_CONCURRENCY = 5  # 每个订阅转换后端同时处理的请求数
+HOST_LIMITS = {'t.me': TG_MAX_CONCURRENCY}
+HOST_LIMITS.update({host: CONVERTER_MAX_CONCURRENCY for host in CHECK_URL_LIST})
+# 按主机覆盖的速率 (每秒请求数, 突发数)，其余主机使用 rate_limit.DEFAULT_RATE
+HOST_RATES = {'t.me': (5.0, 10)}
+HOST_RATES.update({host: (5.0, 5) for host in CHECK_URL_LIST})
+FETCH_RETRIES = 3  # 抓取频道页面遇到 429 / 503 时的最多尝试次数
+
+# 订阅内容流式识别
+SUB_MAX_BYTES = 8 * 1024 * 1024  # 单个订阅最多读取的字节数，超出部分按已读内容判断
+SUB_CHUNK_SIZE = 64 * 1024       # 流式读取的块大小
+
+# 节点有效性：默认使用订阅检查时本地解析出的节点判断，无法本地解析的订阅才请求订阅转换后端
+LOCAL_NODE_CHECK = True
+# 节点去重索引需要完整的订阅内容：索引中没有该订阅或记录超过 NODE_INDEX_REFRESH 秒时读到末尾
+# （不超过 SUB_MAX_BYTES），否则同样在类型确定后停止读取，沿用索引中的节点与上次完整读取的内容哈希
+NODE_INDEX_ENABLED = True
+NODE_INDEX_REFRESH = 24 * 3600
+
+# 现有订阅分级复查：按通过历史、到期时间与流量消耗速度安排复查，未到期的订阅沿用上次的检查结果
+RECHECK_ENABLED = True
+RECHECK_BUDGET = 500  # 每次运行最多复查的现有订阅数（None 表示不限），超出部分按到期先后推迟
+
+# 镜像订阅：输出列表中每组内容完全相同的订阅只保留一个代表链接（优先保留现有订阅）
+MIRROR_COLLAPSE = True
+
+# 短链接解析（canonical.SHORTENER_HOSTS 中的主机）：不跟随跳转，只读取 Location
+SHORTENER_TIMEOUT = 10
+
+# 失效链接墓碑：403 / 404 / 410、域名不存在或连续超时的链接在墓碑有效期内不再检查
+NEGATIVE_CACHE_ENABLED = True
+
+# 节点连通性探测（基于节点去重索引，每个节点只探测一次）
+NODE_PROBE_ENABLED = True
+NODE_PROBE_DEADLINE = 60  # 整轮探测的截止时间（秒）
+NODE_PROBE_TLS = False    # 对 trojan 节点额外进行 TLS 握手
+NODE_PROBE_DROP = True    # 节点全部探测完毕且无一可达的订阅不写入节点检测后的输出文件（config.yaml 中保留）
 
 # -------------------------------
 # 配置文件操作
 # -------------------------------
+# 有 libyaml 时使用 C 实现的解析 / 输出
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
 def load_yaml_config(path_yaml):
     """读取 YAML 配置文件，如文件不存在则返回默认结构"""
     if os.path.exists(path_yaml):
         with open(path_yaml, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
+            config = yaml.load(f, Loader=YAML_LOADER)
     else:
         config = {
             "机场订阅": [],
@@ -35,7 +114,7 @@ def load_yaml_config(path_yaml):
 def save_yaml_config(config, path_yaml):
     """保存配置到 YAML 文件"""
     with open(path_yaml, 'w', encoding='utf-8') as f:
-        yaml.dump(config, f, allow_unicode=True)
+        yaml.dump(config, f, Dumper=YAML_DUMPER, allow_unicode=True)
 
 def get_config_channels(config_file='config.yaml'):
     """
@@ -49,41 +128,170 @@ def get_config_channels(config_file='config.yaml'):
         parts = url.strip().split('/')
         if parts:
             channel_id = parts[-1]
-            new_list.append(f'https://t.me/s/{channel_id}')
+            new_list.append(TG_PREVIEW_URL.format(channel_id))
     return new_list
 
 # -------------------------------
 # 异步 HTTP 请求辅助函数
 # -------------------------------
 async def fetch_content(url, session, method='GET', headers=None, timeout=15):
-    """获取指定 URL 的文本内容"""
-    try:
-        async with session.request(method, url, headers=headers, timeout=timeout) as response:
-            if response.status == 200:
-                text = await response.text()
-                return text
-            else:
-                logger.warning(f"URL {url} 返回状态 {response.status}")
-                return None
-    except Exception as e:
-        logger.error(f"请求 {url} 异常: {e}")
-        return None
+    """获取指定 URL 的文本内容；被限流 (429 / 503) 时退避重试，连接池会按 Retry-After 暂停该主机"""
+    for attempt in range(FETCH_RETRIES):
+        try:
+            async with session.request(method, url, headers=headers, timeout=timeout) as response:
+                if response.status == 200:
+                    text = await response.text()
+                    return text
+                if response.status in THROTTLE_STATUS and attempt + 1 < FETCH_RETRIES:
+                    logger.debug(f"URL {url} 返回状态 {response.status}，尝试 {attempt + 1}/{FETCH_RETRIES}")
+                    RUN_METRICS.count('retries_total', 'fetch')
+                else:
+                    logger.warning(f"URL {url} 返回状态 {response.status}")
+                    return None
+        except Exception as e:
+            logger.error(f"请求 {url} 异常: {e}")
+            return None
+        await asyncio.sleep(backoff_delay(attempt))
+    return None
 
 # -------------------------------
 # 频道抓取及订阅检查
 # -------------------------------
-async def get_channel_urls(channel_url, session):
-    """从 Telegram 频道页面抓取所有订阅链接，并过滤无关链接"""
-    content = await fetch_content(channel_url, session)
-    if content:
-        # 提取所有 URL，并排除包含“//t.me/”或“cdn-telegram.org”的链接
-        all_urls = re.findall(RE_URL, content)
-        filtered = [u for u in all_urls if "//t.me/" not in u and "cdn-telegram.org" not in u]
-        logger.info(f"从 {channel_url} 提取 {len(filtered)} 个链接")
-        return filtered
-    else:
-        logger.warning(f"无法获取 {channel_url} 的内容")
-        return []
+async def get_channel_urls(channel_url, session, max_pages=TG_MAX_PAGES, cursor=None):
+    """
+    从 Telegram 频道页面抓取各条消息正文中的订阅链接，并过滤无关链接。
+    max_pages > 1 时通过 ?before=<最早消息 id> 向前翻页，抓取更早的消息；
+    提供 cursor 且该频道已有游标时，只提取比游标更新的消息中的链接，向前翻页（至多 TG_CATCHUP_PAGES 页）
+    直到游标位置，翻到后推进游标；未能翻到（页数用尽或请求失败）时游标不推进，避免跳过中间的消息
+    """
+    last_id = cursor.get(channel_url) if cursor else None
+    if last_id is not None:
+        max_pages = max(max_pages, TG_CATCHUP_PAGES)
+    caught_up = last_id is None
+    urls = []
+    newest_id = 0
+    new_messages = 0
+    newest_post = None
+    page_url = channel_url
+    for page in range(max_pages):
+        content = await fetch_content(page_url, session)
+        if not content:
+            if page == 0:
+                logger.warning(f"无法获取 {channel_url} 的内容")
+            break
+        
+        messages = parse_messages(content)
+        if not messages:
+            # 页面中没有可识别的消息（页面结构变化等）：退回整页提取
+            urls.extend(filter_channel_urls(content))
+            break
+        for message_id, posted, links in messages:
+            # 增量模式：只处理游标之后的新消息
+            if last_id is None or message_id > last_id:
+                new_messages += 1
+                urls.extend(links)
+                if links and posted and (newest_post is None or posted > newest_post):
+                    newest_post = posted
+        
+        # 以本页最早的消息 id 作为下一页的游标；已翻到游标位置时停止
+        message_ids = [message_id for message_id, _, _ in messages]
+        newest_id = max(newest_id, max(message_ids))
+        oldest_id = min(message_ids)
+        if oldest_id <= 1 or (last_id is not None and oldest_id <= last_id):
+            caught_up = True
+            break
+        page_url = f"{channel_url}?before={oldest_id}"
+    
+    if cursor and newest_id:
+        if caught_up:
+            cursor.update(channel_url, newest_id)
+        else:
+            logger.warning(f"{channel_url} 未能翻到上次处理的消息 {last_id}，游标保持不变，下次运行重新抓取")
+    posted = f"，最新一条发布于 {time.strftime('%Y-%m-%d %H:%M', time.localtime(newest_post))}" if newest_post else ""
+    if last_id is not None:
+        logger.info(f"从 {channel_url} 的 {new_messages} 条新消息中提取 {len(urls)} 个链接{posted}")
+    elif urls:
+        logger.info(f"从 {channel_url} 提取 {len(urls)} 个链接{posted}")
+    return urls
+
+def parse_airport_info(sub_info):
+    """解析 subscription-userinfo 响应头，剩余流量大于 0 时返回流量描述，否则返回 None"""
+    if not sub_info:
+        return None
+    nums = re.findall(r'\d+', sub_info)
+    if len(nums) >= 3:
+        upload, download, total = map(int, nums[:3])
+        if total > 0:  # 确保总流量大于0
+            unused = (total - upload - download) / (1024 ** 3)
+            if unused > 0:
+                return f"可用流量: {round(unused, 2)} GB"
+    return None
+
+def describe_content(url, classifier, result):
+    """
+    将识别引擎的结果转换为订阅检查使用的内容分类：
+      - None：内容为空或过短
+      - {"type": None, "info": None}：内容不匹配已知格式
+      - {"type": ..., "info": ...}：识别成功
+    """
+    if result is None:
+        logger.debug(f"订阅 {url} 内容为空或过短")
+        return None
+    
+    partial = '' if result["complete"] else '至少'
+    fmt = result["format"]
+    nodes = result["nodes"]
+    if fmt == CLASH:
+        return {"type": "clash订阅", "info": f"{partial}包含 {nodes} 个节点"}
+    if fmt == V2_BASE64:
+        logger.debug(f"订阅 {url} 识别为base64编码的v2订阅，包含 {nodes} 个节点 {result['protocols']}")
+        return {"type": "v2订阅", "info": f"{partial}包含 {nodes} 个节点 (base64)"}
+    if fmt == V2_CONFIG:
+        logger.debug(f"订阅 {url} 识别为base64编码的配置文件")
+        return {"type": "v2订阅", "info": f"{partial}包含 {result['lines']} 行配置 (base64)"}
+    if fmt == V2_RAW:
+        logger.debug(f"订阅 {url} 识别为原始格式的v2订阅 {result['protocols']}")
+        return {"type": "v2订阅", "info": f"{partial}包含 {nodes} 个节点 (原始)"}
+    
+    # 如果内容看起来像配置但不匹配已知格式，记录调试信息
+    if classifier.size > 100:
+        # 显示内容的前100个字符用于调试
+        preview = classifier.head.decode('utf-8', errors='replace').replace('\n', '\\n').replace('\r', '\\r')
+        logger.info(f"⚠️  订阅 {url} 内容不匹配已知格式")
+        logger.info(f"   长度: {partial}{classifier.size} 字节")
+        logger.info(f"   预览: {preview}...")
+        
+        # 检查是否可能是其他格式
+        if classifier.has_server_hint:
+            logger.info(f"   可能包含服务器配置，但格式未识别")
+    
+    return {"type": None, "info": None}
+
+def resolve_sub_result(url, sub_info, content):
+    """结合流量信息与内容分类结果，得到最终的订阅检查结果"""
+    if content is None:
+        return None
+    
+    # 判断机场订阅（检查流量信息）
+    # targets：本地解析出的各转换目标有效节点数（用于节点检测，无法解析时为 None）
+    targets = content.get("targets")
+    airport_info = parse_airport_info(sub_info)
+    if airport_info:
+        return {"url": url, "type": "机场订阅", "info": airport_info, "targets": targets}
+    
+    if content["type"]:
+        return {"url": url, "type": content["type"], "info": content["info"], "targets": targets}
+    return None
+
+def cached_category(url):
+    """上次下载时的分类（来自订阅缓存），没有缓存或无效时返回 None"""
+    cached = SUB_CACHE.get(url)
+    result = resolve_sub_result(url, cached.get("userinfo"), cached["content"]) if cached else None
+    return result["type"] if result else None
+
+class SubCheckError(Exception):
+    """订阅请求本身失败（两次尝试均超时 / 连接异常，或被限流、服务端错误），与订阅无效区分，供并发限制器降低并发"""
+
 
 async def sub_check(url, session):
     """
@@ -92,265 +300,825 @@ async def sub_check(url, session):
       - 判断内容中是否包含 'proxies:' 判定 clash 订阅
       - 尝试 base64 解码判断 v2 订阅（识别 ss://、ssr://、vmess://、trojan://、vless://）
       - 增加重试机制和更好的错误处理
-    返回一个字典：{"url": ..., "type": ..., "info": ...}
+      - 携带 If-None-Match / If-Modified-Since 条件请求，304 时复用缓存的分类结果
+      - 流式读取响应体，类型确定即停止下载，最多读取 SUB_MAX_BYTES 字节
+      - 同时在本地解析节点（LOCAL_NODE_CHECK），各转换目标都找到有效节点后才停止读取
+      - 节点去重索引（NODE_INDEX_ENABLED）中没有该订阅或记录已过期时读取完整内容并记录全部节点
+      - 链接失效（403 / 404 / 410、域名不存在、两次尝试均超时）时写入墓碑，能正常访问时移除墓碑
+      - 完整读取的有效内容按哈希记入 BODY_STORE，内容相同的镜像订阅共用节点检测结果
+    返回一个字典：{"url": ..., "type": ..., "info": ...}，订阅无效时返回 None，请求失败时抛出 SubCheckError
     """
     headers = {
         'User-Agent': 'ClashforWindows/0.18.1',
         'Accept': '*/*',
         'Accept-Encoding': 'gzip, deflate'
     }
+    cached = SUB_CACHE.get(url)
+    # 节点索引中没有该订阅的节点时需要完整响应体，不发送条件请求
+    if cached and NODE_INDEX_ENABLED and not NODE_INDEX.has(url):
+        cached = None
+    if cached:
+        headers.update(SUB_CACHE.conditional_headers(url))
     
     # 重试机制
+    timeouts = 0
     for attempt in range(2):
         try:
             async with session.get(url, headers=headers, timeout=12) as response:
+                if response.status == 304 and cached:
+                    # 内容未变化，沿用缓存的分类结果（流量信息以本次响应头为准）
+                    SUB_CACHE.touch(url, response.headers.get('subscription-userinfo'))
+                    sub_info = cached.get("userinfo")
+                    logger.debug(f"订阅 {url} 未修改 (304)，复用缓存结果")
+                    result = resolve_sub_result(url, sub_info, cached["content"])
+                    if result and NODE_INDEX_ENABLED:
+                        NODE_INDEX.reuse(url)
+                    if result and cached.get("complete"):
+                        BODY_STORE.add(url, cached.get("hash"))
+                    NEGATIVE_CACHE.clear(url)
+                    return result
+                
                 if response.status == 200:
-                    text = await response.text()
-                    
-                    # 检查内容是否为空或过短
-                    if not text or len(text.strip()) < 10:
-                        logger.debug(f"订阅 {url} 内容为空或过短")
-                        return None
+                    # 流式读取：逐块分类，类型确定或达到上限即停止，不在内存中保留全文
+                    classifier = SubscriptionClassifier()
+                    parser = NodeParser() if LOCAL_NODE_CHECK or NODE_INDEX_ENABLED else None
+                    digest = hashlib.sha1()
+                    complete = True
+                    full_read = NODE_INDEX_ENABLED and not NODE_INDEX.fresh(url, NODE_INDEX_REFRESH)
+                    async for chunk in response.content.iter_chunked(SUB_CHUNK_SIZE):
+                        chunk = chunk[:SUB_MAX_BYTES - classifier.size]
+                        digest.update(chunk)
+                        conclusive = classifier.feed(chunk)
+                        if parser:
+                            conclusive = parser.feed(chunk) and conclusive
+                        if (conclusive and not full_read) or classifier.size >= SUB_MAX_BYTES:
+                            complete = response.content.at_eof()
+                            break
+                    if not complete and classifier.size >= SUB_MAX_BYTES:
+                        logger.debug(f"订阅 {url} 超过 {SUB_MAX_BYTES} 字节上限，按已读内容判断")
+                    content = describe_content(url, classifier, classifier.finish(complete))
+                    if content and parser:
+                        content["targets"] = parser.finish().target_counts()
+                    content_hash = digest.hexdigest()
+                    # 提前停止且索引记录仍在有效期内：沿用上次完整读取的内容哈希（镜像归组）
+                    snapshot = not complete and not full_read and bool(cached) and bool(cached.get("complete"))
+                    if snapshot:
+                        content_hash = cached["hash"]
                     
-                    result = {"url": url, "type": None, "info": None}
-                    
-                    # 判断机场订阅（检查流量信息）
-                    sub_info = response.headers.get('subscription-userinfo')
-                    if sub_info:
-                        nums = re.findall(r'\d+', sub_info)
-                        if len(nums) >= 3:
-                            upload, download, total = map(int, nums[:3])
-                            if total > 0:  # 确保总流量大于0
-                                unused = (total - upload - download) / (1024 ** 3)
-                                if unused > 0:
-                                    result["type"] = "机场订阅"
-                                    result["info"] = f"可用流量: {round(unused, 2)} GB"
-                                    return result
-                    
-                    # 判断 clash 订阅 - 更严格的检查
-                    if "proxies:" in text and ("name:" in text or "server:" in text):
-                        proxy_count = text.count("- name:")
-                        if proxy_count > 0:
-                            result["type"] = "clash订阅"
-                            result["info"] = f"包含 {proxy_count} 个节点"
-                            return result
-                    
-                    # 判断 v2 订阅，通过 base64 解码检测
-                    try:
-                        # 检查是否可能是base64编码（更宽松的检查）
-                        text_clean = text.strip().replace('\n', '').replace('\r', '')
-                        if len(text_clean) > 20:
-                            try:
-                                # 尝试解码
-                                decoded = base64.b64decode(text_clean).decode('utf-8', errors='ignore')
-                                protocols = ['ss://', 'ssr://', 'vmess://', 'trojan://', 'vless://']
-                                found_protocols = [proto for proto in protocols if proto in decoded]
-                                
-                                if found_protocols:
-                                    node_count = sum(decoded.count(proto) for proto in found_protocols)
-                                    if node_count > 0:
-                                        result["type"] = "v2订阅"
-                                        result["info"] = f"包含 {node_count} 个节点 (base64)"
-                                        logger.debug(f"订阅 {url} 识别为base64编码的v2订阅，包含 {node_count} 个节点")
-                                        return result
-                                else:
-                                    # 检查解码后是否包含配置关键字
-                                    config_keywords = ['server', 'port', 'password', 'method', 'host', 'path']
-                                    if any(keyword in decoded.lower() for keyword in config_keywords):
-                                        lines = [line.strip() for line in decoded.split('\n') if line.strip()]
-                                        if len(lines) > 0:
-                                            result["type"] = "v2订阅"
-                                            result["info"] = f"包含 {len(lines)} 行配置 (base64)"
-                                            logger.debug(f"订阅 {url} 识别为base64编码的配置文件")
-                                            return result
-                            except Exception:
-                                # base64解码失败，继续其他检查
-                                pass
-                    except Exception as e:
-                        logger.debug(f"订阅 {url} base64检测异常: {e}")
-                        pass
-                    
-                    # 检查是否是原始格式的v2订阅
-                    protocols = ['ss://', 'ssr://', 'vmess://', 'trojan://', 'vless://']
-                    found_protocols = [proto for proto in protocols if proto in text]
-                    if found_protocols:
-                        node_count = sum(text.count(proto) for proto in found_protocols)
-                        if node_count > 0:
-                            result["type"] = "v2订阅"
-                            result["info"] = f"包含 {node_count} 个节点 (原始)"
-                            logger.debug(f"订阅 {url} 识别为原始格式的v2订阅")
-                            return result
-                    
-                    
-                    # 如果内容看起来像配置但不匹配已知格式，记录调试信息
-                    if len(text) > 100:
-                        # 显示内容的前100个字符用于调试
-                        preview = text[:100].replace('\n', '\\n').replace('\r', '\\r')
-                        logger.info(f"⚠️  订阅 {url} 内容不匹配已知格式")
-                        logger.info(f"   长度: {len(text)} 字符")
-                        logger.info(f"   预览: {preview}...")
-                        
-                        # 检查是否可能是其他格式
-                        if 'http' in text.lower() or 'server' in text.lower():
-                            logger.info(f"   可能包含服务器配置，但格式未识别")
-                    
-                    return None
+                    SUB_CACHE.store(url, response.headers, content_hash, content, complete or snapshot)
+                    result = resolve_sub_result(url, response.headers.get('subscription-userinfo'), content)
+                    if result and parser and NODE_INDEX_ENABLED:
+                        if complete or full_read:
+                            NODE_INDEX.add(url, parser.nodes)
+                        else:
+                            NODE_INDEX.reuse(url)
+                    if result and (complete or snapshot):
+                        BODY_STORE.add(url, content_hash)
+                    NEGATIVE_CACHE.clear(url)
+                    return result
                     
                 elif response.status in [403, 404, 410, 500]:
                     # 这些状态码通常表示永久失败
                     logger.debug(f"订阅检查 {url} 返回状态 {response.status}")
+                    if response.status in DEAD_STATUS:
+                        NEGATIVE_CACHE.bury(url, f"HTTP {response.status}")
                     return None
                 else:
                     logger.warning(f"订阅检查 {url} 返回状态 {response.status}")
                     if attempt == 0:  # 第一次失败，重试
-                        await asyncio.sleep(1)
+                        RUN_METRICS.count('retries_total', 'sub_check')
+                        await asyncio.sleep(backoff_delay(attempt))
                         continue
+                    if response.status in THROTTLE_STATUS or response.status >= 500:
+                        raise SubCheckError(f"返回状态 {response.status}")
                     return None
                     
         except asyncio.TimeoutError:
             logger.debug(f"订阅检查 {url} 超时，尝试 {attempt + 1}/2")
+            RUN_METRICS.count('timeouts_total', 'sub_check')
+            timeouts += 1
             if attempt == 0:
-                await asyncio.sleep(1)
+                RUN_METRICS.count('retries_total', 'sub_check')
+                await asyncio.sleep(backoff_delay(attempt))
                 continue
         except Exception as e:
             logger.debug(f"订阅检查 {url} 异常: {e}，尝试 {attempt + 1}/2")
+            reason = failure_reason(e)
+            if reason:
+                # 域名不存在，重试没有意义
+                NEGATIVE_CACHE.bury(url, reason)
+                return None
             if attempt == 0:
-                await asyncio.sleep(1)
+                RUN_METRICS.count('retries_total', 'sub_check')
+                await asyncio.sleep(backoff_delay(attempt))
                 continue
     
-    return None
+    if timeouts == 2:
+        NEGATIVE_CACHE.bury(url, "timeout")
+        raise SubCheckError("两次尝试均超时")
+    raise SubCheckError("请求异常")
 
 # -------------------------------
 # 节点有效性检测（根据多个检测入口）
 # -------------------------------
+def converted_content_valid(url, check_base, target, content):
+    """根据目标类型验证订阅转换后端返回的内容是否有效"""
+    # 检查返回内容是否有效
+    if not content or len(content.strip()) < 50:
+        logger.debug(f"节点检测 {url} 在 {check_base} 返回内容过短")
+        return False
+    
+    # 根据目标类型验证内容
+    if target == "clash":
+        if "proxies:" in content and ("name:" in content or "server:" in content):
+            proxy_count = content.count("- name:")
+            if proxy_count > 0:
+                logger.debug(f"节点检测 {url} 在 {check_base} 成功，包含 {proxy_count} 个节点")
+                return True
+    elif target == "loon":
+        # Loon格式通常包含[Proxy]段落
+        if "[Proxy]" in content or "=" in content:
+            logger.debug(f"节点检测 {url} 在 {check_base} 成功 (Loon格式)")
+            return True
+    elif target == "v2ray":
+        # V2Ray格式可能是JSON或其他格式
+        if len(content.strip()) > 100:  # 基本长度检查
+            logger.debug(f"节点检测 {url} 在 {check_base} 成功 (V2Ray格式)")
+            return True
+    else:
+        # 其他格式，基本长度检查
+        if len(content.strip()) > 100:
+            logger.debug(f"节点检测 {url} 在 {check_base} 成功")
+            return True
+    
+    logger.debug(f"节点检测 {url} 在 {check_base} 内容格式不匹配")
+    return False
+
 async def url_check_valid(url, target, session):
     """
     改进的节点有效性检测：
-    通过遍历多个检测入口检查订阅节点有效性，
-    不仅检查状态码，还验证返回内容的有效性。
+    通过订阅转换路由按健康度依次尝试多个检测入口（慢请求会向下一个入口发起对冲请求，
+    持续失败的入口会被熔断），不仅检查状态码，还验证返回内容的有效性。
     """
     encoded_url = quote(url, safe='')
     
-    for check_base in CHECK_URL_LIST:
+    async def attempt(check_base):
         check_url = CHECK_NODE_URL_STR.format(check_base, target, encoded_url)
-        try:
-            async with session.get(check_url, timeout=20) as resp:
-                if resp.status == 200:
-                    content = await resp.text()
-                    
-                    # 检查返回内容是否有效
-                    if not content or len(content.strip()) < 50:
-                        logger.debug(f"节点检测 {url} 在 {check_base} 返回内容过短")
-                        continue
-                    
-                    # 根据目标类型验证内容
-                    if target == "clash":
-                        if "proxies:" in content and ("name:" in content or "server:" in content):
-                            proxy_count = content.count("- name:")
-                            if proxy_count > 0:
-                                logger.debug(f"节点检测 {url} 在 {check_base} 成功，包含 {proxy_count} 个节点")
-                                return url
-                    elif target == "loon":
-                        # Loon格式通常包含[Proxy]段落
-                        if "[Proxy]" in content or "=" in content:
-                            logger.debug(f"节点检测 {url} 在 {check_base} 成功 (Loon格式)")
-                            return url
-                    elif target == "v2ray":
-                        # V2Ray格式可能是JSON或其他格式
-                        if len(content.strip()) > 100:  # 基本长度检查
-                            logger.debug(f"节点检测 {url} 在 {check_base} 成功 (V2Ray格式)")
-                            return url
-                    else:
-                        # 其他格式，基本长度检查
-                        if len(content.strip()) > 100:
-                            logger.debug(f"节点检测 {url} 在 {check_base} 成功")
-                            return url
-                    
-                    logger.debug(f"节点检测 {url} 在 {check_base} 内容格式不匹配")
-                else:
-                    logger.debug(f"节点检测 {url} 在 {check_base} 返回状态 {resp.status}")
-                    
-        except asyncio.TimeoutError:
-            logger.debug(f"节点检测 {url} 在 {check_base} 超时")
-            continue
-        except Exception as e:
-            logger.debug(f"节点检测 {url} 在 {check_base} 异常: {e}")
+        async with session.get(check_url, timeout=20) as resp:
+            if resp.status >= 502 or resp.status == 429:
+                # 网关错误或限流说明后端本身暂不可用，计入该后端的错误率
+                raise BackendError(f"返回状态 {resp.status}")
+            if resp.status != 200:
+                logger.debug(f"节点检测 {url} 在 {check_base} 返回状态 {resp.status}")
+                return None
+            content = await resp.text()
+        return url if converted_content_valid(url, check_base, target, content) else None
+    
+    result = await CONVERTER_ROUTER.route(attempt)
+    if result is None:
+        logger.debug(f"节点检测 {url} 在所有检测点都失败")
+    return result
+
+def count_converted_nodes(content, target):
+    """统计转换结果中的节点数，无法统计时返回 None"""
+    if target == "loon":
+        section = content.split("[Proxy]", 1)[-1].split("\n[", 1)[0]
+        return sum(1 for line in section.splitlines() if "=" in line)
+    result = classify(content.encode('utf-8', errors='ignore'))
+    return result["nodes"] if result and result["nodes"] else None
+
+def converted_servers(content, target):
+    """转换结果中各节点的服务器地址（loon 按 [Proxy] 段逐行解析，其余格式用本地节点解析）"""
+    if target == "loon":
+        section = content.split("[Proxy]", 1)[-1].split("\n[", 1)[0]
+        fields = [line.split("=", 1)[1].split(",") for line in section.splitlines() if "=" in line]
+        return [field[1].strip() for field in fields if len(field) > 1]
+    parser = NodeParser()
+    parser.feed(content.encode('utf-8', errors='ignore'))
+    return [node.server for node in parser.finish().nodes]
+
+def source_servers(url):
+    """节点索引中该订阅各服务器地址的节点数 Counter，没有记录时为空"""
+    if not NODE_INDEX_ENABLED:
+        return Counter()
+    return Counter(node.server for node in NODE_INDEX.nodes([url]).values())
+
+def silent_sources(urls, servers):
+    """
+    把批量转换结果的节点（服务器地址列表）归属到各来源，返回没有贡献节点的来源；无法归属时返回 None。
+    节点索引中有记录的来源按服务器地址归属（每个来源只认领自己在该地址上的节点数，多个来源共用的服务器
+    各自认领），没有记录的来源至多一个，由其余来源未认领的节点归属
+    """
+    remaining = Counter(servers)
+    silent, unknown = [], []
+    for url in urls:
+        known = source_servers(url)
+        if not known:
+            unknown.append(url)
             continue
+        matched = [server for server in known if remaining[server] > 0]
+        if not matched:
+            silent.append(url)
+        for server in matched:
+            remaining[server] -= min(remaining[server], known[server])
+    if len(unknown) > 1:
+        return None
+    if unknown and not remaining:
+        silent += unknown
+    return silent
+
+async def group_check_valid(urls, target, session):
+    """
+    批量节点检测：多个订阅以 | 连接后一次转换。
+    转换后端遇到无法解析的来源会整体报错，因此返回 200 且内容有效、
+    转换结果的节点能归属到每个来源（见 silent_sources）时整批有效，
+    否则（有来源没有贡献节点或无法归属）返回 False 交由调用方二分定位
+    """
+    if sum(1 for url in urls if not source_servers(url)) > 1:
+        # 转换结果注定无法归属，不发送整批请求
+        return False
+    encoded_url = quote('|'.join(urls), safe='')
+    label = f"{len(urls)} 个订阅的批量检测"
     
-    logger.debug(f"节点检测 {url} 在所有检测点都失败")
-    return None
+    async def attempt(check_base):
+        check_url = CHECK_NODE_URL_STR.format(check_base, target, encoded_url)
+        async with session.get(check_url, timeout=20) as resp:
+            if resp.status >= 502 or resp.status == 429:
+                raise BackendError(f"返回状态 {resp.status}")
+            if resp.status != 200:
+                # 批次中有无效成员，换其他后端结果相同，直接返回结论
+                logger.debug(f"{label}在 {check_base} 返回状态 {resp.status}")
+                return False
+            content = await resp.text()
+        if not converted_content_valid(label, check_base, target, content):
+            return False
+        count = count_converted_nodes(content, target)
+        if count is not None and count < len(urls):
+            logger.debug(f"{label}在 {check_base} 仅返回 {count} 个节点")
+            return False
+        silent = silent_sources(urls, converted_servers(content, target))
+        if silent is None:
+            logger.debug(f"{label}在 {check_base} 的结果无法归属到各来源")
+            return False
+        if silent:
+            logger.debug(f"{label}在 {check_base} 中 {len(silent)} 个来源没有贡献节点")
+            return False
+        return True
+    
+    return bool(await CONVERTER_ROUTER.route(attempt))
 
 # -------------------------------
-# 主流程：更新订阅与合并
+# 本次运行内共享的检查结果
 # -------------------------------
-async def update_today_sub(session):
+async def checked_sub(url, session):
+    """经 URL 结果表去重的订阅检查：同一 URL 在本次运行中只请求一次"""
+    result = await RUN_MEMO.run('sub', url, lambda: sub_check(url, session))
+    return dict(result, url=url) if result else result
+
+async def resolve_redirect(url, session):
     """
-    从 Telegram 频道获取最新订阅链接，
-    返回一个去重后的 URL 列表
+    解析短链接的最终跳转目标（跳转缓存优先）；返回 2xx 且不跳转时为短链接本身。
+    请求失败或返回其他状态（429 限流、5xx、4xx 错误页）时返回原链接且不缓存
     """
-    tg_channels = get_config_channels('config.yaml')
-    all_urls = []
-    for channel in tg_channels:
-        urls = await get_channel_urls(channel, session)
-        all_urls.extend(urls)
-    return list(set(all_urls))
+    cached = REDIRECT_CACHE.get(url)
+    if cached is not None:
+        return cached
+    target, status = url, None
+    try:
+        for _ in range(REDIRECT_MAX_HOPS):
+            async with session.request('GET', target, allow_redirects=False, timeout=SHORTENER_TIMEOUT) as response:
+                location = response.headers.get('Location')
+                if response.status not in REDIRECT_STATUS or not location:
+                    status = response.status
+                    break
+                target = urljoin(target, location)
+            if not is_shortener(target):
+                break
+    except Exception as e:
+        REDIRECT_CACHE.failed += 1
+        logger.debug(f"解析短链接 {url} 失败: {e!r}")
+        return url
+    if status is not None and not 200 <= status < 300:
+        # 限流 / 服务端错误等返回的页面不代表"不跳转"，不写入跳转缓存
+        REDIRECT_CACHE.failed += 1
+        logger.debug(f"解析短链接 {url} 在 {target} 返回状态 {status}")
+        return url
+    REDIRECT_CACHE.put(url, target)
+    return target
+
+async def resolved_url(url, session):
+    """经 URL 结果表去重的短链接解析：同一短链接在本次运行中只请求一次"""
+    return await RUN_MEMO.run('redirect', url, lambda: resolve_redirect(url, session))
 
-async def check_subscriptions(urls):
+def record_sub_check(url, result, latency):
+    """暂存订阅检查结果与下次复查时间到状态库（第三步结束时批量写入）"""
+    entry = SUB_CACHE.get(url) if result else None
+    passes, next_due, traffic_used = next_check(url, bool(result), STATE_STORE.history.get(url),
+                                                entry.get("userinfo") if entry else None, time.time())
+    if entry and not SUB_CACHE.userinfo_fresh(url):
+        # 304 未带流量信息时缓存中的已用流量是之前的数值，不作为本次的记录，避免之后的消耗速度被高估
+        traffic_used = None
+    STATE_STORE.record(url, bool(result), latency, entry.get("hash") if entry else None,
+                       passes=passes, next_due=next_due, traffic_used=traffic_used)
+
+def local_node_verdict(result, target):
     """
-    异步检查所有订阅链接的有效性，
-    返回检查结果列表，每个结果为字典 {url, type, info}
+    根据订阅检查时本地解析的节点判断 target 是否可用：
+    有该目标支持的有效节点即为有效；未启用或内容无法本地解析时返回 None（改用订阅转换后端检测）
     """
-    if not urls:
-        return []
-    
-    results = []
-    # 创建连接器，限制并发连接数
-    connector = aiohttp.TCPConnector(
-        limit=100,
-        limit_per_host=20,
-        ttl_dns_cache=300,
-        use_dns_cache=True,
-    )
-    
-    timeout = aiohttp.ClientTimeout(total=30, connect=10)
-    
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        # 使用信号量限制并发数
-        semaphore = asyncio.Semaphore(50)
-        
-        async def check_single(url):
-            async with semaphore:
-                return await sub_check(url, session)
+    if not LOCAL_NODE_CHECK or not result or result.get("targets") is None:
+        return None
+    return result["targets"].get(target, 0) > 0
+
+async def checked_node(url, target, session, batcher=None):
+    """
+    经 URL 结果表去重的节点有效性检测；提供 batcher 时与其他订阅合并为批量转换请求。
+    内容相同的镜像订阅以内容哈希为键，共用同一次检测
+    """
+    if batcher:
+        check = lambda: batcher.check(url, target)
+    else:
+        check = lambda: url_check_valid(url, target, session)
+    valid = await RUN_MEMO.run('node', BODY_STORE.key(url), check, target)
+    return url if valid else None
+
+# -------------------------------
+# 主流程：流水线（频道抓取 → 订阅检查 → 节点检测）
+# -------------------------------
+NODE_TARGETS = {"机场订阅": "loon", "clash订阅": "clash", "v2订阅": "v2ray"}
+# 各阶段的初始并发，运行中按 AIMD 在 [初始值 / STAGE_MIN_DIVISOR, 初始值 × 4] 内自适应调整：
+# 阶段延迟主要取决于各订阅服务器自身的快慢，少数慢速 / 超时的订阅不应让整个阶段退化为串行，对单个主机的保护由连接池按主机的限制器负责
+SUB_CHECK_WORKERS = 50   # 订阅检查并发数
+NODE_CHECK_WORKERS = 20  # 节点检测并发数较低，避免被封
+NODE_BATCH_SIZE = 8      # 批量检测时一次转换请求合并的订阅数（1 表示逐个检测）
+# 批量检测只在关闭 LOCAL_NODE_CHECK 时启用：本地检测开启时交给转换后端的只有本地解析不出节点的订阅，
+# 它们在节点索引中没有记录，批量转换结果无法归属到各来源，合并请求只会在攒批等待后退回逐个检测
+STAGE_MIN_DIVISOR = 5    # 各阶段并发下限为初始值的 1/5
+# 按 (主域名, 分类) 分组检查：同组链接按优先级依次检查，有一个通过即跳过组内其余的新链接
+# （与合并时 deduplicate_urls_by_domain 在分类内去重一致）。分类取现有配置中的分类或上次下载的分类，
+# 两者都没有的链接（从未下载过的新链接）只按主域名分组，该域名有任一分类的链接通过即跳过，
+# 同一主机上其他分类的订阅留给之后的运行；现有订阅总会被检查，不会被跳过
+DOMAIN_GROUP_CHECK = True
+DOMAIN_GROUP_PARALLELISM = 1  # 同一域名同时检查的链接数
+
+class DomainGroup:
+    """
+    同一主域名、同一分类下的待检查链接（分类为 None 时为该域名下分类未知的链接）。
+    取出顺序：现有配置中的链接优先，其次 URL 较大者优先（与 deduplicate_urls_by_domain 保留排序后最后一个链接的规则一致）
+    """
+
+    __slots__ = ('category', 'pending', 'active', 'winner')
+
+    def __init__(self, category):
+        self.category = category
+        self.pending = []   # [(是否优先, url)]
+        self.active = 0     # 队列中或正在检查的名额数
+        self.winner = None  # 已通过检查的链接
+
+    def add(self, url, preferred):
+        self.pending.append((preferred, url))
+
+    def pop(self):
+        if not self.pending:
+            return None
+        best = max(self.pending)
+        self.pending.remove(best)
+        return best[1]
+
+    def drain(self):
+        """组内已有链接通过：取出可跳过的新链接，现有订阅（优先链接）留在组内继续检查"""
+        skipped = [url for preferred, url in self.pending if not preferred]
+        self.pending = [item for item in self.pending if item[0]]
+        return skipped
+
+
+# 流水线取代了原先按阶段依次执行的 update_today_sub / check_subscriptions / check_nodes /
+# validate_existing_subscriptions：对应 scrape_channels、submit + wait_subscriptions、submit_node + wait_nodes
+# 与第一步的现有订阅提交
+class SubscriptionPipeline:
+    """
+    以 asyncio.Queue 串联的检查流水线：
+      现有订阅 / 频道抓取 → 订阅检查队列 → 节点检测队列
+    上游仍在运行时下游即可开始处理，同一 URL 在一次运行中只检查一次。
+    通过检查的订阅只有在其 (主域名, 分类) 中是合并时域名去重会保留的链接（URL 最大者）时才提前进入节点检测，
+    之后出现更大的链接时先前的检测作废；最终列表中尚未检测的链接在第六步补齐。
+    开启 DOMAIN_GROUP_CHECK 时链接按 (主域名, 分类) 分组进入订阅检查队列（分类未知的按 (主域名, None)），
+    每个分组占用的检查名额不超过 DOMAIN_GROUP_PARALLELISM，分组内有同分类的链接通过后其余新链接直接跳过
+    （不检查、不做节点检测）；分类未知的分组在该域名有任一链接通过时跳过。
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.sub_queue = asyncio.Queue()
+        self.node_queue = asyncio.Queue()
+        self.sub_submitted = set()
+        self.node_submitted = set()
+        self.sub_results = {}    # url -> sub_check 结果（None 表示无效）
+        self.groups = {}         # (主域名, 分类或 None) -> DomainGroup
+        self.group_skipped = 0   # 因同域名已有链接通过而跳过的链接数
+        self.tombstoned = 0      # 因墓碑有效而跳过的链接数
+        self.reused = 0          # 未到复查时间、沿用上次结果的现有订阅数
+        self.sub_inflight = set()  # 正在检查的链接（截止时取消时计入推迟）
+        self.url_channels = {}   # 链接 -> 首次抓取到它的频道 id
+        self.urls = UrlCanonicalizer()  # 同一订阅的不同写法归并到代表链接
+        self.scraped_channels = []  # 本次抓取完成的频道 id
+        self.node_results = {}   # (url, target) -> 是否有效
+        self.node_leaders = {}   # (主域名, 分类) -> 已提交节点检测的通过链接
+        self.local_verdicts = 0  # 由本地解析结果直接判定的次数
+        self.batcher = None
+        if NODE_BATCH_SIZE > 1 and not LOCAL_NODE_CHECK:
+            self.batcher = BatchValidator(
+                check_one=lambda url, target: url_check_valid(url, target, session),
+                check_group=lambda urls, target: group_check_valid(urls, target, session),
+                batch_size=NODE_BATCH_SIZE,
+            )
+        # 批量模式下每个转换请求对应一批订阅，按批大小放大节点检测并发，实际请求并发不变
+        self.sub_limiter = AdaptiveLimiter("订阅检查", SUB_CHECK_WORKERS,
+                                           minimum=max(1, SUB_CHECK_WORKERS // STAGE_MIN_DIVISOR))
+        node_workers = NODE_CHECK_WORKERS * (NODE_BATCH_SIZE if self.batcher else 1)
+        self.node_limiter = AdaptiveLimiter("节点检测", node_workers,
+                                            minimum=max(1, node_workers // STAGE_MIN_DIVISOR))
+        self.sub_workers = []
+        self.node_workers = []
+        self.workers = []
+        self.sub_bar = None
+        self.node_bar = None
+
+    def start(self):
+        """启动订阅检查与节点检测的消费者"""
+        self.sub_bar = tqdm(total=0, desc="订阅筛选")
+        self.node_bar = tqdm(total=0, desc="检测节点")
+        # 消费者数量取并发上限，实际同时处理的数量由自适应限制器控制
+        self.sub_workers = [asyncio.create_task(self._sub_worker()) for _ in range(self.sub_limiter.maximum)]
+        self.node_workers = [asyncio.create_task(self._node_worker()) for _ in range(self.node_limiter.maximum)]
+        self.workers = self.sub_workers + self.node_workers
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        if self.batcher:
+            await self.batcher.close()
+        self.sub_bar.close()
+        self.node_bar.close()
+
+    async def _cancel(self, workers, queue):
+        """取消一组消费者并清空其队列，返回未处理的队列元素"""
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        items = []
+        while not queue.empty():
+            items.append(queue.get_nowait())
+            queue.task_done()
+        return items
+
+    async def cancel_subscriptions(self):
+        """截止时间已到：取消进行中的订阅检查并清空队列，返回未完成检查的链接集合"""
+        deferred = set(self.sub_inflight)
+        deferred.update(item for item in await self._cancel(self.sub_workers, self.sub_queue)
+                        if not isinstance(item, DomainGroup))
+        # 消费者被取消时结果表中的检查任务仍在运行，需一并取消，避免保存后继续占用主机名额、更新各缓存
+        await RUN_MEMO.cancel('sub', self.sub_inflight)
+        for group in self.groups.values():
+            deferred.update(url for _, url in group.pending)
+            group.pending = []
+        self.sub_inflight.clear()
+        return deferred
+
+    async def cancel_nodes(self):
+        """截止时间已到：取消进行中的节点检测并清空队列，返回未完成检测的数量"""
+        await self._cancel(self.node_workers, self.node_queue)
+        # 节点检测任务以内容哈希为键，消费者全部取消后剩余的任务均无人等待，整类取消
+        await RUN_MEMO.cancel('node')
+        if self.batcher:
+            await self.batcher.close()
+        return len(self.node_submitted) - len(self.node_results)
+
+    async def canonicalize(self, urls):
+        """规范化一批链接（短链接先解析跳转目标），返回去重后的代表链接；提交检查前调用"""
+        short = [url for url in dict.fromkeys(clean_url(url) for url in urls) if is_shortener(url)]
+        targets = dict(zip(short, await asyncio.gather(*(resolved_url(url, self.session) for url in short))))
+        return self.urls.claim_all(urls, targets)
+
+    def _group(self, url, category):
+        key = (get_domain(url), category)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = DomainGroup(category)
+        return group
+
+    def submit(self, url, preferred=False, category=None):
+        """
+        提交订阅检查（同一 URL 只提交一次）；preferred 表示现有订阅（分组检查时优先检查且不会被跳过），
+        category 为现有配置中的分类，未提供时取上次下载的分类
+        """
+        if url in self.sub_submitted:
+            return
+        self.sub_submitted.add(url)
+        self.sub_bar.total += 1
+        self.sub_bar.refresh()
+        if not DOMAIN_GROUP_CHECK:
+            self.sub_queue.put_nowait(url)
+            return
+        group = self._group(url, category or cached_category(url))
+        if group.winner is not None and not preferred:
+            self._skip([url])
+            return
+        group.add(url, preferred)
+        if group.active < DOMAIN_GROUP_PARALLELISM:
+            group.active += 1
+            self.sub_queue.put_nowait(group)
+
+    def reuse(self, url):
+        """
+        未到复查时间的现有订阅：沿用缓存的分类结果与节点，不发起请求，并作为所在域名分组的通过链接；
+        缺少缓存（或节点索引中没有该订阅）时返回 False，由调用方改为正常检查
+        """
+        cached = SUB_CACHE.get(url)
+        if url in self.sub_submitted or not cached or (NODE_INDEX_ENABLED and not NODE_INDEX.has(url)):
+            return False
+        result = resolve_sub_result(url, cached.get("userinfo"), cached["content"])
+        if not result:
+            return False
+        SUB_CACHE.retain(url)
+        if NODE_INDEX_ENABLED:
+            NODE_INDEX.reuse(url)
+        if cached.get("complete"):
+            BODY_STORE.add(url, cached.get("hash"))
+        self.sub_submitted.add(url)
+        self.sub_results[url] = dict(result, url=url)
+        self.reused += 1
+        if DOMAIN_GROUP_CHECK:
+            self._won(url, result["type"])
+        self._passed(url, result)
+        return True
+
+    def _won(self, url, category):
+        """链接以 category 通过检查：作为 (主域名, 分类) 与 (主域名, None) 分组的通过链接，跳过其中的新链接"""
+        for key in (category, None):
+            group = self._group(url, key)
+            if group.winner is None:
+                group.winner = url
+                self._skip(group.drain())
+
+    def _skip(self, urls):
+        self.group_skipped += len(urls)
+        self.sub_bar.update(len(urls))
+
+    def _passed(self, url, result):
+        """订阅通过检查：是其 (主域名, 分类) 中 URL 最大的通过链接（合并时域名去重保留的链接）时提交节点检测"""
+        key = (get_domain(url), result["type"])
+        leader = self.node_leaders.get(key)
+        if leader is None or url > leader:
+            self.node_leaders[key] = url
+            self.submit_node(url, NODE_TARGETS[result["type"]])
+
+    def submit_node(self, url, target):
+        """提交节点检测（同一 URL 与目标只提交一次）"""
+        key = (url, target)
+        if key in self.node_submitted:
+            return
+        self.node_submitted.add(key)
+        self.node_bar.total += 1
+        self.node_bar.refresh()
+        self.node_queue.put_nowait(key)
+
+    async def _sub_worker(self):
+        while True:
+            item = await self.sub_queue.get()
+            try:
+                await self.sub_limiter.acquire()
+                start = time.monotonic()
+                error = False
+                try:
+                    if isinstance(item, DomainGroup):
+                        error = await self._check_group(item)
+                    else:
+                        error = await self._check_sub(item)
+                except Exception:
+                    error = True
+                    raise
+                finally:
+                    self.sub_limiter.release(time.monotonic() - start, error=error)
+            finally:
+                self.sub_queue.task_done()
+
+    def _tombstoned(self, url):
+        """链接有有效墓碑时直接判定为无效，不发起请求"""
+        if not NEGATIVE_CACHE_ENABLED or not NEGATIVE_CACHE.is_dead(url):
+            return False
+        self.tombstoned += 1
+        self.sub_results[url] = None
+        self.sub_bar.update(1)
+        return True
+
+    async def _check_sub(self, url):
+        """检查单个链接，返回请求是否失败（超时 / 连接异常 / 限流，订阅按无效处理）"""
+        if self._tombstoned(url):
+            return False
+        start = time.monotonic()
+        self.sub_inflight.add(url)
+        error = False
+        try:
+            result = await checked_sub(url, self.session)
+        except SubCheckError as e:
+            logger.debug(f"订阅检查 {url} 失败: {e}")
+            result, error = None, True
+        finally:
+            self.sub_bar.update(1)
+        self.sub_inflight.discard(url)
+        record_sub_check(url, result, time.monotonic() - start)
+        self.sub_results[url] = result
+        if result:
+            self._passed(url, result)
+        return error
+
+    async def _check_group(self, group):
+        """
+        检查分组中优先级最高的链接；同分类的链接通过后跳过组内其余新链接，组内还有待检查的链接时继续占用名额。
+        返回请求是否失败（同 _check_sub）
+        """
+        url = group.pop()
+        while url is not None and self._tombstoned(url):
+            url = group.pop()
+        if url is None:
+            group.active -= 1
+            return False
+        start = time.monotonic()
+        self.sub_inflight.add(url)
+        error = False
+        try:
+            result = await checked_sub(url, self.session)
+        except SubCheckError as e:
+            logger.debug(f"订阅检查 {url} 失败: {e}")
+            result, error = None, True
+        except BaseException:
+            group.active -= 1
+            raise
+        finally:
+            self.sub_bar.update(1)
+        self.sub_inflight.discard(url)
+        record_sub_check(url, result, time.monotonic() - start)
+        self.sub_results[url] = result
+        if result:
+            self._passed(url, result)
+            # 通过的链接按其实际分类结束对应分组；分类与分组不同（内容已变化）时本组继续检查
+            self._won(url, result["type"])
+        if group.pending:
+            self.sub_queue.put_nowait(group)
+        else:
+            group.active -= 1
+        return error
+
+    async def _node_worker(self):
+        while True:
+            url, target = await self.node_queue.get()
+            try:
+                valid = local_node_verdict(self.sub_results.get(url), target)
+                if valid is None:
+                    await self.node_limiter.acquire()
+                    start = time.monotonic()
+                    error = False
+                    try:
+                        valid = await checked_node(url, target, self.session, self.batcher) is not None
+                    except BackendError as e:
+                        # 所有订阅转换后端均请求失败：按无效处理，并计入节点检测阶段的错误率
+                        logger.debug(f"节点检测 {url} 失败: {e}")
+                        valid, error = False, True
+                    except Exception:
+                        error = True
+                        raise
+                    finally:
+                        self.node_limiter.release(time.monotonic() - start, error=error)
+                else:
+                    self.local_verdicts += 1
+                self.node_results[(url, target)] = valid
+            finally:
+                self.node_bar.update(1)
+                self.node_queue.task_done()
+
+    async def _scrape_channel(self, channel):
+        return channel_key(channel), await get_channel_urls(channel, self.session, cursor=TG_CURSOR)
+
+    async def scrape_channels(self, timeout=None, yields=None):
+        """
+        并发抓取所有 Telegram 频道（t.me 的并发由连接池按主机限制），
+        每个频道的链接一经抓取立即提交订阅检查，返回 (去重后的 URL 列表, 未在 timeout 秒内完成的频道数)。
+        提供 yields（频道 id -> 历史产出）时按产出从高到低发起抓取，没有记录的频道最先抓取；
+        超时未完成的频道被取消，其游标不推进，下次运行重新抓取
+        """
+        tg_channels = get_config_channels('config.yaml')
+        if yields is not None:
+            tg_channels.sort(key=lambda channel: -yields.get(channel_key(channel), float('inf')))
+        tasks = [asyncio.create_task(self._scrape_channel(channel)) for channel in tg_channels]
         
-        tasks = [check_single(url) for url in urls]
-        for coro in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="订阅筛选"):
-            res = await coro
-            if res:
-                results.append(res)
-    return results
+        all_urls = set()
+        try:
+            for future in asyncio.as_completed(tasks, timeout=timeout):
+                key, urls = await future
+                urls = await self.canonicalize(urls)
+                self.scraped_channels.append(key)
+                all_urls.update(urls)
+                for url in urls:
+                    self.url_channels.setdefault(url, key)
+                    self.submit(url)
+        except asyncio.TimeoutError:
+            pass
+        unfinished = [task for task in tasks if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+        return list(all_urls), len(unfinished)
+
+    def channel_yields(self):
+        """本次抓取完成的各频道产出的有效订阅数 {频道 id: 数量}"""
+        counts = dict.fromkeys(self.scraped_channels, 0)
+        for url, key in self.url_channels.items():
+            if self.sub_results.get(url):
+                counts[key] += 1
+        return counts
+
+    async def wait_subscriptions(self):
+        await self.sub_queue.join()
 
-async def check_nodes(urls, target, session):
+    async def wait_nodes(self):
+        await self.node_queue.join()
+
+    def valid_nodes(self, urls, target):
+        """返回 urls 中节点检测有效的链接（保持原顺序）；开启 NODE_PROBE_DROP 时排除节点全部不可达的订阅"""
+        return [url for url in urls if self.node_results.get((url, target))
+                and not (NODE_PROBE_DROP and probe_unreachable(self.sub_results.get(url)))]
+
+def probe_unreachable(result):
+    """订阅的节点已全部探测（未被截止时间打断）且无一可达"""
+    summary = result.get("probe") if result else None
+    return bool(summary) and summary["probed"] == summary["nodes"] and not summary["reachable"]
+
+async def probe_subscription_nodes(sub_urls, sub_results, budget=NODE_PROBE_DEADLINE):
     """
-    异步检查每个订阅节点的有效性，
-    返回检测有效的节点 URL 列表
+    探测订阅中的去重节点，把可达比例与延迟中位数附加到订阅检查结果的 "probe" 字段并写入状态库；
+    节点全部不可达的订阅在第六步不写入输出文件（见 NODE_PROBE_DROP）
     """
-    if not urls:
-        return []
-    
-    valid_urls = []
-    # 使用信号量限制并发数
-    semaphore = asyncio.Semaphore(20)  # 节点检测并发数较低，避免被封
-    
-    async def check_single_node(url):
-        async with semaphore:
-            return await url_check_valid(url, target, session)
-    
-    tasks = [check_single_node(url) for url in urls]
-    for coro in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc=f"检测{target}节点"):
-        res = await coro
-        if res:
-            valid_urls.append(res)
-    return valid_urls
+    prober = NodeProber(deadline=budget, tls=NODE_PROBE_TLS)
+    latencies = await prober.probe_all(NODE_INDEX.nodes(sub_urls))
+    prober.report()
+    summaries = {}
+    for url in sub_urls:
+        summary = summarize(NODE_INDEX.subs.get(url, ()), latencies)
+        if summary and sub_results.get(url):
+            summaries[url] = summary
+            latency = f"{summary['latency'] * 1000:.0f}ms" if summary["latency"] is not None else "-"
+            logger.debug(f"   {url}: 可达 {summary['reachable']}/{summary['probed']} "
+                         f"({summary['ratio']:.0%}), 延迟中位数 {latency}")
+    STATE_STORE.record_probes(summaries)
+    if summaries and not prober.reachable:
+        # 没有任何节点可达多半是本机网络问题，不据此排除订阅
+        logger.warning("📶 探测的节点全部不可达，本次不按探测结果排除订阅")
+        return
+    for url, summary in summaries.items():
+        sub_results[url]["probe"] = summary
+    unreachable = sum(1 for url in summaries if probe_unreachable(sub_results[url]))
+    if unreachable:
+        logger.info(f"📶 {unreachable} 个订阅的节点全部不可达"
+                    + ("，不写入节点检测后的输出文件" if NODE_PROBE_DROP else ""))
+
+def collect_run_metrics(pipeline, session, deadline=None):
+    """
+    汇总连接池、订阅转换路由、流水线与截止时间模式（推迟的工作量）的统计到本次运行指标；
+    请求数最多的 METRICS_TOP_HOSTS 个主机单独列出
+    """
+    ranked = sorted(session.stats, key=lambda host: session.stats[host].requests, reverse=True)
+    shown = set(ranked[:METRICS_TOP_HOSTS])
+    other = Histogram()
+    for host, stats in session.stats.items():
+        label = host if host in shown else "other"
+        RUN_METRICS.count('http_requests_total', label, stats.requests)
+        RUN_METRICS.count('http_bytes_total', label, stats.bytes)
+        RUN_METRICS.count('http_timeouts_total', label, stats.timeouts)
+        RUN_METRICS.count('http_errors_total', label, stats.errors)
+        if host in shown:
+            RUN_METRICS.histogram('http_request_duration_seconds', host, session.latencies[host])
+        else:
+            other.merge(session.latencies[host])
+    if other.count:
+        RUN_METRICS.histogram('http_request_duration_seconds', "other", other)
+    for name, backend in CONVERTER_ROUTER.backends.items():
+        RUN_METRICS.set('converter_requests_total', name, backend.requests)
+        RUN_METRICS.set('converter_wins_total', name, CONVERTER_ROUTER.wins[name])
+        RUN_METRICS.set('converter_errors_total', name, backend.errors)
+    RUN_METRICS.set('checks_total', "sub", len(pipeline.sub_results))
+    RUN_METRICS.set('checks_total', "node_local", pipeline.local_verdicts)
+    RUN_METRICS.set('checks_total', "node_remote", len(pipeline.node_results) - pipeline.local_verdicts)
+    RUN_METRICS.set('checks_total', "group_skipped", pipeline.group_skipped)
+    RUN_METRICS.set('checks_total', "tombstoned", pipeline.tombstoned)
+    RUN_METRICS.set('checks_total', "recheck_reused", pipeline.reused)
+    RUN_METRICS.set('checks_total', "canonical_collapsed", pipeline.urls.collapsed)
+    RUN_METRICS.set('checks_total', "redirect_resolved", REDIRECT_CACHE.resolved)
+    if deadline:
+        for stage, count in deadline.deferred.items():
+            RUN_METRICS.set('deferred_total', stage, count)
+    RUN_METRICS.finish()
 
 def write_url_list(url_list, file_path):
     """将 URL 列表写入文本文件"""
@@ -405,10 +1173,8 @@ def deduplicate_urls_by_domain(url_list):
 # -------------------------------
 # 主函数入口
 # -------------------------------
-async def validate_existing_subscriptions(config, session):
-    """验证现有订阅的有效性，移除失效订阅"""
-    logger.info("🔍 开始验证现有订阅的有效性...")
-    
+def extract_existing_urls(config):
+    """提取配置中所有现有订阅 URL，返回 (url, category) 列表"""
     all_existing_urls = []
     
     # 提取所有现有订阅URL
@@ -424,26 +1190,24 @@ async def validate_existing_subscriptions(config, session):
             if url_match:
                 all_existing_urls.append((url_match.group(), "开心玩耍"))
     
-    if not all_existing_urls:
-        logger.info("📝 没有现有订阅需要验证")
-        return {"机场订阅": [], "clash订阅": [], "v2订阅": [], "开心玩耍": []}
-    
-    logger.info(f"📊 需要验证 {len(all_existing_urls)} 个现有订阅")
-    
-    # 使用信号量限制并发
-    semaphore = asyncio.Semaphore(30)
-    
-    async def check_single_existing(url_info):
-        url, category = url_info
-        async with semaphore:
-            result = await sub_check(url, session)
-            return (url, category, result)
-    
+    return all_existing_urls
+
+def carry_deferred_existing(config, deferred, valid_existing):
+    """截止时间前未完成检查的现有订阅按原分类保留，下次运行再检查"""
+    for category in ["机场订阅", "clash订阅", "v2订阅"]:
+        valid_existing[category] += [url.strip() for url in config.get(category, [])
+                                     if isinstance(url, str) and url.strip() in deferred]
+    valid_existing["开心玩耍"] += [entry.strip() for entry in config.get("开心玩耍", [])
+                                 if play_url(entry) in deferred]
+
+def collect_valid_existing(all_existing_urls, sub_results):
+    """根据订阅检查结果筛选仍然有效的现有订阅"""
     valid_existing = {"机场订阅": [], "clash订阅": [], "v2订阅": [], "开心玩耍": []}
-    tasks = [check_single_existing(url_info) for url_info in all_existing_urls]
+    if not all_existing_urls:
+        return valid_existing
     
-    for coro in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="验证现有订阅"):
-        url, category, result = await coro
+    for url, category in all_existing_urls:
+        result = sub_results.get(url)
         if result:
             if result["type"] == "机场订阅":
                 valid_existing["机场订阅"].append(url)
@@ -462,14 +1226,25 @@ async def validate_existing_subscriptions(config, session):
     
     return valid_existing
 
-async def main():
+async def main(deadline_seconds=None):
     config_path = 'config.yaml'
+    deadline = Deadline(deadline_seconds) if deadline_seconds else None
     
     logger.info("🚀 开始订阅管理流程...")
     logger.info("=" * 60)
     
-    # 加载现有配置
+    # 加载现有配置：config.yaml 中的列表（包括手动添加 / 删除的链接）先同步到订阅状态库
     config = load_yaml_config(config_path)
+    STATE_STORE.open()
+    NEGATIVE_CACHE.load(STATE_STORE.db)
+    REDIRECT_CACHE.load(STATE_STORE.db)
+    added, removed = STATE_STORE.sync_config(config)
+    if added or removed:
+        logger.info(f"从 {config_path} 同步到订阅状态库: 加入 {added} 个链接, 移出 {removed} 个链接")
+    config = STATE_STORE.export(config.get("tgchannel") or [])
+    SUB_CACHE.load()
+    TG_CURSOR.load()
+    NODE_INDEX.load()
     
     # 统计原始数据
     original_counts = {}
@@ -480,154 +1255,291 @@ async def main():
     for category, count in original_counts.items():
         logger.info(f"   {category}: {count:,} 个")
     
-    # 创建优化的会话
-    connector = aiohttp.TCPConnector(
-        limit=100,
-        limit_per_host=20,
-        ttl_dns_cache=300,
-        use_dns_cache=True,
-    )
-    timeout = aiohttp.ClientTimeout(total=30, connect=10)
+    # 创建共享的连接池（所有请求复用连接与 DNS 缓存）
+    async with SessionPool(limit=200, limit_per_host=20, host_limits=HOST_LIMITS,
+                           host_rates=HOST_RATES) as session:
+        # 第一~三步与第六步以流水线方式重叠执行：订阅一经识别即开始节点检测
+        pipeline = SubscriptionPipeline(session)
+        pipeline.start()
+        watcher = asyncio.create_task(RUN_METRICS.watch({"sub": pipeline.sub_queue, "node": pipeline.node_queue}))
+        try:
+            await run_stages(config, config_path, original_counts, pipeline, deadline)
+        finally:
+            watcher.cancel()
+            await pipeline.stop()
+            await RUN_MEMO.close()
+    RUN_MEMO.report()
+    CONVERTER_ROUTER.report()
+    if pipeline.batcher:
+        pipeline.batcher.report()
+    report_limiters("各阶段自适应并发", [pipeline.sub_limiter, pipeline.node_limiter])
+    session.report()
+    collect_run_metrics(pipeline, session, deadline)
+    RUN_METRICS.report()
+    RUN_METRICS.write()
+    if deadline:
+        deadline.report()
+    STATE_STORE.report()
+    NEGATIVE_CACHE.report()
+    NEGATIVE_CACHE.flush()
+    REDIRECT_CACHE.report()
+    REDIRECT_CACHE.flush()
+    STATE_STORE.close()
     
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        
-        # 第一步：验证现有订阅
-        logger.info("\n🔍 第一步：验证现有订阅")
-        logger.info("-" * 40)
-        valid_existing = await validate_existing_subscriptions(config, session)
-        
-        # 第二步：获取新的订阅链接
-        logger.info("\n📡 第二步：获取新的订阅链接")
-        logger.info("-" * 40)
-        today_urls = await update_today_sub(session)
-        logger.info(f"📥 从 Telegram 频道获得 {len(today_urls)} 个新链接")
-        
-        # 第三步：检查新订阅的有效性
-        logger.info("\n🔍 第三步：检查新订阅有效性")
-        logger.info("-" * 40)
-        new_results = await check_subscriptions(today_urls)
-        
-        # 分类新订阅
-        new_subs = [res["url"] for res in new_results if res and res["type"] == "机场订阅"]
-        new_clash = [res["url"] for res in new_results if res and res["type"] == "clash订阅"]
-        new_v2 = [res["url"] for res in new_results if res and res["type"] == "v2订阅"]
-        new_play = [f'{res["info"]} {res["url"]}' for res in new_results 
-                   if res and res["type"] == "机场订阅" and res["info"]]
-        
-        logger.info(f"✅ 新增有效订阅: 机场{len(new_subs)}个, clash{len(new_clash)}个, v2{len(new_v2)}个")
-        
-        # 第四步：合并有效订阅
-        logger.info("\n🔄 第四步：合并有效订阅")
-        logger.info("-" * 40)
-        
-        # 1. 初步合并和去重 (set() 自动去重)
-        merged_subs = sorted(list(set(valid_existing["机场订阅"] + new_subs)))
-        merged_clash = sorted(list(set(valid_existing["clash订阅"] + new_clash)))
-        merged_v2 = sorted(list(set(valid_existing["v2订阅"] + new_v2)))
-        merged_play = sorted(list(set(valid_existing["开心玩耍"] + new_play)))
-        
-        # 2. **新增：主域名去重**
-        logger.info("开始对 '机场订阅' 列表进行主域名去重...")
-        final_subs_deduped = deduplicate_urls_by_domain(merged_subs)
-        
-        # '开心玩耍' 包含流量信息，也需要去重
-        logger.info("开始对 '开心玩耍' 列表进行主域名去重...")
-        final_play_deduped = deduplicate_urls_by_domain(merged_play)
-        
-        # clash 和 v2 在这里不需要去重，因为它们会在第六步生成输出文件时再次去重
-        # 但为了保证 config.yaml 本身是干净的，也进行去重
-        logger.info("开始对 'clash订阅' 列表进行主域名去重...")
-        final_clash_deduped = deduplicate_urls_by_domain(merged_clash)
-        
-        logger.info("开始对 'v2订阅' 列表进行主域名去重...")
-        final_v2_deduped = deduplicate_urls_by_domain(merged_v2)
-        
-        final_config = {
-            "机场订阅": final_subs_deduped,
-            "clash订阅": final_clash_deduped,
-            "v2订阅": final_v2_deduped,
-            "开心玩耍": final_play_deduped,
-            "tgchannel": config.get("tgchannel", [])  # 保留频道配置
-        }
-        
-        # 统计最终结果
-        logger.info("📈 最终统计对比:")
-        total_original = sum(original_counts.values())
-        total_final = sum(len(final_config[cat]) for cat in ["机场订阅", "clash订阅", "v2订阅", "开心玩耍"])
-        
-        for category in ["机场订阅", "clash订阅", "v2订阅", "开心玩耍"]:
-            original = original_counts[category]
-            final = len(final_config[category])
-            change = final - original
-            change_str = f"(+{change})" if change > 0 else f"({change})" if change < 0 else "(=)"
-            logger.info(f"   {category}: {original:,} → {final:,} {change_str}")
-        
-        logger.info(f"📊 总体: {total_original:,} → {total_final:,} "
-                   f"(清理率: {(total_original-total_final)/total_original*100:.1f}%)")
-        
-        # 保存更新后的配置
-        save_yaml_config(final_config, config_path)
-        logger.info("💾 配置文件已更新")
+    logger.info("\n🎉 订阅管理流程完成！")
+    logger.info("=" * 60)
+
+async def run_stages(config, config_path, original_counts, pipeline, deadline=None):
+    """
+    依次推进各步骤；节点检测在后台随订阅检查结果同步进行。
+    提供 deadline 时各阶段在其截止时间取消未完成的工作，已完成的结果照常合并写入，
+    未检查的现有订阅保留在原分类，未检查的新链接记入状态库，下次运行优先检查
+    """
+    # 第一步：验证现有订阅
+    RUN_METRICS.mark("verify_existing")
+    logger.info("\n🔍 第一步：验证现有订阅")
+    logger.info("-" * 40)
+    all_existing_urls = extract_existing_urls(config)
+    if all_existing_urls:
+        logger.info(f"📊 需要验证 {len(all_existing_urls)} 个现有订阅")
+    else:
+        logger.info("📝 没有现有订阅需要验证")
+    existing = await pipeline.canonicalize([url for url, _ in all_existing_urls])
+    # 开心玩耍中的链接属于机场订阅
+    existing_categories = {pipeline.urls.alias(url): "机场订阅" if category == "开心玩耍" else category
+                           for url, category in all_existing_urls}
+    if RECHECK_ENABLED:
+        existing, fresh, _ = plan_rechecks(existing, STATE_STORE.history, time.time(), RECHECK_BUDGET)
+        # 没有可沿用结果的订阅仍需检查
+        existing += [url for url in fresh if not pipeline.reuse(url)]
+    for url in existing:
+        pipeline.submit(url, preferred=True, category=existing_categories.get(url))
+    
+    # 第二步：获取新的订阅链接（与订阅检查同时进行）
+    RUN_METRICS.mark("scrape_channels")
+    logger.info("\n📡 第二步：获取新的订阅链接")
+    logger.info("-" * 40)
+    # 上次运行因截止时间推迟检查的新链接
+    deferred_urls = await pipeline.canonicalize(STATE_STORE.deferred)
+    for url in deferred_urls:
+        pipeline.submit(url)
+    if deadline:
+        today_urls, unfinished = await pipeline.scrape_channels(deadline.left("check_subscriptions"),
+                                                                STATE_STORE.channel_yields)
+        deadline.defer("scrape_channels", unfinished)
+    else:
+        today_urls, _ = await pipeline.scrape_channels()
+    STATE_STORE.seen(today_urls)
+    logger.info(f"📥 从 Telegram 频道获得 {len(today_urls)} 个新链接")
+    today_urls = list(dict.fromkeys(today_urls + deferred_urls))
+    
+    # 第三步：等待订阅检查完成
+    RUN_METRICS.mark("check_subscriptions")
+    logger.info("\n🔍 第三步：检查新订阅有效性")
+    logger.info("-" * 40)
+    deferred = set()
+    try:
+        await asyncio.wait_for(pipeline.wait_subscriptions(),
+                               deadline.left("check_subscriptions") if deadline else None)
+    except asyncio.TimeoutError:
+        deferred = await pipeline.cancel_subscriptions()
+        deadline.defer("check_subscriptions", len(deferred))
+        logger.warning(f"⏱️ 订阅检查到达截止时间，{len(deferred)} 个链接推迟到下次运行")
+    if DOMAIN_GROUP_CHECK:
+        logger.info(f"🧷 按域名分组检查: {len(pipeline.groups)} 个 (域名, 分类) 分组, "
+                    f"跳过 {pipeline.group_skipped} 个同域名链接")
+    if pipeline.reused:
+        logger.info(f"🗓️ 沿用上次检查结果 {pipeline.reused} 个未到复查时间的现有订阅")
+    if pipeline.tombstoned:
+        logger.info(f"🪦 跳过 {pipeline.tombstoned} 个墓碑有效期内的失效链接")
+    pipeline.urls.report()
+    STATE_STORE.flush()
+    NEGATIVE_CACHE.flush()
+    REDIRECT_CACHE.flush()
+    # 现有订阅改用代表链接：重复的写法合并为一个，短链接替换为跳转目标
+    all_existing_urls = [(pipeline.urls.alias(url), category) for url, category in all_existing_urls]
+    STATE_STORE.set_deferred(sorted(deferred.difference(url for url, _ in all_existing_urls)))
+    STATE_STORE.record_channel_yields(pipeline.channel_yields())
+    valid_existing = collect_valid_existing(all_existing_urls, pipeline.sub_results)
+    if deferred:
+        aliases = pipeline.urls.aliases
+        carry_deferred_existing(config, deferred.union(url for url in aliases if aliases[url] in deferred),
+                                valid_existing)
+    new_results = [pipeline.sub_results[url] for url in today_urls if pipeline.sub_results.get(url)]
+    
+    # 分类新订阅
+    new_subs = [res["url"] for res in new_results if res and res["type"] == "机场订阅"]
+    new_clash = [res["url"] for res in new_results if res and res["type"] == "clash订阅"]
+    new_v2 = [res["url"] for res in new_results if res and res["type"] == "v2订阅"]
+    new_play = [f'{res["info"]} {res["url"]}' for res in new_results 
+               if res and res["type"] == "机场订阅" and res["info"]]
+    
+    logger.info(f"✅ 新增有效订阅: 机场{len(new_subs)}个, clash{len(new_clash)}个, v2{len(new_v2)}个")
+    
+    # 第四步：合并有效订阅
+    RUN_METRICS.mark("merge")
+    logger.info("\n🔄 第四步：合并有效订阅")
+    logger.info("-" * 40)
+    
+    # 1. 初步合并和去重 (set() 自动去重)
+    merged_subs = sorted(list(set(valid_existing["机场订阅"] + new_subs)))
+    merged_clash = sorted(list(set(valid_existing["clash订阅"] + new_clash)))
+    merged_v2 = sorted(list(set(valid_existing["v2订阅"] + new_v2)))
+    merged_play = sorted(list(set(valid_existing["开心玩耍"] + new_play)))
+    
+    # 2. **新增：主域名去重**
+    logger.info("开始对 '机场订阅' 列表进行主域名去重...")
+    final_subs_deduped = deduplicate_urls_by_domain(merged_subs)
+    
+    # '开心玩耍' 包含流量信息，也需要去重
+    logger.info("开始对 '开心玩耍' 列表进行主域名去重...")
+    final_play_deduped = deduplicate_urls_by_domain(merged_play)
+    
+    # clash 和 v2 在这里不需要去重，因为它们会在第六步生成输出文件时再次去重
+    # 但为了保证 config.yaml 本身是干净的，也进行去重
+    logger.info("开始对 'clash订阅' 列表进行主域名去重...")
+    final_clash_deduped = deduplicate_urls_by_domain(merged_clash)
+    
+    logger.info("开始对 'v2订阅' 列表进行主域名去重...")
+    final_v2_deduped = deduplicate_urls_by_domain(merged_v2)
+    
+    # 内容相同的镜像订阅只保留代表链接：在域名去重之后进行，代表链接从去重后仍保留的链接中选取，
+    # 避免代表链接在域名去重中被同域名的其他链接替换、而其余镜像已被省略，导致这份内容整体消失
+    if MIRROR_COLLAPSE:
+        existing_urls = [url for url, _ in all_existing_urls]
+        survivors = set(final_subs_deduped + final_clash_deduped + final_v2_deduped)
+        survivors.update(play_url(entry) for entry in final_play_deduped)
+        BODY_STORE.report(existing_urls, survivors)
+        redundant = BODY_STORE.redundant(existing_urls, survivors)
+        final_subs_deduped = [url for url in final_subs_deduped if url not in redundant]
+        final_clash_deduped = [url for url in final_clash_deduped if url not in redundant]
+        final_v2_deduped = [url for url in final_v2_deduped if url not in redundant]
+        final_play_deduped = [entry for entry in final_play_deduped if play_url(entry) not in redundant]
+        RUN_METRICS.set('checks_total', "mirror_collapsed", len(redundant))
+    
+    final_config = {
+        "机场订阅": final_subs_deduped,
+        "clash订阅": final_clash_deduped,
+        "v2订阅": final_v2_deduped,
+        "开心玩耍": final_play_deduped,
+        "tgchannel": config.get("tgchannel", [])  # 保留频道配置
+    }
+    
+    # 统计最终结果
+    logger.info("📈 最终统计对比:")
+    total_original = sum(original_counts.values())
+    total_final = sum(len(final_config[cat]) for cat in ["机场订阅", "clash订阅", "v2订阅", "开心玩耍"])
+    
+    for category in ["机场订阅", "clash订阅", "v2订阅", "开心玩耍"]:
+        original = original_counts[category]
+        final = len(final_config[category])
+        change = final - original
+        change_str = f"(+{change})" if change > 0 else f"({change})" if change < 0 else "(=)"
+        logger.info(f"   {category}: {original:,} → {final:,} {change_str}")
+    
+    logger.info(f"📊 总体: {total_original:,} → {total_final:,} "
+               f"(清理率: {(total_original-total_final)/total_original*100:.1f}%)")
+    
+    for category in ["机场订阅", "clash订阅", "v2订阅", "开心玩耍"]:
+        RUN_METRICS.set('config_urls', category, len(final_config[category]))
+    
+    # 保存更新后的配置：先写入状态库，再由状态库导出 config.yaml
+    STATE_STORE.set_lists(final_config)
+    save_yaml_config(STATE_STORE.export(final_config["tgchannel"]), config_path)
+    SUB_CACHE.save()
+    TG_CURSOR.save()
+    if NODE_INDEX_ENABLED:
+        NODE_INDEX.save()
+    logger.info("💾 配置文件已更新")
+    
+    # 第五步：生成输出文件
+    RUN_METRICS.mark("write_outputs")
+    logger.info("\n📝 第五步：生成输出文件")
+    logger.info("-" * 40)
+    
+    # 写入订阅存储文件
+    sub_store_file = config_path.replace('.yaml', '_sub_store.txt')
+    content = ("-- play_list --\n\n" + 
+              "\n".join(final_config["开心玩耍"]) + 
+              "\n\n-- sub_list --\n\n" + 
+              "\n".join(final_config["机场订阅"]))
+    with open(sub_store_file, 'w', encoding='utf-8') as f:
+        f.write(content)
+    logger.info(f"📄 订阅存储文件已保存: {sub_store_file}")
+    
+    # 合并去重后的节点（节点级去重，下游无需再处理重复节点）
+    if NODE_INDEX_ENABLED:
+        sub_urls = final_config["机场订阅"] + final_config["clash订阅"] + final_config["v2订阅"]
+        NODE_INDEX.report(sub_urls)
+        NODE_INDEX.write(sub_urls, config_path.replace('.yaml', '_nodes.txt'),
+                         config_path.replace('.yaml', '_nodes.yaml'))
+        budget = min(NODE_PROBE_DEADLINE, deadline.left("probe_nodes")) if deadline else NODE_PROBE_DEADLINE
+        if NODE_PROBE_ENABLED and budget > 0:
+            RUN_METRICS.mark("probe_nodes")
+            await probe_subscription_nodes(sub_urls, pipeline.sub_results, budget)
+        elif NODE_PROBE_ENABLED:
+            deadline.defer("probe_nodes", len(sub_urls))
+    
+    # 第六步：检测节点有效性
+    RUN_METRICS.mark("check_nodes")
+    logger.info("\n🔍 第六步：检测节点有效性")
+    logger.info("-" * 40)
+    
+    # 节点检测已随订阅识别在后台进行，此处补齐并等待全部完成
+    for category, target in NODE_TARGETS.items():
+        for url in final_config[category]:
+            pipeline.submit_node(url, target)
+    try:
+        await asyncio.wait_for(pipeline.wait_nodes(), deadline.left("check_nodes") if deadline else None)
+    except asyncio.TimeoutError:
+        unchecked = await pipeline.cancel_nodes()
+        deadline.defer("check_nodes", unchecked)
+        logger.warning(f"⏱️ 节点检测到达截止时间，{unchecked} 个检测推迟到下次运行")
+    logger.info(f"🧩 节点检测: 本地解析判定 {pipeline.local_verdicts} 个, "
+                f"订阅转换后端检测 {len(pipeline.node_results) - pipeline.local_verdicts} 个")
+    
+    # 检测机场订阅节点
+    if final_config["机场订阅"]:
+        valid_loon = pipeline.valid_nodes(final_config["机场订阅"], "loon")
         
-        # 第五步：生成输出文件
-        logger.info("\n📝 第五步：生成输出文件")
-        logger.info("-" * 40)
+        # --- 新增去重逻辑 ---
+        if valid_loon:
+            logger.info("开始对 loon 订阅链接进行主域名去重...")
+            valid_loon = deduplicate_urls_by_domain(valid_loon)
+        # --------------------
         
-        # 写入订阅存储文件
-        sub_store_file = config_path.replace('.yaml', '_sub_store.txt')
-        content = ("-- play_list --\n\n" + 
-                  "\n".join(final_config["开心玩耍"]) + 
-                  "\n\n-- sub_list --\n\n" + 
-                  "\n".join(final_config["机场订阅"]))
-        with open(sub_store_file, 'w', encoding='utf-8') as f:
-            f.write(content)
-        logger.info(f"📄 订阅存储文件已保存: {sub_store_file}")
+        loon_file = config_path.replace('.yaml', '_loon.txt')
+        write_url_list(valid_loon, loon_file)
+    
+    # 检测clash订阅节点
+    if final_config["clash订阅"]:
+        valid_clash = pipeline.valid_nodes(final_config["clash订阅"], "clash")
         
-        # 第六步：检测节点有效性
-        logger.info("\n🔍 第六步：检测节点有效性")
-        logger.info("-" * 40)
+        # --- 新增去重逻辑 ---
+        if valid_clash:
+            logger.info("开始对 clash 订阅链接进行主域名去重...")
+            valid_clash = deduplicate_urls_by_domain(valid_clash)
+        # --------------------
         
-        # 检测机场订阅节点
-        if final_config["机场订阅"]:
-            valid_loon = await check_nodes(final_config["机场订阅"], "loon", session)
-            
-            # --- 新增去重逻辑 ---
-            if valid_loon:
-                logger.info("开始对 loon 订阅链接进行主域名去重...")
-                valid_loon = deduplicate_urls_by_domain(valid_loon)
-            # --------------------
-            
-            loon_file = config_path.replace('.yaml', '_loon.txt')
-            write_url_list(valid_loon, loon_file)
+        clash_file = config_path.replace('.yaml', '_clash.txt')
+        write_url_list(valid_clash, clash_file)
+    
+    # 检测v2订阅节点
+    if final_config["v2订阅"]:
+        valid_v2 = pipeline.valid_nodes(final_config["v2订阅"], "v2ray")
         
-        # 检测clash订阅节点
-        if final_config["clash订阅"]:
-            valid_clash = await check_nodes(final_config["clash订阅"], "clash", session)
-            
-            # --- 新增去重逻辑 ---
-            if valid_clash:
-                logger.info("开始对 clash 订阅链接进行主域名去重...")
-                valid_clash = deduplicate_urls_by_domain(valid_clash)
-            # --------------------
-            
-            clash_file = config_path.replace('.yaml', '_clash.txt')
-            write_url_list(valid_clash, clash_file)
+        # --- 新增去重逻辑 ---
+        if valid_v2:
+            logger.info("开始对 v2 订阅链接进行主域名去重...")
+            valid_v2 = deduplicate_urls_by_domain(valid_v2)
+        # --------------------
         
-        # 检测v2订阅节点
-        if final_config["v2订阅"]:
-            valid_v2 = await check_nodes(final_config["v2订阅"], "v2ray", session)
-            
-            # --- 新增去重逻辑 ---
-            if valid_v2:
-                logger.info("开始对 v2 订阅链接进行主域名去重...")
-                valid_v2 = deduplicate_urls_by_domain(valid_v2)
-            # --------------------
-            
-            v2_file = config_path.replace('.yaml', '_v2.txt')
-            write_url_list(valid_v2, v2_file)
-    
-    logger.info("\n🎉 订阅管理流程完成！")
-    logger.info("=" * 60)
+        v2_file = config_path.replace('.yaml', '_v2.txt')
+        write_url_list(valid_v2, v2_file)
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="收集 Telegram 频道中的订阅链接并检查有效性")
+    parser.add_argument('--deadline', type=float, default=None, metavar='SECONDS',
+                        help="整轮运行的时间预算（秒）：各阶段按比例分配时间，到期取消未完成的工作并照常保存结果")
+    args = parser.parse_args()
+    asyncio.run(main(args.deadline))
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import asyncio
+from bisect import bisect_left
+from collections import defaultdict
+from loguru import logger
+
+# 单次运行的结构化指标：各阶段耗时、按主机的请求数 / 延迟直方图 / 流量 / 超时、重试次数、
+# 订阅转换后端命中分布与队列深度，运行结束时写入 JSON 与 Prometheus textfile（node_exporter 文本采集格式），
+# 随 cache/ 一起提交，便于观察 config.yaml 增长带来的耗时变化
+METRICS_JSON_PATH = 'cache/metrics.json'
+METRICS_PROM_PATH = 'cache/metrics.prom'
+METRICS_PREFIX = 'collectsub_'
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)  # 延迟直方图上界（秒）
+QUEUE_SAMPLE_INTERVAL = 1.0  # 队列深度采样间隔（秒）
+
+# 指标名 -> (Prometheus 类型, 标签名, 说明)；标签名为 None 表示无标签
+METRICS = {
+    'run_seconds': ('gauge', None, '整轮运行耗时（秒）'),
+    'stage_seconds': ('gauge', 'stage', '各阶段耗时（秒）'),
+    'config_urls': ('gauge', 'category', '运行结束时 config.yaml 各分类的链接数'),
+    'checks_total': ('counter', 'kind', '各类检查的次数'),
+    'http_requests_total': ('counter', 'host', '按主机的请求数'),
+    'http_bytes_total': ('counter', 'host', '按主机接收的响应体字节数'),
+    'http_timeouts_total': ('counter', 'host', '按主机的超时次数'),
+    'http_errors_total': ('counter', 'host', '按主机的连接失败等其他异常次数'),
+    'http_request_duration_seconds': ('histogram', 'host', '按主机收到响应头的耗时（秒）'),
+    'retries_total': ('counter', 'stage', '各阶段的重试次数'),
+    'timeouts_total': ('counter', 'stage', '各阶段的超时次数'),
+    'converter_requests_total': ('counter', 'backend', '订阅转换后端收到的请求数'),
+    'converter_wins_total': ('counter', 'backend', '订阅转换后端结果被采用的次数'),
+    'converter_errors_total': ('counter', 'backend', '订阅转换后端的传输错误次数'),
+    'deferred_total': ('counter', 'stage', '截止时间模式下推迟到下次运行的工作数'),
+    'queue_depth_max': ('gauge', 'queue', '队列深度峰值'),
+    'queue_depth_mean': ('gauge', 'queue', '队列深度平均值'),
+}
+
+
+class Histogram:
+    """固定上界的累计直方图（与 Prometheus histogram 相同的桶语义）"""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        """按桶估算分位数（返回所在桶的上界），没有样本时返回 None"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def cumulative(self):
+        """[(上界字符串, 累计数)]，含 +Inf"""
+        rows, seen = [], 0
+        for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), self.counts):
+            seen += count
+            rows.append(('+Inf' if bound == float('inf') else repr(bound), seen))
+        return rows
+
+    def to_dict(self):
+        p50, p99 = self.quantile(0.5), self.quantile(0.99)
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "p50": p50 if p50 != float('inf') else None,
+            "p99": p99 if p99 != float('inf') else None,
+            "buckets": dict(self.cumulative()),
+        }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class RunMetrics:
+    """
+    本次运行的指标汇总：
+      - mark(stage) 结束上一阶段并开始计时下一阶段，finish() 结束最后一个阶段
+      - count / set 记录带单个标签的计数与数值，histogram 记录直方图
+      - watch(queues) 在后台定期采样队列深度
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.clock = time.monotonic()
+        self.stage = None
+        self.stage_start = None
+        self.values = defaultdict(dict)       # 指标名 -> {标签值: 数值}
+        self.histograms = defaultdict(dict)   # 指标名 -> {标签值: Histogram}
+        self.depths = {}                      # 队列名 -> [峰值, 累计, 采样次数]
+
+    def mark(self, stage):
+        now = time.monotonic()
+        if self.stage is not None:
+            self.count('stage_seconds', self.stage, now - self.stage_start)
+        self.stage, self.stage_start = stage, now
+
+    def finish(self):
+        self.mark(None)
+        self.set('run_seconds', None, time.monotonic() - self.clock)
+        for queue, (peak, total, samples) in self.depths.items():
+            self.set('queue_depth_max', queue, peak)
+            self.set('queue_depth_mean', queue, round(total / samples, 2))
+
+    def count(self, metric, label, value=1):
+        series = self.values[metric]
+        series[label] = series.get(label, 0) + value
+
+    def set(self, metric, label, value):
+        self.values[metric][label] = value
+
+    def histogram(self, metric, label, histogram):
+        self.histograms[metric][label] = histogram
+
+    def sample(self, queue, depth):
+        entry = self.depths.setdefault(queue, [0, 0, 0])
+        entry[0] = max(entry[0], depth)
+        entry[1] += depth
+        entry[2] += 1
+
+    async def watch(self, queues, interval=QUEUE_SAMPLE_INTERVAL):
+        """定期采样 {队列名: asyncio.Queue} 的深度，直到被取消"""
+        while True:
+            for name, queue in queues.items():
+                self.sample(name, queue.qsize())
+            await asyncio.sleep(interval)
+
+    # -------------------------------
+    # 输出
+    # -------------------------------
+    def to_dict(self):
+        def unlabeled(series):
+            return series[None] if list(series) == [None] else series
+
+        return {
+            "timestamp": int(self.started),
+            "metrics": {metric: unlabeled({label: round(value, 3) if isinstance(value, float) else value
+                                           for label, value in series.items()})
+                        for metric, series in self.values.items()},
+            "histograms": {metric: {label: histogram.to_dict() for label, histogram in series.items()}
+                           for metric, series in self.histograms.items()},
+        }
+
+    def to_prometheus(self):
+        lines = []
+        for metric, (kind, label_name, help_text) in METRICS.items():
+            series = self.values.get(metric) or self.histograms.get(metric)
+            if not series:
+                continue
+            name = METRICS_PREFIX + metric
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for label, value in sorted(series.items(), key=lambda item: str(item[0])):
+                labels = f'{label_name}="{_escape(label)}"' if label_name else ''
+                if kind != 'histogram':
+                    lines.append(f"{name}{{{labels}}} {_format(value)}" if labels else f"{name} {_format(value)}")
+                    continue
+                for bound, count in value.cumulative():
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {_format(value.sum)}")
+                lines.append(f"{name}_count{{{labels}}} {value.count}")
+        lines.append(f"# TYPE {METRICS_PREFIX}last_run_timestamp_seconds gauge")
+        lines.append(f"{METRICS_PREFIX}last_run_timestamp_seconds {int(self.started)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path=METRICS_JSON_PATH, prom_path=METRICS_PROM_PATH):
+        for path in (json_path, prom_path):
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+        # textfile 采集器可能随时读取，先写临时文件再替换
+        with open(prom_path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(prom_path + '.tmp', prom_path)
+        logger.info(f"📈 运行指标已保存到 {json_path} 与 {prom_path}")
+
+    def report(self):
+        stages = self.values.get('stage_seconds')
+        if not stages:
+            return
+        run = self.values.get('run_seconds', {}).get(None, 0)
+        logger.info(f"⏱️ 各阶段耗时 (合计 {run:.1f}s):")
+        for stage, seconds in stages.items():
+            logger.info(f"   {stage}: {seconds:.1f}s")
@@ -0,0 +1,96 @@
+import time
+import socket
+import aiohttp
+from loguru import logger
+
+# 失效链接的负缓存：返回 403 / 404 / 410、域名不存在 (NXDOMAIN) 或所有尝试均超时的订阅写入墓碑，
+# 墓碑有效期随连续失效次数指数增长，有效期内的链接不再检查；与订阅状态库共用同一个 SQLite 文件
+TOMBSTONE_BASE_TTL = 6 * 3600        # 第一次失效的墓碑有效期（秒），之后每次连续失效翻倍
+TOMBSTONE_MAX_TTL = 30 * 24 * 3600   # 墓碑有效期上限
+DEAD_STATUS = (403, 404, 410)
+NXDOMAIN_ERRNOS = {socket.EAI_NONAME, getattr(socket, 'EAI_NODATA', socket.EAI_NONAME)}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tombstones (
+    url TEXT PRIMARY KEY,
+    reason TEXT NOT NULL,      -- 最近一次失效原因
+    streak INTEGER NOT NULL,   -- 连续失效次数
+    expires REAL NOT NULL      -- 墓碑到期时间
+);
+"""
+
+
+def failure_reason(exc):
+    """请求异常是否说明链接已失效：域名不存在时返回 "NXDOMAIN"，其他异常返回 None"""
+    if isinstance(exc, aiohttp.ClientConnectorError):
+        os_error = getattr(exc, 'os_error', None)
+        if isinstance(os_error, socket.gaierror) and os_error.errno in NXDOMAIN_ERRNOS:
+            return "NXDOMAIN"
+    return None
+
+
+class NegativeCache:
+    """
+    墓碑表：启动时整表读入内存，is_dead 查询不访问数据库；
+    bury / clear 的修改暂存到 flush() 时在一个事务中写入
+    """
+
+    def __init__(self):
+        self.db = None
+        self.entries = {}      # url -> [原因, 连续失效次数, 到期时间]
+        self.dirty = set()
+        self.hits = 0          # 因墓碑有效而跳过的检查
+        self.misses = 0        # 没有墓碑（或墓碑已过期）而正常检查的次数
+        self.expired = 0       # 其中墓碑已过期、重新检查的次数
+        self.buried = 0
+
+    def load(self, db):
+        self.db = db
+        self.db.executescript(SCHEMA)
+        self.entries = {url: [reason, streak, expires] for url, reason, streak, expires
+                        in self.db.execute("SELECT url, reason, streak, expires FROM tombstones")}
+        now = time.time()
+        active = sum(1 for entry in self.entries.values() if entry[2] > now)
+        logger.info(f"已加载失效链接墓碑 {len(self.entries)} 条（有效 {active} 条）")
+
+    def is_dead(self, url):
+        entry = self.entries.get(url)
+        if entry is not None and entry[2] > time.time():
+            self.hits += 1
+            return True
+        self.misses += 1
+        if entry is not None:
+            self.expired += 1
+        return False
+
+    def bury(self, url, reason):
+        """记录一次失效：有效期为 TOMBSTONE_BASE_TTL × 2^(连续失效次数 - 1)"""
+        entry = self.entries.get(url)
+        streak = entry[1] + 1 if entry else 1
+        ttl = min(TOMBSTONE_MAX_TTL, TOMBSTONE_BASE_TTL * 2 ** (streak - 1))
+        self.entries[url] = [reason, streak, time.time() + ttl]
+        self.dirty.add(url)
+        self.buried += 1
+        logger.debug(f"订阅 {url} 失效 ({reason})，连续 {streak} 次，{ttl / 3600:.0f} 小时内不再检查")
+
+    def clear(self, url):
+        """链接可以正常访问：移除墓碑"""
+        if self.entries.pop(url, None) is not None:
+            self.dirty.add(url)
+
+    def flush(self):
+        if not self.dirty or self.db is None:
+            return
+        rows = [(url, *self.entries[url]) for url in self.dirty if url in self.entries]
+        removed = [(url,) for url in self.dirty if url not in self.entries]
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO tombstones (url, reason, streak, expires) "
+                                "VALUES (?, ?, ?, ?)", rows)
+            self.db.executemany("DELETE FROM tombstones WHERE url = ?", removed)
+        self.dirty.clear()
+
+    def report(self):
+        if not self.hits and not self.buried and not self.expired:
+            return
+        logger.info(f"🪦 失效链接墓碑: 跳过 {self.hits} 次检查, 正常检查 {self.misses} 次 "
+                    f"(其中墓碑过期重查 {self.expired} 次), 本次新增 / 延长墓碑 {self.buried} 条")
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import hashlib
+from array import array
+from collections import Counter
+from loguru import logger
+
+from node_parser import parse_raw
+
+# 节点级去重索引：以 (协议, 服务器, 端口, 凭据) 的 64 位哈希作为节点指纹，
+# 统计各订阅的去重 / 独有节点数，并输出合并去重后的节点列表
+NODE_INDEX_PATH = 'cache/node_index.json'
+
+
+def fingerprint(node):
+    """节点指纹：规范化字段的 blake2b 64 位摘要"""
+    key = f"{node.protocol}\0{node.server}\0{node.port}\0{node.credential}".encode('utf-8', errors='replace')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big')
+
+
+class NodeIndex:
+    """
+    跨订阅的节点去重索引（JSON 文件持久化）：
+      - 每个订阅只保存指纹数组 array('Q')，每个节点 8 字节
+      - 同一指纹只保留一份节点原文（取 URL 排序最靠前的订阅中的写法，保证输出稳定）
+      - 订阅返回 304 时沿用上次运行保存的节点；每个订阅记录节点的解析时间，
+        在有效期内（见 fresh）订阅检查可以不读完整内容而沿用已有记录
+    """
+
+    def __init__(self, path=NODE_INDEX_PATH):
+        self.path = path
+        self.subs = {}         # url -> 指纹数组
+        self.payloads = {}     # 指纹 -> (来源订阅 url, 节点原文)
+        self.updated = {}      # url -> 节点解析时间
+        self.previous = {}     # 上次运行保存的 url -> 指纹数组
+        self.previous_payloads = {}
+        self.previous_updated = {}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.previous = {url: array('Q', (int(fps[i:i + 16], 16) for i in range(0, len(fps), 16)))
+                             for url, fps in data.get("subs", {}).items()}
+            self.previous_payloads = {int(fp, 16): raw for fp, raw in data.get("nodes", {}).items()}
+            self.previous_updated = data.get("updated", {})
+            logger.info(f"已加载节点索引: {len(self.previous)} 个订阅, {len(self.previous_payloads)} 个节点")
+        except Exception as e:
+            logger.warning(f"读取节点索引 {self.path} 失败: {e}")
+            self.previous, self.previous_payloads, self.previous_updated = {}, {}, {}
+
+    def save(self):
+        """只保存本次运行出现过的订阅及其引用的节点"""
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        # 指纹数组以 hex 拼接保存，每个节点 16 个字符
+        subs = {url: "".join(f"{fp:016x}" for fp in fps) for url, fps in sorted(self.subs.items())}
+        nodes = {f"{fp:016x}": raw for fp, (_, raw) in sorted(self.payloads.items())}
+        updated = {url: self.updated.get(url, 0) for url in sorted(self.subs)}
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"subs": subs, "nodes": nodes, "updated": updated}, f, ensure_ascii=False, indent=0)
+
+    def has(self, url):
+        """上次运行是否保存过该订阅的节点（决定能否使用条件请求）"""
+        return url in self.previous
+
+    def fresh(self, url, max_age):
+        """上次运行保存的该订阅节点是否在 max_age 秒内解析（旧版本索引没有解析时间，视为过期）"""
+        return url in self.previous and time.time() - self.previous_updated.get(url, 0) < max_age
+
+    def _record(self, url, fp, raw):
+        current = self.payloads.get(fp)
+        if current is None or url < current[0]:
+            self.payloads[fp] = (url, raw)
+
+    def add(self, url, nodes):
+        """记录一个订阅本次解析出的节点"""
+        fps = array('Q')
+        for node in nodes:
+            fp = fingerprint(node)
+            fps.append(fp)
+            self._record(url, fp, node.raw)
+        self.subs[url] = fps
+        self.updated[url] = time.time()
+
+    def reuse(self, url):
+        """订阅未修改 (304) 或记录仍在有效期内：沿用上次保存的节点与解析时间，返回是否有记录"""
+        fps = self.previous.get(url)
+        if fps is None:
+            return False
+        for fp in fps:
+            raw = self.previous_payloads.get(fp)
+            if raw is not None:
+                self._record(url, fp, raw)
+        self.subs[url] = array('Q', (fp for fp in fps if fp in self.previous_payloads))
+        self.updated[url] = self.previous_updated.get(url, 0)
+        return True
+
+    def merged(self, urls):
+        """按 URL 顺序合并 urls 中各订阅的节点，返回去重后的节点原文列表"""
+        seen = set()
+        merged = []
+        for url in sorted(set(urls)):
+            for fp in self.subs.get(url, ()):
+                if fp not in seen:
+                    seen.add(fp)
+                    merged.append(self.payloads[fp][1])
+        return merged
+
+    def nodes(self, urls):
+        """urls 中各订阅的去重节点 {指纹: Node}（由节点原文还原）"""
+        nodes = {}
+        for url in set(urls):
+            for fp in self.subs.get(url, ()):
+                if fp not in nodes:
+                    try:
+                        nodes[fp] = parse_raw(self.payloads[fp][1])
+                    except ValueError:
+                        continue
+        return {fp: node for fp, node in nodes.items() if node is not None}
+
+    def write(self, urls, links_path, clash_path):
+        """
+        输出合并去重后的节点：节点链接写入 links_path（每行一个），
+        来自 clash 配置的代理写入 clash_path（proxies 列表，每项为单行流式映射）
+        """
+        links, proxies = [], []
+        for raw in self.merged(urls):
+            (proxies if raw.startswith('{') else links).append(raw)
+        with open(links_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(links))
+        with open(clash_path, 'w', encoding='utf-8') as f:
+            f.write("proxies:\n" + "".join(f"  - {raw}\n" for raw in proxies))
+        logger.info(f"已保存去重节点: {len(links)} 个链接到 {links_path}, {len(proxies)} 个 clash 代理到 {clash_path}")
+
+    def report(self, urls, top=10):
+        """输出去重统计：总节点数、去重后节点数，以及各订阅的去重 / 独有节点数"""
+        urls = [url for url in sorted(set(urls)) if url in self.subs]
+        if not urls:
+            return
+        occurrences = Counter()
+        distinct = {}
+        for url in urls:
+            distinct[url] = set(self.subs[url])
+            occurrences.update(distinct[url])
+        total = sum(len(self.subs[url]) for url in urls)
+        logger.info(f"🧬 节点去重索引: {len(urls)} 个订阅, 节点 {total:,} → 去重后 {len(occurrences):,}")
+        rows = []
+        for url in urls:
+            exclusive = sum(1 for fp in distinct[url] if occurrences[fp] == 1)
+            rows.append((exclusive, len(distinct[url]), len(self.subs[url]), url))
+        rows.sort(reverse=True)
+        for i, (exclusive, unique, count, url) in enumerate(rows):
+            line = f"   {url}: 节点 {count}, 去重 {unique}, 独有 {exclusive}"
+            if i < top:
+                logger.info(line)
+            else:
+                logger.debug(line)
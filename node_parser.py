@@ -0,0 +1,339 @@
+import re
+import json
+import base64
+import binascii
+from collections import namedtuple
+from urllib.parse import urlsplit, unquote, parse_qs
+
+import yaml
+
+# 本地节点解析：把订阅内容（clash proxies / base64 / 原始链接）解析为结构化的节点记录并校验必填字段，
+# 按各转换目标支持的协议得出有效节点数，无需再请求订阅转换后端
+
+# 节点记录：协议、服务器、端口、凭据（密码 / uuid）、名称、原文（节点链接或 clash 代理的单行 JSON）
+Node = namedtuple('Node', ('protocol', 'server', 'port', 'credential', 'name', 'raw'))
+
+# 各协议除 server / port 外的必填字段（clash 字段名），第一个字段作为凭据
+REQUIRED_FIELDS = {
+    'ss': ('password', 'cipher'),
+    'ssr': ('password', 'cipher', 'protocol', 'obfs'),
+    'vmess': ('uuid',),
+    'trojan': ('password',),
+    'vless': ('uuid',),
+}
+# 各转换目标支持的协议
+TARGET_PROTOCOLS = {
+    'clash': frozenset(('ss', 'ssr', 'vmess', 'trojan', 'vless')),
+    'loon': frozenset(('ss', 'ssr', 'vmess', 'trojan', 'vless')),
+    'v2ray': frozenset(('ss', 'vmess', 'trojan', 'vless')),
+}
+
+LINK_RE = re.compile(r'(ss|ssr|vmess|trojan|vless)://\S+', re.IGNORECASE)
+MAX_LINE = 64 * 1024        # 超过该长度的行不可能是节点，直接丢弃
+YAML_BATCH = 256            # clash 代理条目攒够该数量后一次解析
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+WHITESPACE_BYTES = b' \t\r\n\x0b\x0c'
+B64_ALPHABET = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=-_'
+B64_URLSAFE = bytes.maketrans(b'-_', b'+/')
+
+
+# -------------------------------
+# 单个节点解析
+# -------------------------------
+def build_node(proxy, raw=''):
+    """
+    由 clash 风格的代理字典生成节点记录（raw 为节点原文）：
+    返回 Node；协议不支持返回 None；必填字段缺失或无效时抛出 ValueError
+    """
+    protocol = str(proxy.get('type', '')).lower()
+    required = REQUIRED_FIELDS.get(protocol)
+    if required is None:
+        return None
+    server = str(proxy.get('server') or '').strip()
+    if not server or any(c in server for c in ' /@'):
+        raise ValueError(f"无效的服务器地址: {server!r}")
+    port = int(proxy.get('port') or 0)
+    if not 0 < port < 65536:
+        raise ValueError(f"无效的端口: {port}")
+    for field in required:
+        if not str(proxy.get(field) or '').strip():
+            raise ValueError(f"缺少字段 {field}")
+    return Node(protocol, server.lower(), port, str(proxy[required[0]]), str(proxy.get('name') or ''), raw)
+
+def proxy_json(proxy):
+    """clash 代理字典的单行表示（JSON 同时是合法的 YAML 流式映射）"""
+    return json.dumps(proxy, ensure_ascii=False, separators=(',', ':'), default=str)
+
+def _b64decode(text):
+    text = text.strip().translate(str.maketrans('-_', '+/'))
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+def _host_port(hostport):
+    parts = urlsplit('//' + hostport)
+    return parts.hostname, parts.port
+
+def _parse_ss(rest):
+    body, _, name = rest.partition('#')
+    body = body.split('?', 1)[0].rstrip('/')
+    if '@' not in body:
+        # 旧格式：整体 base64(method:password@host:port)
+        body = _b64decode(body).decode()
+    userinfo, _, hostport = body.rpartition('@')
+    userinfo = unquote(userinfo)
+    if ':' not in userinfo:
+        # SIP002：userinfo 为 base64(method:password)
+        userinfo = _b64decode(userinfo).decode()
+    cipher, _, password = userinfo.partition(':')
+    server, port = _host_port(hostport)
+    return {'type': 'ss', 'server': server, 'port': port, 'cipher': cipher, 'password': password,
+            'name': unquote(name)}
+
+def _parse_ssr(rest):
+    # base64(host:port:protocol:method:obfs:base64(password)/?obfsparam=...&remarks=...)
+    decoded = _b64decode(rest.split('#', 1)[0]).decode()
+    head, _, query = decoded.partition('/?')
+    server, port, protocol, cipher, obfs, password = head.rsplit(':', 5)
+    remarks = parse_qs(query).get('remarks', [''])[0]
+    return {'type': 'ssr', 'server': server.strip('[]'), 'port': port, 'cipher': cipher,
+            'password': _b64decode(password).decode(), 'protocol': protocol, 'obfs': obfs,
+            'name': _b64decode(remarks).decode(errors='replace') if remarks else ''}
+
+def _parse_userinfo_link(protocol, field, rest):
+    # trojan://password@host:port?...#name / vless://uuid@host:port?...#name
+    parts = urlsplit(f'{protocol}://{rest}')
+    return {'type': protocol, 'server': parts.hostname, 'port': parts.port,
+            field: unquote(parts.username or ''), 'name': unquote(parts.fragment)}
+
+def _parse_vmess(rest):
+    body = rest.split('#', 1)[0]
+    if '@' in body:
+        # 部分客户端使用 vmess://uuid@host:port 的形式
+        return _parse_userinfo_link('vmess', 'uuid', rest)
+    info = json.loads(_b64decode(body))
+    return {'type': 'vmess', 'server': info.get('add'), 'port': info.get('port'), 'uuid': info.get('id'),
+            'name': info.get('ps', '')}
+
+URI_PARSERS = {
+    'ss': _parse_ss,
+    'ssr': _parse_ssr,
+    'vmess': _parse_vmess,
+    'trojan': lambda rest: _parse_userinfo_link('trojan', 'password', rest),
+    'vless': lambda rest: _parse_userinfo_link('vless', 'uuid', rest),
+}
+
+def parse_uri(link):
+    """解析一个节点链接，返回 Node；链接格式或必填字段无效时抛出 ValueError"""
+    scheme, _, rest = link.partition('://')
+    parser = URI_PARSERS.get(scheme.lower())
+    if parser is None:
+        return None
+    try:
+        proxy = parser(rest)
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(f"无法解析 {scheme} 链接: {e}") from e
+    return build_node(proxy, link)
+
+def parse_raw(raw):
+    """由节点原文（节点链接或 clash 代理的单行 JSON）还原节点记录"""
+    if raw.startswith('{'):
+        return build_node(json.loads(raw), raw)
+    return parse_uri(raw)
+
+
+# -------------------------------
+# 流式解析
+# -------------------------------
+class _TextParser:
+    """按行解析文本内容：顶层 proxies: 段中的 clash 代理条目，以及逐行的节点链接"""
+
+    def __init__(self):
+        self.pending = b''          # 未结束的行
+        self.in_proxies = False
+        self.item_indent = None     # proxies 列表项 "- " 的缩进
+        self.entry = []             # 当前代理条目的各行
+        self.entries = []           # 待解析的代理条目
+        self.nodes = []
+        self.invalid = 0
+        self.unsupported = 0
+        self.protocols = set()
+
+    def feed(self, data):
+        lines = (self.pending + data).split(b'\n')
+        self.pending = lines.pop()
+        if len(self.pending) > MAX_LINE:
+            self.pending = b''
+        for line in lines:
+            self._line(line.rstrip(b'\r'))
+        if len(self.entries) >= YAML_BATCH:
+            self._parse_entries()
+
+    def finish(self):
+        if self.pending:
+            self._line(self.pending.rstrip(b'\r'))
+            self.pending = b''
+        self._end_entry()
+        self._parse_entries()
+
+    def _add(self, make, *args):
+        try:
+            node = make(*args)
+        except (ValueError, TypeError, AttributeError):
+            self.invalid += 1
+            return
+        if node is None:
+            self.unsupported += 1
+            return
+        self.nodes.append(node)
+        self.protocols.add(node.protocol)
+
+    def _line(self, line):
+        stripped = line.strip()
+        if self.in_proxies:
+            if not stripped or stripped.startswith(b'#'):
+                if self.entry:
+                    self.entry.append(line)
+                return
+            indent = len(line) - len(line.lstrip())
+            if stripped.startswith(b'-') and (self.item_indent is None or indent == self.item_indent):
+                self.item_indent = indent
+                self._end_entry()
+                self.entry = [line]
+                return
+            if self.entry and indent > self.item_indent:
+                self.entry.append(line)
+                return
+            # proxies 段结束
+            self._end_entry()
+            self.in_proxies = False
+        if stripped.startswith(b'proxies:') and line[:1] not in b' \t':
+            rest = stripped[len(b'proxies:'):].strip()
+            if rest.startswith(b'['):
+                self._parse_flow(line)
+            else:
+                self.in_proxies = True
+                self.item_indent = None
+            return
+        match = LINK_RE.match(stripped.decode('utf-8', errors='ignore'))
+        if match:
+            self._add(parse_uri, match.group())
+
+    def _end_entry(self):
+        if self.entry:
+            self.entries.append(b'\n'.join(self.entry))
+            self.entry = []
+
+    def _parse_flow(self, line):
+        # 单行形式：proxies: [{...}, {...}]
+        try:
+            proxies = yaml.load(line, Loader=YAML_LOADER).get('proxies') or []
+        except yaml.YAMLError:
+            self.invalid += 1
+            return
+        for proxy in proxies:
+            if isinstance(proxy, dict):
+                self._add(build_node, proxy, proxy_json(proxy))
+            else:
+                self.invalid += 1
+
+    def _parse_entries(self):
+        """同一缩进的条目拼接后即为合法的 YAML 列表，整批解析一次；失败时逐条解析定位坏条目"""
+        if not self.entries:
+            return
+        entries, self.entries = self.entries, []
+        try:
+            proxies = yaml.load(b'\n'.join(entries), Loader=YAML_LOADER) or []
+        except yaml.YAMLError:
+            proxies = []
+            for entry in entries:
+                try:
+                    proxies.extend(yaml.load(entry, Loader=YAML_LOADER) or [])
+                except yaml.YAMLError:
+                    self.invalid += 1
+        for proxy in proxies:
+            if isinstance(proxy, dict):
+                self._add(build_node, proxy, proxy_json(proxy))
+            else:
+                self.invalid += 1
+
+
+class NodeParser:
+    """
+    流式节点解析器：按块调用 feed()，返回 True 表示每个转换目标都已找到有效节点、可以停止读取；
+    最后调用 finish() 结束解析。与识别引擎一致，只有全文（忽略空白）都是 base64 字符时才解码后解析。
+    """
+
+    def __init__(self):
+        self.text = _TextParser()
+        self.decoded = _TextParser()
+        self.b64_ok = True
+        self.b64_pending = b''
+
+    @property
+    def result(self):
+        """当前采用的解析结果（base64 解码内容或原文）"""
+        return self.decoded if self.b64_ok else self.text
+
+    def feed(self, chunk):
+        if self.b64_ok:
+            stripped = chunk.translate(None, WHITESPACE_BYTES)
+            if not stripped.translate(None, B64_ALPHABET):
+                self._feed_base64(stripped.translate(B64_URLSAFE))
+                # base64 字符构成的行不可能是节点，原文解析只需保留行尾以便内容转为文本时衔接
+                self.text.pending = (self.text.pending + chunk).rsplit(b'\n', 1)[-1][-MAX_LINE:]
+                return self.is_conclusive()
+            self.b64_ok = False
+        self.text.feed(chunk)
+        return self.is_conclusive()
+
+    def _feed_base64(self, data, final=False):
+        data = self.b64_pending + data
+        cut = len(data) if final else len(data) // 4 * 4
+        self.b64_pending = data[cut:]
+        if not cut:
+            return
+        if final and cut % 4:
+            data += b'=' * (4 - cut % 4)
+            cut = len(data)
+        try:
+            self.decoded.feed(binascii.a2b_base64(data[:cut]))
+        except binascii.Error:
+            self.b64_ok = False
+
+    def is_conclusive(self):
+        protocols = self.result.protocols
+        return all(protocols & supported for supported in TARGET_PROTOCOLS.values())
+
+    def finish(self):
+        if self.b64_ok:
+            self._feed_base64(b'', final=True)
+            self.decoded.finish()
+        if not self.b64_ok:
+            self.text.finish()
+        return self
+
+    @property
+    def nodes(self):
+        return self.result.nodes
+
+    def target_counts(self):
+        """
+        各转换目标可用的有效节点数 {"clash": n, "loon": n, "v2ray": n}；
+        没有解析到任何节点记录（无法本地判断）时返回 None
+        """
+        result = self.result
+        if not (result.nodes or result.invalid or result.unsupported):
+            return None
+        counts = dict.fromkeys(TARGET_PROTOCOLS, 0)
+        for node in result.nodes:
+            for target, supported in TARGET_PROTOCOLS.items():
+                if node.protocol in supported:
+                    counts[target] += 1
+        return counts
+
+
+def parse_nodes(data):
+    """一次性解析完整的订阅内容（bytes），返回 NodeParser"""
+    parser = NodeParser()
+    parser.feed(data)
+    return parser.finish()
@@ -0,0 +1,143 @@
+import ssl
+import time
+import socket
+import asyncio
+import statistics
+from loguru import logger
+
+# 节点连通性探测：对节点的 server:port 建立 TCP 连接（可选 TLS 握手）并记录连接延迟，
+# 全局并发与单个目标 IP 的并发分别限制，整轮探测受截止时间约束
+
+PROBE_CONCURRENCY = 200     # 同时进行的探测数
+PROBE_PER_IP = 4            # 同一目标 IP 同时进行的探测数，避免对单台服务器突发大量连接
+PROBE_TIMEOUT = 5.0         # 单次连接（含 DNS 与 TLS 握手）超时（秒）
+TLS_PROTOCOLS = frozenset(('trojan',))  # 开启 TLS 时进行握手的协议（这些协议总是基于 TLS）
+
+
+class NodeProber:
+    """
+    有界并发的 TCP/TLS 探测器：
+      probe_all({key: Node}) -> {key: 连接延迟（秒），不可达为 None}；
+      截止时间之后尚未开始的探测不出现在结果中
+    """
+
+    def __init__(self, concurrency=PROBE_CONCURRENCY, per_ip=PROBE_PER_IP, timeout=PROBE_TIMEOUT,
+                 deadline=None, tls=False):
+        self.concurrency = concurrency
+        self.per_ip = per_ip
+        self.timeout = timeout
+        self.deadline_seconds = deadline
+        self.deadline = None
+        self.tls = tls
+        self.ssl_context = None
+        self.semaphore = None
+        self.ip_semaphores = {}
+        self.dns = {}           # 主机名 -> 解析任务（同一主机只解析一次）
+        self.probed = 0
+        self.reachable = 0
+        self.skipped = 0
+        self.dns_failures = 0
+        self.elapsed = 0.0
+
+    def _remaining(self):
+        if self.deadline is None:
+            return self.timeout
+        return min(self.timeout, self.deadline - time.monotonic())
+
+    async def _resolve(self, host):
+        task = self.dns.get(host)
+        if task is None:
+            loop = asyncio.get_running_loop()
+            task = self.dns[host] = asyncio.ensure_future(
+                loop.getaddrinfo(host, None, type=socket.SOCK_STREAM))
+        infos = await asyncio.shield(task)
+        return infos[0][4][0]
+
+    def _ip_semaphore(self, ip):
+        semaphore = self.ip_semaphores.get(ip)
+        if semaphore is None:
+            semaphore = self.ip_semaphores[ip] = asyncio.Semaphore(self.per_ip)
+        return semaphore
+
+    async def _connect(self, ip, node):
+        """建立连接并返回耗时；TLS 只验证握手能否完成，不校验证书"""
+        use_tls = self.tls and node.protocol in TLS_PROTOCOLS
+        server_hostname = node.server if use_tls and node.server != ip else None
+        start = time.monotonic()
+        _, writer = await asyncio.open_connection(
+            ip, node.port,
+            ssl=self.ssl_context if use_tls else None,
+            server_hostname=server_hostname,
+        )
+        latency = time.monotonic() - start
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+        return latency
+
+    async def probe(self, node):
+        """探测单个节点，返回延迟；不可达返回 None；已过截止时间返回 False"""
+        async with self.semaphore:
+            if self._remaining() <= 0:
+                self.skipped += 1
+                return False
+            self.probed += 1
+            try:
+                ip = await asyncio.wait_for(self._resolve(node.server), self._remaining())
+            except Exception:
+                self.dns_failures += 1
+                return None
+            async with self._ip_semaphore(ip):
+                timeout = self._remaining()
+                if timeout <= 0:
+                    return None
+                try:
+                    latency = await asyncio.wait_for(self._connect(ip, node), timeout)
+                except (OSError, asyncio.TimeoutError, ssl.SSLError):
+                    return None
+        self.reachable += 1
+        return latency
+
+    async def probe_all(self, nodes):
+        start = time.monotonic()
+        if self.deadline_seconds is not None:
+            self.deadline = start + self.deadline_seconds
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        if self.tls:
+            self.ssl_context = ssl.create_default_context()
+            self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+        keys = list(nodes)
+        latencies = await asyncio.gather(*(self.probe(nodes[key]) for key in keys))
+        self.elapsed = time.monotonic() - start
+        return {key: latency for key, latency in zip(keys, latencies) if latency is not False}
+
+    def report(self):
+        if not self.probed and not self.skipped:
+            return
+        rate = self.probed / self.elapsed if self.elapsed else 0
+        logger.info(f"📶 节点连通性探测: 探测 {self.probed} 个, 可达 {self.reachable}, "
+                    f"DNS 失败 {self.dns_failures}, 超过截止时间未探测 {self.skipped}, "
+                    f"耗时 {self.elapsed:.1f}s ({rate:.0f} 个/秒)")
+
+
+def summarize(keys, latencies):
+    """
+    汇总一个订阅的探测结果：keys 为该订阅的节点键，latencies 为 probe_all 的结果。
+    返回 {"nodes": 节点数, "probed": 已探测数, "reachable": 可达数, "ratio": 可达比例,
+    "latency": 可达节点延迟中位数（秒）}，没有任何节点被探测时返回 None
+    """
+    keys = set(keys)
+    probed = [latencies[key] for key in keys if key in latencies]
+    if not probed:
+        return None
+    reachable = [latency for latency in probed if latency is not None]
+    return {
+        "nodes": len(keys),
+        "probed": len(probed),
+        "reachable": len(reachable),
+        "ratio": len(reachable) / len(probed),
+        "latency": statistics.median(reachable) if reachable else None,
+    }
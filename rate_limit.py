@@ -0,0 +1,123 @@
+import time
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+from loguru import logger
+
+# 按主机的令牌桶限速：所有请求发出前先取令牌；收到 429 / 503 时按 Retry-After（没有时按指数退避）
+# 暂停该主机并把速率减半，之后每次正常响应逐步恢复到配置的速率
+
+DEFAULT_RATE = 20.0         # 未单独配置的主机：每秒请求数
+DEFAULT_BURST = 20          # 令牌桶容量（允许的突发请求数）
+MIN_RATE = 0.5              # 限流后速率的下限
+RECOVERY_STEP = 0.05        # 每次正常响应恢复的速率（占配置速率的比例）
+RETRY_AFTER_MAX = 60.0      # Retry-After 的上限（秒），避免单个主机拖住整轮运行
+THROTTLE_STATUS = (429, 503)
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """第 attempt 次（从 0 开始）重试前的等待时间：带完全抖动的指数退避"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def parse_retry_after(value):
+    """解析 Retry-After（秒数或 HTTP 日期），返回等待秒数；无法解析时返回 None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return min(float(value), RETRY_AFTER_MAX)
+    try:
+        delay = parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+    return min(max(delay, 0.0), RETRY_AFTER_MAX)
+
+
+class TokenBucket:
+    """单个主机的令牌桶；等待令牌的请求按到达顺序放行"""
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+        self.consecutive = 0   # 连续被限流次数（决定没有 Retry-After 时的退避时长）
+        self.throttled = 0
+        self.waited = 0.0      # 累计等待时间（秒）
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                self.waited += wait
+                await asyncio.sleep(wait)
+
+    def throttle(self, retry_after=None):
+        """收到 429 / 503：暂停到 Retry-After 之后，并把速率减半"""
+        delay = retry_after if retry_after is not None else backoff_delay(self.consecutive)
+        self.consecutive += 1
+        self.throttled += 1
+        self.rate = max(MIN_RATE, self.rate / 2)
+        self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        self.tokens = 0.0
+        self.updated = self.blocked_until
+
+    def recover(self):
+        self.consecutive = 0
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_STEP)
+
+
+class HostRateLimiter:
+    """
+    按主机管理令牌桶：
+      host_rates：按主机覆盖的 (每秒请求数, 突发数)，其余主机使用 DEFAULT_RATE / DEFAULT_BURST
+    """
+
+    def __init__(self, host_rates=None):
+        self.host_rates = dict(host_rates or {})
+        self.buckets = {}
+
+    def bucket(self, host):
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            rate, burst = self.host_rates.get(host, (DEFAULT_RATE, DEFAULT_BURST))
+            bucket = self.buckets[host] = TokenBucket(rate, burst)
+        return bucket
+
+    async def acquire(self, host):
+        await self.bucket(host).acquire()
+
+    def observe(self, host, status, headers):
+        """根据响应状态调整主机速率"""
+        bucket = self.bucket(host)
+        if status in THROTTLE_STATUS:
+            retry_after = parse_retry_after(headers.get('Retry-After'))
+            bucket.throttle(retry_after)
+            logger.debug(f"主机 {host} 返回 {status}，暂停 {bucket.blocked_until - time.monotonic():.1f}s，"
+                         f"速率降为 {bucket.rate:.1f}/s")
+        elif status < 500:
+            bucket.recover()
+
+    def report(self):
+        throttled = [(host, b) for host, b in self.buckets.items() if b.throttled]
+        if not throttled:
+            return
+        logger.info(f"🚦 限流统计: {len(throttled)} 个主机返回过 429 / 503")
+        for host, bucket in sorted(throttled, key=lambda item: item[1].throttled, reverse=True):
+            logger.info(f"   {host}: 限流 {bucket.throttled} 次, 累计等待 {bucket.waited:.1f}s, "
+                        f"当前速率 {bucket.rate:.1f}/s")
@@ -0,0 +1,69 @@
+import re
+import zlib
+from loguru import logger
+
+# 现有订阅的分级复查：按连续通过次数拉长复查间隔，并参考 subscription-userinfo 中的到期时间 (expire=)
+# 与流量消耗速度，保证订阅到期或流量耗尽前会被复查；每次运行只复查到期的订阅，且不超过复查预算
+RECHECK_BASE_INTERVAL = 45 * 60        # 与定时任务的运行间隔（fetch.yaml 中每 45 分钟一次）一致：新订阅或刚失败过的订阅每次运行都复查
+RECHECK_MAX_INTERVAL = 24 * 3600       # 稳定订阅的最长复查间隔
+RECHECK_JITTER = 0.15                  # 按 URL 固定的间隔缩短比例上限，避免同批订阅总在同一次运行到期
+RE_USERINFO_FIELD = re.compile(r'(upload|download|total|expire)\s*=\s*(\d+)', re.IGNORECASE)
+
+
+def parse_userinfo(value):
+    """解析 subscription-userinfo：返回 {"upload", "download", "total", "expire"} 中出现的字段（整数）"""
+    if not value:
+        return {}
+    return {key.lower(): int(number) for key, number in RE_USERINFO_FIELD.findall(value)}
+
+
+def next_check(url, ok, history, userinfo, now):
+    """
+    计算一次检查后的复查安排，返回 (连续通过次数, 下次复查时间, 已用流量)。
+      history：状态库中该 URL 的 (连续通过次数, 下次复查时间, 已用流量, 记录已用流量的时间)，没有记录时为 None
+    间隔为 RECHECK_BASE_INTERVAL × 2^(连续通过次数 - 1)，不超过 RECHECK_MAX_INTERVAL，
+    并且不晚于订阅到期时间与按最近消耗速度估算的流量耗尽时间
+    """
+    if not ok:
+        return 0, now, None
+    passes = (history[0] if history else 0) + 1
+    interval = min(RECHECK_MAX_INTERVAL, RECHECK_BASE_INTERVAL * 2 ** (passes - 1))
+    interval *= 1 - RECHECK_JITTER * (zlib.crc32(url.encode('utf-8', errors='replace')) % 1000) / 1000
+
+    info = parse_userinfo(userinfo)
+    used = info.get("upload", 0) + info.get("download", 0) if "total" in info else None
+    if info.get("expire"):
+        interval = min(interval, info["expire"] - now)
+    if used is not None:
+        remaining = info["total"] - used
+        previous_used, previous_at = (history[2], history[3]) if history else (None, None)
+        if remaining <= 0:
+            interval = 0
+        elif previous_used is not None and previous_at and used > previous_used and now > previous_at:
+            rate = (used - previous_used) / (now - previous_at)
+            interval = min(interval, remaining / rate)
+    return passes, now + max(0, interval), used
+
+
+def plan_rechecks(urls, history, now, budget=None):
+    """
+    把现有订阅分为本次复查与沿用上次结果两部分，返回 (复查列表, 沿用列表, 超出预算推迟的数量)。
+    没有复查记录或已到期的订阅按到期先后排序，超出 budget 的部分推迟到之后的运行
+    """
+    due, fresh = [], []
+    for url in dict.fromkeys(urls):
+        row = history.get(url)
+        next_due = row[1] if row else None
+        if next_due is None or next_due <= now:
+            due.append((next_due or 0, url))
+        else:
+            fresh.append(url)
+    due.sort()
+    if budget is not None and len(due) > budget:
+        deferred = [url for _, url in due[budget:]]
+        due = due[:budget]
+    else:
+        deferred = []
+    if deferred or fresh:
+        logger.info(f"🗓️ 分级复查: 本次复查 {len(due)} 个, 未到期 {len(fresh)} 个, 超出预算推迟 {len(deferred)} 个")
+    return [url for _, url in due], fresh + deferred, len(deferred)
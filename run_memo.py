@@ -0,0 +1,83 @@
+import asyncio
+from urllib.parse import urlsplit, urlunsplit
+from loguru import logger
+
+# 单次运行内的 URL 结果表：各阶段共享，同一 URL 同一种检查只执行一次，
+# 并发的重复请求等待同一个任务的结果
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url):
+    """规范化 URL 作为结果表的键：去除首尾空白与 #片段，协议和主机名转小写，省略默认端口"""
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    if not parts.netloc:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{port}"
+    if parts.username or parts.password:
+        netloc = parts.netloc.rsplit('@', 1)[0] + '@' + netloc
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+class RunMemo:
+    """按 (检查类型, 规范化 URL, ...) 记录本次运行的检查任务及结果"""
+
+    def __init__(self):
+        self.tasks = {}
+        self.hits = 0      # 直接复用已完成结果的次数
+        self.joins = 0     # 等待进行中任务的次数
+        self.misses = 0    # 实际执行检查的次数
+
+    async def run(self, kind, url, factory, *extra):
+        """
+        返回 factory() 的结果；相同 (kind, url, *extra) 的调用共享同一个任务。
+        使用 shield 保证某个调用方被取消时不会取消其他调用方正在等待的任务
+        """
+        key = (kind, normalize_url(url)) + extra
+        task = self.tasks.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(factory())
+            self.tasks[key] = task
+        elif task.done():
+            self.hits += 1
+        else:
+            self.joins += 1
+        return await asyncio.shield(task)
+
+    async def cancel(self, kind, urls=None):
+        """
+        取消某种检查中仍未完成的任务（提供 urls 时只取消这些 URL 的），并从结果表中移除。
+        run() 的调用方被取消时任务本身不会停止（见 shield），截止时间到达时由此真正停止请求
+        """
+        urls = None if urls is None else {normalize_url(url) for url in urls}
+        keys = [key for key, task in self.tasks.items()
+                if key[0] == kind and not task.done() and (urls is None or key[1] in urls)]
+        pending = [self.tasks.pop(key) for key in keys]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        return len(pending)
+
+    async def close(self):
+        """取消本次运行结束时仍未完成的任务"""
+        pending = [task for task in self.tasks.values() if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def report(self):
+        logger.info(f"🧮 URL 结果表: 实际检查 {self.misses} 次, 复用结果 {self.hits} 次, "
+                    f"合并并发请求 {self.joins} 次")
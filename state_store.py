@@ -0,0 +1,242 @@
+import os
+import re
+import time
+import sqlite3
+from loguru import logger
+
+# 订阅状态库（SQLite）：每个 URL 一行，记录所在分类、首次发现 / 最近检查 / 最近通过时间、
+# 连续失败 / 通过次数、最近一次检查耗时与内容哈希、分级复查的下次复查时间与最近一次节点连通性探测结果；
+# 另记录各频道的有效订阅产出，截止时间模式据此优先抓取高产出频道。
+# 各分类列表以 config.yaml 为准：启动时把（可能经过手动编辑的）列表同步到状态库，运行结束时再由状态库导出；
+# 状态库本身不提交到仓库，由工作流缓存在两次运行之间保留
+STATE_DB_PATH = 'cache/state.db'
+CATEGORIES = ("机场订阅", "clash订阅", "v2订阅")
+CHANNEL_YIELD_DECAY = 0.7  # 频道产出的指数滑动平均中历史值的权重
+PLAY = "开心玩耍"
+RE_ENTRY_URL = re.compile(r'https?://[^\s]+')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    url TEXT PRIMARY KEY,
+    category TEXT,                        -- 所在分类（机场订阅 / clash订阅 / v2订阅），NULL 表示不在任何列表中
+    position INTEGER,                     -- 在分类列表中的位置
+    play TEXT,                            -- 开心玩耍条目原文（流量信息 + URL），NULL 表示不在该列表中
+    play_position INTEGER,
+    first_seen REAL NOT NULL,
+    last_checked REAL,
+    last_ok REAL,
+    failures INTEGER NOT NULL DEFAULT 0,  -- 连续检查失败次数
+    latency REAL,                         -- 最近一次订阅检查耗时（秒）
+    content_hash TEXT,                    -- 最近一次下载内容的哈希
+    passes INTEGER NOT NULL DEFAULT 0,    -- 连续检查通过次数
+    next_due REAL,                        -- 下次复查时间（见 recheck.py）
+    traffic_used INTEGER,                 -- 最近一次记录的已用流量（字节）
+    traffic_at REAL,                      -- 记录已用流量的时间
+    deferred REAL,                        -- 截止时间前未能检查、推迟到下次运行的时间，NULL 表示没有推迟
+    probe_nodes INTEGER,                  -- 最近一次节点连通性探测：已探测节点数
+    probe_reachable INTEGER,              -- 其中可达的节点数
+    probe_latency REAL,                   -- 可达节点的连接延迟中位数（秒）
+    probed_at REAL
+);
+CREATE TABLE IF NOT EXISTS channels (
+    channel TEXT PRIMARY KEY,             -- 频道 id
+    yield REAL NOT NULL,                  -- 每次运行产出有效订阅数的指数滑动平均
+    runs INTEGER NOT NULL
+);
+"""
+# 旧版本数据库缺少的列
+MIGRATIONS = {
+    "passes": "INTEGER NOT NULL DEFAULT 0",
+    "next_due": "REAL",
+    "traffic_used": "INTEGER",
+    "traffic_at": "REAL",
+    "deferred": "REAL",
+    "probe_nodes": "INTEGER",
+    "probe_reachable": "INTEGER",
+    "probe_latency": "REAL",
+    "probed_at": "REAL",
+}
+
+UPSERT_SEEN = "INSERT OR IGNORE INTO subscriptions (url, first_seen) VALUES (?, ?)"
+UPSERT_CHECK = """
+INSERT INTO subscriptions (url, first_seen, last_checked, last_ok, failures, latency, content_hash,
+                           passes, next_due, traffic_used, traffic_at)
+VALUES (:url, :now, :now, :ok, :failed, :latency, :hash, :passes, :next_due, :used, :used_at)
+ON CONFLICT(url) DO UPDATE SET
+    last_checked = excluded.last_checked,
+    last_ok = COALESCE(excluded.last_ok, last_ok),
+    failures = CASE WHEN excluded.last_ok IS NULL THEN failures + 1 ELSE 0 END,
+    latency = excluded.latency,
+    content_hash = COALESCE(excluded.content_hash, content_hash),
+    passes = excluded.passes,
+    next_due = excluded.next_due,
+    traffic_used = COALESCE(excluded.traffic_used, traffic_used),
+    traffic_at = COALESCE(excluded.traffic_at, traffic_at)
+"""
+UPSERT_CATEGORY = """
+INSERT INTO subscriptions (url, category, position, first_seen) VALUES (?, ?, ?, ?)
+ON CONFLICT(url) DO UPDATE SET category = excluded.category, position = excluded.position
+"""
+UPSERT_PLAY = """
+INSERT INTO subscriptions (url, play, play_position, first_seen) VALUES (?, ?, ?, ?)
+ON CONFLICT(url) DO UPDATE SET play = excluded.play, play_position = excluded.play_position
+"""
+
+
+def play_url(entry):
+    """开心玩耍条目中的 URL，没有时返回 None"""
+    match = RE_ENTRY_URL.search(entry) if isinstance(entry, str) else None
+    return match.group() if match else None
+
+
+class StateStore:
+    """
+    订阅状态库：
+      - seen / record 把本阶段的发现与检查结果暂存在内存，flush() 在一个事务中批量写入
+      - sync_config 启动时以 config.yaml 中的列表为准更新状态库，set_lists 以本次运行的最终列表更新各 URL 的分类与位置，
+        export 按位置导出与 config.yaml 相同结构的列表
+      - history 为打开时读入的 {url: (连续通过次数, 下次复查时间, 已用流量, 记录时间)}，供分级复查使用
+      - deferred 为上次运行因截止时间推迟检查的新链接，channel_yields 为各频道的有效订阅产出
+    """
+
+    def __init__(self, path=STATE_DB_PATH):
+        self.path = path
+        self.db = None
+        self.pending_seen = []
+        self.pending_checks = []
+        self.flushed = 0
+        self.history = {}
+        self.deferred = []
+        self.channel_yields = {}
+
+    def open(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(SCHEMA)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(subscriptions)")}
+        with self.db:
+            for column, definition in MIGRATIONS.items():
+                if column not in columns:
+                    self.db.execute(f"ALTER TABLE subscriptions ADD COLUMN {column} {definition}")
+        self.history = {row[0]: row[1:] for row in self.db.execute(
+            "SELECT url, passes, next_due, traffic_used, traffic_at FROM subscriptions")}
+        self.deferred = [url for (url,) in self.db.execute(
+            "SELECT url FROM subscriptions WHERE deferred IS NOT NULL ORDER BY deferred, url")]
+        self.channel_yields = dict(self.db.execute("SELECT channel, yield FROM channels"))
+        logger.info(f"已打开订阅状态库 {self.path}: {len(self.history)} 个 URL")
+        return len(self.history)
+
+    def close(self):
+        if self.db is not None:
+            self.flush()
+            self.db.close()
+            self.db = None
+
+    def sync_config(self, config):
+        """
+        以 config.yaml 中的列表更新各 URL 的分类与位置：手动添加的链接（包括状态库已有记录、之前被移出列表的）
+        重新加入列表，手动删除的链接移出列表（保留历史记录），返回 (加入数, 移出数)。
+        config.yaml 中没有任何订阅（文件不存在或为空）时保留状态库中的列表
+        """
+        lists = {category: [url.strip() for url in config.get(category) or [] if isinstance(url, str) and url.strip()]
+                 for category in CATEGORIES}
+        lists[PLAY] = [entry.strip() for entry in config.get(PLAY) or [] if play_url(entry)]
+        urls = {url for category in CATEGORIES for url in lists[category]}
+        urls.update(play_url(entry) for entry in lists[PLAY])
+        if not urls:
+            return 0, 0
+        listed = {url for (url,) in self.db.execute(
+            "SELECT url FROM subscriptions WHERE category IS NOT NULL OR play IS NOT NULL")}
+        self.set_lists(lists)
+        return len(urls - listed), len(listed - urls)
+
+    # -------------------------------
+    # 批量写入
+    # -------------------------------
+    def seen(self, urls):
+        """记录本次运行发现的 URL（已有记录的保持首次发现时间不变）"""
+        now = time.time()
+        self.pending_seen.extend((url, now) for url in urls)
+
+    def record(self, url, ok, latency=None, content_hash=None, passes=0, next_due=None, traffic_used=None):
+        """记录一次订阅检查结果：通过时清零连续失败次数，失败时加一；passes / next_due / traffic_used 见 recheck.next_check"""
+        now = time.time()
+        self.pending_checks.append({"url": url, "now": now, "ok": now if ok else None, "failed": 0 if ok else 1,
+                                    "latency": latency, "hash": content_hash, "passes": passes,
+                                    "next_due": next_due, "used": traffic_used,
+                                    "used_at": now if traffic_used is not None else None})
+
+    def flush(self):
+        """在一个事务中写入暂存的记录"""
+        if not self.pending_seen and not self.pending_checks:
+            return
+        with self.db:
+            self.db.executemany(UPSERT_SEEN, self.pending_seen)
+            self.db.executemany(UPSERT_CHECK, self.pending_checks)
+        self.flushed += len(self.pending_checks)
+        self.pending_seen, self.pending_checks = [], []
+
+    def set_deferred(self, urls):
+        """以本次运行推迟检查的新链接替换上次的记录（没有推迟时清空）"""
+        now = time.time()
+        with self.db:
+            self.db.execute("UPDATE subscriptions SET deferred = NULL WHERE deferred IS NOT NULL")
+            self.db.executemany(UPSERT_SEEN, [(url, now) for url in urls])
+            self.db.executemany("UPDATE subscriptions SET deferred = ? WHERE url = ?", [(now, url) for url in urls])
+
+    def record_probes(self, summaries):
+        """记录本次节点连通性探测结果 {url: prober.summarize 的汇总}"""
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "UPDATE subscriptions SET probe_nodes = ?, probe_reachable = ?, probe_latency = ?, probed_at = ? "
+                "WHERE url = ?",
+                [(summary["probed"], summary["reachable"], summary["latency"], now, url)
+                 for url, summary in summaries.items()])
+
+    def record_channel_yields(self, counts):
+        """记录本次抓取完成的各频道产出的有效订阅数 {频道 id: 数量}"""
+        rows = []
+        for channel, count in counts.items():
+            previous = self.channel_yields.get(channel)
+            value = count if previous is None else CHANNEL_YIELD_DECAY * previous + (1 - CHANNEL_YIELD_DECAY) * count
+            self.channel_yields[channel] = value
+            rows.append((channel, value))
+        with self.db:
+            self.db.executemany("INSERT INTO channels (channel, yield, runs) VALUES (?, ?, 1) "
+                                "ON CONFLICT(channel) DO UPDATE SET yield = excluded.yield, runs = runs + 1", rows)
+
+    def set_lists(self, config):
+        """以最终列表更新所有 URL 的分类与位置（不在列表中的 URL 保留历史记录，分类置空）"""
+        now = time.time()
+        categories = [(url, category, position, now)
+                      for category in CATEGORIES for position, url in enumerate(config.get(category, []))]
+        plays = [(play_url(entry), entry, position, now)
+                 for position, entry in enumerate(config.get(PLAY, [])) if play_url(entry)]
+        with self.db:
+            self.db.execute("UPDATE subscriptions SET category = NULL, position = NULL, "
+                            "play = NULL, play_position = NULL")
+            self.db.executemany(UPSERT_CATEGORY, categories)
+            self.db.executemany(UPSERT_PLAY, plays)
+
+    # -------------------------------
+    # 导出与统计
+    # -------------------------------
+    def export(self, tgchannel=()):
+        """按 config.yaml 的结构导出当前列表"""
+        config = {category: [] for category in CATEGORIES}
+        for url, category in self.db.execute(
+                "SELECT url, category FROM subscriptions WHERE category IS NOT NULL ORDER BY position, url"):
+            config.setdefault(category, []).append(url)
+        config[PLAY] = [entry for (entry,) in self.db.execute(
+            "SELECT play FROM subscriptions WHERE play IS NOT NULL ORDER BY play_position, play")]
+        config["tgchannel"] = list(tgchannel)
+        return config
+
+    def report(self):
+        total, listed, failing = self.db.execute(
+            "SELECT COUNT(*), COUNT(category), SUM(failures >= 3) FROM subscriptions").fetchone()
+        logger.info(f"🗃️ 订阅状态库: 记录 {total} 个 URL, 当前列表中 {listed} 个, "
+                    f"连续失败 3 次以上 {failing or 0} 个, 本次写入检查结果 {self.flushed} 条")
@@ -0,0 +1,92 @@
+import os
+import json
+import time
+from loguru import logger
+
+# 条件请求缓存：按订阅 URL 记录 ETag / Last-Modified / 内容哈希 / 分类结果，
+# 跨 cron 运行复用，命中 304 时直接沿用上次的分类结果。
+# 内容哈希只覆盖实际读取的部分（流式识别在类型确定后即停止下载），complete 表示是否读完整个响应体；
+# 节点索引记录仍在有效期内而提前停止时沿用上次完整读取的哈希（complete 仍为真）
+SUB_CACHE_PATH = 'cache/sub_cache.json'
+SUB_CACHE_MAX_AGE = 7 * 24 * 3600  # 超过 7 天未访问的条目在保存时清理
+
+
+class SubscriptionCache:
+    """订阅 HTTP 缓存（JSON 文件持久化）"""
+
+    def __init__(self, path=SUB_CACHE_PATH, max_age=SUB_CACHE_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.entries = {}
+        self.not_modified = 0   # 304 命中次数
+
+    def load(self):
+        """读取缓存文件，文件不存在或损坏时从空缓存开始"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+            logger.info(f"已加载订阅缓存 {len(self.entries)} 条")
+        except Exception as e:
+            logger.warning(f"读取订阅缓存 {self.path} 失败: {e}")
+            self.entries = {}
+
+    def save(self):
+        """清理过期条目并写回缓存文件"""
+        now = time.time()
+        self.entries = {url: entry for url, entry in self.entries.items()
+                        if now - entry.get("checked_at", 0) < self.max_age}
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, separators=(',', ':'))
+        logger.info(f"订阅缓存已保存 {len(self.entries)} 条 "
+                    f"(304 命中 {self.not_modified} 次)")
+
+    def get(self, url):
+        return self.entries.get(url)
+
+    def conditional_headers(self, url):
+        """根据已缓存的校验信息生成 If-None-Match / If-Modified-Since 请求头"""
+        entry = self.entries.get(url)
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers['If-None-Match'] = entry["etag"]
+            if entry.get("last_modified"):
+                headers['If-Modified-Since'] = entry["last_modified"]
+        return headers
+
+    def touch(self, url, userinfo=None):
+        """304 命中：刷新访问时间；响应带有 subscription-userinfo 时更新流量信息"""
+        self.not_modified += 1
+        entry = self.entries[url]
+        entry["checked_at"] = time.time()
+        if userinfo:
+            entry["userinfo"] = userinfo
+            entry["userinfo_at"] = entry["checked_at"]
+
+    def userinfo_fresh(self, url):
+        """缓存的流量信息是否来自最近一次请求的响应（304 未带流量信息时为 False）"""
+        entry = self.entries.get(url)
+        return bool(entry) and entry.get("userinfo_at") == entry["checked_at"]
+
+    def retain(self, url):
+        """本次运行沿用缓存结果（未发起请求）：刷新访问时间，避免条目过期"""
+        self.entries[url]["checked_at"] = time.time()
+
+    def store(self, url, response_headers, content_hash, content, complete=True):
+        """记录一次下载后的校验信息与内容分类结果"""
+        now = time.time()
+        self.entries[url] = {
+            "etag": response_headers.get('ETag'),
+            "last_modified": response_headers.get('Last-Modified'),
+            "userinfo": response_headers.get('subscription-userinfo'),
+            "userinfo_at": now,
+            "hash": content_hash,
+            "complete": complete,
+            "content": content,
+            "checked_at": now,
+        }
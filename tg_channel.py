@@ -0,0 +1,97 @@
+import os
+import re
+import json
+from html import unescape
+from datetime import datetime
+from loguru import logger
+
+# Telegram 频道网页 (t.me/s/<频道>) 解析与增量抓取游标。
+# 链接只从消息正文块 (tgme_widget_message_text) 中提取，页面中的样式表、头像、链接预览图等不会进入订阅检查
+TG_CURSOR_PATH = 'cache/tg_cursor.json'
+RE_URL = re.compile(r"https?://[-A-Za-z0-9+&@#/%?=~_|!:,.;]+[-A-Za-z0-9+&@#/%=~_|]")
+RE_MESSAGE_ID = re.compile(r'data-post="[^"]+/(\d+)"')
+TEXT_BLOCK = 'class="tgme_widget_message_text'
+TIME_ATTR = '<time datetime="'
+
+
+def filter_channel_urls(content):
+    """提取所有 URL，并排除包含“//t.me/”或“cdn-telegram.org”的链接"""
+    return [u for u in RE_URL.findall(content) if "//t.me/" not in u and "cdn-telegram.org" not in u]
+
+
+def message_links(content, start, end):
+    """
+    content[start:end] 范围内消息正文块中的链接（按出现顺序去重）：<a href> 的地址与正文文本中的 URL。
+    URL 的字符集不含引号与尖括号，因此直接在正文块的 HTML 上匹配即可，只需还原 &amp; 等实体；
+    没有正文块时返回空列表
+    """
+    start = content.find(TEXT_BLOCK, start, end)
+    if start < 0:
+        return []
+    start = content.find('>', start, end) + 1
+    block_end = content.find('</div>', start, end)
+    urls = filter_channel_urls(content[start:block_end if block_end >= 0 else end])
+    return list(dict.fromkeys(unescape(url) if '&' in url else url for url in urls))
+
+
+def message_time(content, start, end):
+    """content[start:end] 范围内消息的发布时间（<time datetime> 属性，Unix 时间戳），缺失或无法解析时返回 None"""
+    start = content.find(TIME_ATTR, start, end)
+    if start < 0:
+        return None
+    start += len(TIME_ATTR)
+    try:
+        return datetime.fromisoformat(content[start:content.find('"', start, end)]).timestamp()
+    except ValueError:
+        return None
+
+
+def parse_messages(content):
+    """
+    按消息解析频道页面，返回 [(消息 id, 发布时间戳, [链接])]，包括没有链接的消息（用于翻页与推进游标）。
+    整页只按 data-post 扫描一遍定位各条消息，之后只在每条消息的范围内查找正文块与发布时间，不复制页面片段
+    """
+    marks = [(match.start(), int(match.group(1))) for match in RE_MESSAGE_ID.finditer(content)]
+    marks.append((len(content), None))
+    return [(message_id, message_time(content, start, end), message_links(content, start, end))
+            for (start, message_id), (end, _) in zip(marks, marks[1:])]
+
+
+def channel_key(channel_url):
+    """频道游标的键：频道 id（去掉 ?before= 等参数）"""
+    return channel_url.split('?')[0].rstrip('/').split('/')[-1]
+
+
+class ChannelCursor:
+    """每个频道已处理到的最新消息 id（JSON 文件持久化），下次运行只处理更新的消息"""
+
+    def __init__(self, path=TG_CURSOR_PATH):
+        self.path = path
+        self.last_ids = {}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.last_ids = json.load(f)
+            logger.info(f"已加载 {len(self.last_ids)} 个频道的消息游标")
+        except Exception as e:
+            logger.warning(f"读取频道游标 {self.path} 失败: {e}")
+            self.last_ids = {}
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.last_ids, f, ensure_ascii=False, indent=0, sort_keys=True)
+
+    def get(self, channel_url):
+        """返回频道上次处理到的消息 id，没有记录时返回 None"""
+        return self.last_ids.get(channel_key(channel_url))
+
+    def update(self, channel_url, message_id):
+        key = channel_key(channel_url)
+        if message_id > self.last_ids.get(key, 0):
+            self.last_ids[key] = message_id